@@ -0,0 +1,149 @@
+import math, re
+from bisect import bisect_left, bisect_right, insort
+
+BELOW = '<' # salta cuando el precio cae por debajo del umbral
+ABOVE = '>' # salta cuando el precio sube por encima del umbral
+CROSS = 'x' # salta cuando la SMA corta cruza la SMA larga
+
+def parse_cross(limit_value):
+    """Parse a SMA crossover alert limit such as 'x9/20'.
+
+    Args:
+        limit_value: The alert limit value.
+
+    Returns:
+        tuple: (short_period, long_period), or None if it is not a valid crossover limit.
+    """
+    match = re.fullmatch(r'x(\d+)/(\d+)', limit_value)
+    if not match or not 0 < int(match[1]) < int(match[2]):
+        return None
+    return int(match[1]), int(match[2])
+
+def parse_limit(limit_value):
+    """Parse an alert limit value into a typed direction and threshold.
+
+    Args:
+        limit_value: The alert limit value, e.g. '<1.5', '>20' or 'x9/20'.
+
+    Returns:
+        tuple: (direction, threshold), threshold is None for crossover alerts.
+
+    Raises:
+        ValueError: If the limit value is not valid, including 'nan' and 'inf' thresholds.
+    """
+    if limit_value[:1] in (BELOW, ABOVE):
+        try:
+            threshold = float(limit_value[1:])
+        except ValueError:
+            threshold = math.nan
+        # un umbral NaN rompe el orden de AlertIndex y sus busquedas por biseccion
+        if math.isfinite(threshold):
+            return limit_value[0], threshold
+    elif parse_cross(limit_value):
+        return CROSS, None
+    raise ValueError(f"Invalid limit value: {limit_value}")
+
+class AlertIndex:
+    """In-memory index of price alerts with sorted thresholds per ticker.
+
+    A new price finds every alert it triggers by bisection, so checking a ticker
+    costs one lookup no matter how many alerts it has.
+    """
+
+    def __init__(self):
+        self._below = {} # ticker -> lista ordenada de (umbral, id)
+        self._above = {}
+        self._alerts = {} # id -> (user_id, ticker, direction, threshold, limit_value)
+
+    def load(self, rows):
+        """Rebuild the index from alert rows.
+
+        Args:
+            rows: Iterable of (id, user_id, ticker, direction, threshold, limit_value) rows.
+        """
+        self._below.clear()
+        self._above.clear()
+        self._alerts.clear()
+        for row in rows:
+            self.add(*row)
+
+    def add(self, id, user_id, ticker, direction, threshold, limit_value):
+        """Index a price alert, crossover alerts are ignored.
+
+        Args:
+            id: The alert ID.
+            user_id: The user's ID.
+            ticker: The stock ticker symbol.
+            direction: BELOW, ABOVE or CROSS.
+            threshold: The price threshold.
+            limit_value: The limit value as entered by the user.
+        """
+        if direction not in (BELOW, ABOVE):
+            return
+        side = self._below if direction == BELOW else self._above
+        insort(side.setdefault(ticker, []), (threshold, id))
+        self._alerts[id] = (user_id, ticker, direction, threshold, limit_value)
+
+    def remove(self, id):
+        """Remove an alert from the index.
+
+        Args:
+            id: The alert ID.
+        """
+        alert = self._alerts.pop(id, None)
+        if alert is None:
+            return
+        user_id, ticker, direction, threshold, limit_value = alert
+        side = self._below if direction == BELOW else self._above
+        entries = side[ticker]
+        entries.pop(bisect_left(entries, (threshold, id)))
+        if not entries:
+            del side[ticker]
+
+    def remove_user_ticker(self, user_id, ticker):
+        """Remove every alert a user has on a ticker.
+
+        Args:
+            user_id: The user's ID.
+            ticker: The stock ticker symbol.
+        """
+        for id in [id for id, alert in self._alerts.items() if alert[0] == user_id and alert[1] == ticker]:
+            self.remove(id)
+
+    def get(self, id):
+        """Get an indexed alert.
+
+        Args:
+            id: The alert ID.
+
+        Returns:
+            tuple: (user_id, ticker, direction, threshold, limit_value), or None if not indexed.
+        """
+        return self._alerts.get(id)
+
+    def tickers(self):
+        """Get the tickers with at least one price alert.
+
+        Returns:
+            set: Stock ticker symbols.
+        """
+        return set(self._below) | set(self._above)
+
+    def triggered(self, ticker, price):
+        """Find the alerts a new price triggers.
+
+        Args:
+            ticker: The stock ticker symbol.
+            price: The new price.
+
+        Returns:
+            list: IDs of the triggered alerts.
+        """
+        below = self._below.get(ticker, [])
+        above = self._above.get(ticker, [])
+        # umbrales por encima del precio para '<' y por debajo para '>'
+        return [id for _, id in below[bisect_right(below, (price, float('inf'))):]] + \
+               [id for _, id in above[:bisect_left(above, (price, float('-inf')))]]
+
+    def __len__(self):
+        return len(self._alerts)
@@ -0,0 +1,150 @@
+import asyncio, datetime, itertools, threading, time, zlib
+from collections import Counter
+from types import SimpleNamespace
+
+HISTORY_YEARS = 5 # años de barras diarias generadas por ticker
+
+class FakeProvider:
+    """Deterministic offline replacement of providers.YahooProvider.
+
+    Every ticker gets a random walk of daily bars seeded by its name, so runs are
+    reproducible, and every call is counted as an upstream request.
+    """
+
+    def __init__(self, latency=0, years=HISTORY_YEARS):
+        """Create the provider.
+
+        Args:
+            latency: Seconds each call sleeps, to simulate the network round trip.
+            years: Years of daily bars generated per ticker.
+        """
+        self.latency = latency
+        self.years = years
+        self.calls = Counter() # llamadas por metodo
+        self.symbols = Counter() # tickers pedidos por metodo
+        self._bars = {}
+        self._lock = threading.Lock()
+
+    def _count(self, method, tickers):
+        with self._lock:
+            self.calls[method] += 1
+            self.symbols[method] += len(tickers)
+        if self.latency:
+            time.sleep(self.latency)
+
+    def bars(self, ticker):
+        """Get every generated bar of a ticker.
+
+        Args:
+            ticker: The stock ticker symbol.
+
+        Returns:
+            DataFrame: Open, High, Low, Close, Volume, Dividends and Stock Splits columns indexed by date.
+        """
+        with self._lock:
+            if ticker in self._bars:
+                return self._bars[ticker]
+        import numpy as np
+        import pandas as pd
+        rng = np.random.default_rng(zlib.crc32(ticker.encode()))
+        dates = pd.bdate_range(end=datetime.date.today(), periods=self.years*252, name='Date')
+        close = rng.uniform(5, 500)*np.exp(np.cumsum(rng.normal(0.0003, 0.02, len(dates))))
+        open = close*(1+rng.normal(0, 0.005, len(dates)))
+        high = np.maximum(open, close)*(1+np.abs(rng.normal(0, 0.01, len(dates))))
+        low = np.minimum(open, close)*(1-np.abs(rng.normal(0, 0.01, len(dates))))
+        data = pd.DataFrame({'Open': open, 'High': high, 'Low': low, 'Close': close,
+                             'Volume': rng.integers(10**5, 10**7, len(dates)).astype(float),
+                             'Dividends': 0.0, 'Stock Splits': 0.0}, index=dates)
+        with self._lock:
+            return self._bars.setdefault(ticker, data)
+
+    def quotes(self, tickers):
+        self._count('quotes', tickers)
+        quotes = {}
+        for ticker in tickers:
+            last = self.bars(ticker).iloc[-1]
+            quotes[ticker] = {'regularMarketPrice': float(last['Close']), 'open': float(last['Open']),
+                              'dayLow': float(last['Low']), 'dayHigh': float(last['High'])}
+        return quotes
+
+    def info(self, tickers):
+        self._count('info', tickers)
+        return {ticker: {'longName': f'{ticker.upper()} Inc.', 'currency': 'USD', 'exchange': 'NMS', 'timezone': 'America/New_York'}
+                for ticker in tickers}
+
+    def history(self, ticker, start=None):
+        import pandas as pd
+        self._count('history', [ticker])
+        data = self.bars(ticker)
+        if start is not None:
+            data = data[data.index >= pd.Timestamp(start)]
+        return data.copy()
+
+class FakeBot:
+    """Recording stand-in for AsyncTeleBot that answers instantly.
+
+    Only the methods the bot uses to reply are implemented, each call is counted
+    and returns a message with the fields the bot reads back.
+    """
+
+    def __init__(self, latency=0):
+        """Create the bot.
+
+        Args:
+            latency: Seconds each call waits, to simulate the Telegram round trip.
+        """
+        self.latency = latency
+        self.calls = Counter()
+        self.uploads = 0 # fotos enviadas como bytes en vez de file_id
+        self._ids = itertools.count(1)
+
+    async def _record(self, method, chat_id, photo=None):
+        self.calls[method] += 1
+        if self.latency:
+            await asyncio.sleep(self.latency)
+        message_id = next(self._ids)
+        sizes = []
+        if photo is not None:
+            if isinstance(photo, bytes):
+                self.uploads += 1
+                photo = f'file-{message_id}'
+            sizes = [SimpleNamespace(file_id=photo)]
+        return SimpleNamespace(message_id=message_id, chat=SimpleNamespace(id=chat_id), photo=sizes)
+
+    async def reply_to(self, message, text, **kwargs):
+        return await self._record('reply_to', message.chat.id)
+
+    async def send_message(self, chat_id, text, **kwargs):
+        return await self._record('send_message', chat_id)
+
+    async def send_photo(self, chat_id, photo, **kwargs):
+        return await self._record('send_photo', chat_id, photo)
+
+def message(user_id, text):
+    """Build a private chat message as the handlers receive it.
+
+    Args:
+        user_id: The sender's ID, also used as chat ID.
+        text: The message text, e.g. '/price AAPL'.
+
+    Returns:
+        SimpleNamespace: Message with from_user, chat and text.
+    """
+    return SimpleNamespace(from_user=SimpleNamespace(id=user_id), chat=SimpleNamespace(id=user_id), text=text)
+
+def update(user_id, text, update_id=1):
+    """Build the JSON of a private chat message update as Telegram sends it.
+
+    Args:
+        user_id: The sender's ID, also used as chat ID.
+        text: The message text, e.g. '/start'.
+        update_id: The update ID.
+
+    Returns:
+        dict: The update, ready for telebot.types.Update.de_json.
+    """
+    entities = [{'type': 'bot_command', 'offset': 0, 'length': len(text.split()[0])}] if text.startswith('/') else []
+    return {'update_id': update_id,
+            'message': {'message_id': update_id, 'date': int(time.time()), 'text': text, 'entities': entities,
+                        'from': {'id': user_id, 'is_bot': False, 'first_name': 'Bench'},
+                        'chat': {'id': user_id, 'type': 'private', 'first_name': 'Bench'}}}
@@ -0,0 +1,168 @@
+"""Offline benchmark of the bot with fake market data and a fake Telegram bot.
+
+Fills a temporary bot.db with users, tickers, alerts and tracks, then times the
+alert and track cycles and the /price, /graph and /sma handlers. Nothing goes to
+the network, so runs are reproducible and can be compared between commits:
+
+    python bench/run_bench.py --users 50 --tickers 200 --alerts 2000 --tracks 500 --out before.json
+"""
+import argparse, asyncio, datetime, json, os, random, resource, statistics, sys, tempfile, time, tracemalloc
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+import fakes
+
+HANDLER_USER = 201580722 # usuario autorizado por is_valid_user
+
+def parse_args():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--users', type=int, default=50, help='users owning the alerts and tracks')
+    parser.add_argument('--tickers', type=int, default=200, help='distinct tickers')
+    parser.add_argument('--alerts', type=int, default=2000, help='price alerts')
+    parser.add_argument('--cross-alerts', type=int, default=200, help='SMA crossover alerts')
+    parser.add_argument('--tracks', type=int, default=500, help='tracks')
+    parser.add_argument('--requests', type=int, default=30, help='requests per handler')
+    parser.add_argument('--upstream-latency', type=float, default=0, help='seconds each fake yfinance call sleeps')
+    parser.add_argument('--telegram-latency', type=float, default=0, help='seconds each fake Telegram call waits')
+    parser.add_argument('--tracemalloc', action='store_true', help='also report the traced Python heap peak, slows every timing down')
+    parser.add_argument('--at', default='2026-10-14T15:00:00+00:00',
+                        help='time seen by the market calendar, the default is a weekday with the US and European markets open')
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--out', help='write the JSON results to this file instead of stdout')
+    return parser.parse_args()
+
+def populate(con, args, provider, rng):
+    """Insert the generated users, alerts and tracks.
+
+    Price alert thresholds are spread around the last price, so a cycle triggers
+    a realistic fraction of them.
+    """
+    tickers = [f'T{i:04d}' for i in range(args.tickers)]
+    users = [1000+i for i in range(args.users)]
+    alertas = []
+    for _ in range(args.alerts):
+        ticker = rng.choice(tickers)
+        price = float(provider.bars(ticker)['Close'].iloc[-1])
+        direction = rng.choice('<>')
+        threshold = round(price*rng.uniform(0.8, 1.2), 2)
+        alertas.append((rng.choice(users), ticker, f'{direction}{threshold}', direction, threshold))
+    for _ in range(args.cross_alerts):
+        short_period = rng.choice([5, 9, 12])
+        alertas.append((rng.choice(users), rng.choice(tickers), f'x{short_period}/{short_period*2+rng.choice([0, 6])}', 'x', None))
+    seguimientos = [(rng.choice(users), rng.choice(tickers), rng.choice([0, 0, round(rng.uniform(10, 300), 2)]), rng.choice([4, 12, 24]))
+                    for _ in range(args.tracks)]
+    with con:
+        con.executemany("INSERT INTO alerts (user_id, ticker, limit_value, direction, threshold) VALUES (?, ?, ?, ?, ?);", alertas)
+        con.executemany("INSERT INTO tracks (user_id, ticker, buy_price, update_interval) VALUES (?, ?, ?, ?);", seguimientos)
+    return tickers
+
+def summary(samples):
+    """Latency percentiles in milliseconds."""
+    samples = sorted(samples)
+    def percentile(p):
+        return samples[min(len(samples)-1, int(round(p/100*(len(samples)-1))))]*1000
+    return {'count': len(samples), 'mean_ms': statistics.fmean(samples)*1000, 'p50_ms': percentile(50),
+            'p95_ms': percentile(95), 'max_ms': samples[-1]*1000}
+
+async def timed(coro):
+    start = time.perf_counter()
+    await coro
+    return time.perf_counter()-start
+
+async def run(args, bot, fake_provider, fake_bot, tickers, rng):
+    import feeds, quotes
+    await bot.load_alert_index()
+    await bot.load_schedules()
+    await bot.chart_files.load()
+    await bot.charts.warm_up() # como en main(), arrancar los procesos de render no cuenta en el primer ciclo
+    bot.outbox.start()
+    results = {'cycles': {}, 'handlers': {}}
+
+    async def price_alert_cycle():
+        # lo mismo que hace el feed de polling: una consulta masiva y un tick por ticker
+        subscribed = sorted(bot.alert_index.tickers())
+        precios = await quotes.get_quotes(subscribed)
+        ahora = time.time()
+        for ticker in subscribed:
+            if ticker in precios:
+                await bot.check_tick(feeds.Tick(ticker, precios[ticker]['regularMarketPrice'], ahora))
+        await bot.outbox.join()
+
+    async def cross_alert_cycle():
+        rows = await bot.database.fetchall("SELECT DISTINCT ticker FROM alerts WHERE direction=?;", ('x',))
+        await bot.comprueba_cruces([row['ticker'] for row in rows])
+        await bot.outbox.join()
+
+    async def track_cycle():
+        ids = [row['id'] for row in await bot.database.fetchall("SELECT id FROM tracks;")]
+        await bot.update_tracks_ciclo(forzado=False, ids=ids)
+        await bot.outbox.join()
+
+    for name, cycle in [('price_alerts', price_alert_cycle), ('cross_alerts', cross_alert_cycle), ('tracks', track_cycle)]:
+        upstream = sum(fake_provider.calls.values())
+        cold = await timed(cycle())
+        warm = await timed(cycle())
+        results['cycles'][name] = {'cold_s': cold, 'warm_s': warm, 'upstream_calls': sum(fake_provider.calls.values())-upstream}
+
+    # los handlers empiezan con cachés frías para que cuenten descargas y renders
+    quotes.cache = quotes.QuoteCache()
+    bot.charts.cache = bot.charts.ChartCache()
+    for command, handler in [('price', bot.send_price), ('graph', bot.send_graph), ('sma', bot.send_sma)]:
+        latencies = []
+        upstream = sum(fake_provider.calls.values())
+        for _ in range(args.requests):
+            message = fakes.message(HANDLER_USER, f'/{command} {rng.choice(tickers)}')
+            latencies.append(await timed(handler(message)))
+        results['handlers'][command] = dict(summary(latencies), upstream_calls=sum(fake_provider.calls.values())-upstream)
+
+    await bot.outbox.stop()
+    return results
+
+def main():
+    args = parse_args()
+    rng = random.Random(args.seed)
+    out = os.path.abspath(args.out) if args.out else None
+    workdir = tempfile.mkdtemp(prefix='finanzasbot-bench-')
+    os.chdir(workdir) # bot.db e history.db se crean en el directorio de trabajo
+    os.environ.setdefault('KEY_TELEGRAM', '0:bench')
+    os.environ['QUOTE_FEED'] = 'poll'
+
+    if args.tracemalloc:
+        tracemalloc.start()
+    import providers, sender, executors, market_hours
+    import finanzasbot
+    at = datetime.datetime.fromisoformat(args.at).timestamp()
+    market_hours.clock = lambda: at # las ejecuciones no dependen de la hora a la que se lancen
+    fake_provider = fakes.FakeProvider(latency=args.upstream_latency)
+    providers.set_provider(fake_provider)
+    fake_bot = fakes.FakeBot(latency=args.telegram_latency)
+    finanzasbot.bot = fake_bot
+    finanzasbot.outbox = sender.SendQueue(fake_bot, workers=8, global_rate=10**6, chat_rate=10**6)
+
+    finanzasbot.init_db()
+    tickers = finanzasbot.database.call(populate, args, fake_provider, rng)
+    start = time.perf_counter()
+    try:
+        results = asyncio.run(run(args, finanzasbot, fake_provider, fake_bot, tickers, rng))
+    finally:
+        executors.shutdown()
+        finanzasbot.database.close()
+    results.update({
+        'params': {key: value for key, value in vars(args).items() if key != 'out'},
+        'total_s': time.perf_counter()-start,
+        'upstream': {'calls': dict(fake_provider.calls), 'tickers': dict(fake_provider.symbols)},
+        'telegram': {'calls': dict(fake_bot.calls), 'photo_uploads': fake_bot.uploads},
+        # memoria del proceso principal, los procesos de render no cuentan
+        'memory': {'max_rss_mb': resource.getrusage(resource.RUSAGE_SELF).ru_maxrss/1024},
+    })
+    if args.tracemalloc:
+        results['memory']['tracemalloc_peak_mb'] = tracemalloc.get_traced_memory()[1]/2**20
+    output = json.dumps(results, indent=2, sort_keys=True)
+    if out:
+        with open(out, 'w') as f:
+            f.write(output+'\n')
+    else:
+        print(output)
+
+if __name__ == '__main__':
+    main()
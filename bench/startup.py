@@ -0,0 +1,64 @@
+"""Cold start benchmark: time from launching the interpreter until /start is answered.
+
+Each run is a fresh process that imports the bot, opens its database and
+dispatches a recorded /start update through the real handlers, with a fake
+reply instead of a Telegram call:
+
+    python bench/startup.py --runs 5 --out startup.json
+"""
+import argparse, json, os, statistics, subprocess, sys, tempfile, time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+HEAVY_MODULES = ('yfinance', 'pandas', 'matplotlib', 'numpy')
+
+CHILD = r'''
+import asyncio, json, os, sys, time
+imported = time.time()
+import finanzasbot, fakes
+from telebot.types import Update
+imported = time.time()-imported
+
+async def start():
+    await finanzasbot.load_alert_index()
+    await finanzasbot.load_schedules()
+    await finanzasbot.chart_files.load()
+    fake = fakes.FakeBot()
+    finanzasbot.bot.reply_to = fake.reply_to
+    await finanzasbot.bot.process_new_updates([Update.de_json(fakes.update(201580722, '/start'))])
+    return fake.calls['reply_to']
+
+finanzasbot.init_db()
+answered = asyncio.run(start())
+elapsed = time.time()-float(os.environ['BENCH_T0'])
+finanzasbot.database.close()
+print(json.dumps({'answered': answered, 'start_s': elapsed, 'import_s': imported,
+                  'loaded': [module for module in sys.argv[1:] if module in sys.modules]}))
+'''
+
+def run_once(workdir):
+    env = dict(os.environ, BENCH_T0=repr(time.time()), KEY_TELEGRAM=os.getenv('KEY_TELEGRAM', '0:bench'),
+               PYTHONPATH=os.pathsep.join([ROOT, os.path.join(ROOT, 'bench')]))
+    output = subprocess.run([sys.executable, '-c', CHILD, *HEAVY_MODULES], cwd=workdir, env=env,
+                            capture_output=True, text=True, check=True).stdout
+    return json.loads(output.splitlines()[-1])
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--runs', type=int, default=5)
+    parser.add_argument('--out', help='write the JSON results to this file instead of stdout')
+    args = parser.parse_args()
+    workdir = tempfile.mkdtemp(prefix='finanzasbot-startup-')
+    runs = [run_once(workdir) for _ in range(args.runs)]
+    results = {'runs': runs}
+    for key in ('start_s', 'import_s'):
+        values = [run[key] for run in runs]
+        results[key] = {'min': min(values), 'median': statistics.median(values), 'max': max(values)}
+    output = json.dumps(results, indent=2, sort_keys=True)
+    if args.out:
+        with open(args.out, 'w') as f:
+            f.write(output+'\n')
+    else:
+        print(output)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,112 @@
+"""Webhook load test: posts recorded updates to a local WebhookServer.
+
+The bot runs in this same process with the fake market data provider, and its
+replies go to a fake Telegram bot. The updates come from a JSON lines file, one
+Telegram update per line, or are generated as a mix of /start, /price, /graph
+and /sma commands:
+
+    python bench/webhook_load.py --updates 500 --concurrency 50 --out webhook.json
+"""
+import argparse, asyncio, json, os, random, statistics, sys, tempfile, time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+import fakes
+
+HANDLER_USER = 201580722 # usuario autorizado por is_valid_user
+COMMANDS = ['/start', '/price {}', '/price {}', '/graph {}', '/sma {}']
+
+def parse_args():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--file', help='JSON lines file of recorded updates, generated if not given')
+    parser.add_argument('--updates', type=int, default=500, help='updates generated when no file is given')
+    parser.add_argument('--tickers', type=int, default=20, help='distinct tickers of the generated updates')
+    parser.add_argument('--concurrency', type=int, default=50, help='requests in flight at once')
+    parser.add_argument('--workers', type=int, default=8, help='webhook workers')
+    parser.add_argument('--queue', type=int, default=1000, help='webhook queue size')
+    parser.add_argument('--port', type=int, default=8765)
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--out', help='write the JSON results to this file instead of stdout')
+    return parser.parse_args()
+
+def recorded_updates(args):
+    if args.file:
+        with open(args.file) as f:
+            return [json.loads(line) for line in f if line.strip()]
+    rng = random.Random(args.seed)
+    return [fakes.update(HANDLER_USER, rng.choice(COMMANDS).format(f'T{rng.randrange(args.tickers):04d}'), update_id)
+            for update_id in range(1, args.updates+1)]
+
+def summary(samples):
+    samples = sorted(samples)
+    def percentile(p):
+        return samples[min(len(samples)-1, int(round(p/100*(len(samples)-1))))]*1000
+    return {'count': len(samples), 'mean_ms': statistics.fmean(samples)*1000, 'p50_ms': percentile(50),
+            'p95_ms': percentile(95), 'max_ms': samples[-1]*1000}
+
+async def run(args, bot, server, updates):
+    from aiohttp import ClientSession
+    serving = asyncio.ensure_future(server.serve())
+    await asyncio.sleep(0.2)
+    url = f'http://127.0.0.1:{args.port}{server.path}'
+    acks, statuses = [], {}
+    limit = asyncio.Semaphore(args.concurrency)
+    async def post(session, update):
+        async with limit:
+            start = time.perf_counter()
+            async with session.post(url, json=update, headers={'X-Telegram-Bot-Api-Secret-Token': server.secret}) as response:
+                await response.read()
+            acks.append(time.perf_counter()-start)
+            statuses[response.status] = statuses.get(response.status, 0)+1
+    start = time.perf_counter()
+    async with ClientSession() as session:
+        await asyncio.gather(*(post(session, update) for update in updates))
+    posted = time.perf_counter()-start
+    await server.join()
+    await bot.outbox.join()
+    handled = time.perf_counter()-start
+    serving.cancel()
+    await asyncio.gather(serving, return_exceptions=True)
+    return {'ack': summary(acks), 'status': statuses, 'posted_s': posted, 'handled_s': handled,
+            'updates_per_s': len(updates)/handled}
+
+def main():
+    args = parse_args()
+    updates = recorded_updates(args)
+    out = os.path.abspath(args.out) if args.out else None
+    os.chdir(tempfile.mkdtemp(prefix='finanzasbot-webhook-')) # bot.db e history.db temporales
+    os.environ.setdefault('KEY_TELEGRAM', '0:bench')
+    import providers, executors, webhook
+    import finanzasbot
+    providers.set_provider(fakes.FakeProvider())
+    fake_bot = fakes.FakeBot()
+    # el bot real despacha las actualizaciones y solo sus llamadas a Telegram van al bot falso
+    for method in ('reply_to', 'send_message', 'send_photo'):
+        setattr(finanzasbot.bot, method, getattr(fake_bot, method))
+    server = webhook.WebhookServer(finanzasbot.bot, host='127.0.0.1', port=args.port, url=None, secret='bench',
+                                   workers=args.workers, queue_size=args.queue)
+    finanzasbot.init_db()
+    async def start():
+        await finanzasbot.chart_files.load()
+        await finanzasbot.charts.warm_up()
+        finanzasbot.outbox.start()
+        try:
+            return await run(args, finanzasbot, server, updates)
+        finally:
+            await finanzasbot.outbox.stop()
+    try:
+        results = asyncio.run(start())
+    finally:
+        executors.shutdown()
+        finanzasbot.database.close()
+    results.update({'params': {key: value for key, value in vars(args).items() if key != 'out'},
+                    'telegram': {'calls': dict(fake_bot.calls), 'photo_uploads': fake_bot.uploads}})
+    output = json.dumps(results, indent=2, sort_keys=True)
+    if out:
+        with open(out, 'w') as f:
+            f.write(output+'\n')
+    else:
+        print(output)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,174 @@
+from collections import OrderedDict
+import asyncio, io, math
+import executors, metrics
+
+CACHE_SIZE = 256 # graficos PNG guardados en memoria
+GRID_COLUMNS = 3 # columnas de los graficos de resumen
+
+def render_chart(dates, closes, title, overlays=(), buy_price=None):
+    """Render a closing price chart with the object oriented Figure API.
+
+    Runs in a worker process, so it only takes plain picklable values and never
+    touches pyplot's global state.
+
+    Args:
+        dates: List of datetimes for the x axis.
+        closes: List of closing prices.
+        title: The chart title.
+        overlays: Sequence of (label, values) lines drawn over the closes, e.g. moving averages.
+        buy_price: Optional buy price to display as a horizontal line.
+
+    Returns:
+        bytes: PNG image of the chart.
+    """
+    # matplotlib solo se importa en los procesos de render, nunca en el del bot
+    from matplotlib.figure import Figure
+    from matplotlib.backends.backend_agg import FigureCanvasAgg
+    fig = Figure(figsize=(12, 6))
+    FigureCanvasAgg(fig)
+    ax = fig.subplots()
+    ax.plot(dates, closes, label='Close')
+    for label, values in overlays:
+        ax.plot(dates, values, label=label)
+    ax.set_xlabel('Date')
+    ax.set_ylabel('Price')
+    ax.set_title(title)
+    if buy_price:
+        ax.axhline(y=buy_price, color='r', linestyle='--', label=f'Buy Price: {buy_price}')
+    ax.legend()
+    ax.grid(True)
+
+    buf = io.BytesIO()
+    fig.savefig(buf, format='png')
+    return buf.getvalue()
+
+def render_grid(panels, title):
+    """Render several closing price charts as small panels of one figure.
+
+    Runs in a worker process like render_chart.
+
+    Args:
+        panels: Sequence of (title, dates, closes, buy_price) tuples, buy_price may be None.
+        title: The figure title.
+
+    Returns:
+        bytes: PNG image of the grid.
+    """
+    from matplotlib.figure import Figure
+    from matplotlib.backends.backend_agg import FigureCanvasAgg
+    from matplotlib.dates import AutoDateLocator, ConciseDateFormatter
+    columns = min(GRID_COLUMNS, len(panels))
+    rows = math.ceil(len(panels)/columns)
+    fig = Figure(figsize=(5*columns, 3*rows+0.5), layout='constrained')
+    FigureCanvasAgg(fig)
+    axes = fig.subplots(rows, columns, squeeze=False).ravel()
+    for ax, (panel_title, dates, closes, buy_price) in zip(axes, panels):
+        ax.plot(dates, closes)
+        if buy_price:
+            ax.axhline(y=buy_price, color='r', linestyle='--')
+        ax.set_title(panel_title, fontsize='medium')
+        locator = AutoDateLocator(maxticks=5)
+        ax.xaxis.set_major_locator(locator)
+        ax.xaxis.set_major_formatter(ConciseDateFormatter(locator))
+        ax.tick_params(labelsize='small')
+        ax.grid(True)
+    for ax in axes[len(panels):]:
+        ax.set_visible(False)
+    fig.suptitle(title)
+
+    buf = io.BytesIO()
+    fig.savefig(buf, format='png')
+    return buf.getvalue()
+
+def _warm():
+    from matplotlib.figure import Figure
+    from matplotlib.backends.backend_agg import FigureCanvasAgg
+    return True
+
+async def warm_up():
+    """Start every render worker process ahead of the first chart request."""
+    await asyncio.gather(*(executors.run_cpu(_warm) for _ in range(executors.CPU_WORKERS)))
+
+class ChartCache:
+    """LRU cache of rendered PNGs keyed by the inputs that determine their content.
+
+    Concurrent requests for the same key share a single render.
+    """
+
+    def __init__(self, maxsize=CACHE_SIZE):
+        """Create an empty cache.
+
+        Args:
+            maxsize: Maximum number of PNGs kept before evicting the least recently used.
+        """
+        self.maxsize = maxsize
+        self._entries = OrderedDict()
+        self._inflight = {}
+
+    async def get(self, key, render, *args, **kwargs):
+        """Return the PNG for key, rendering it in the process pool on a miss.
+
+        Args:
+            key: Hashable key describing the chart content.
+            render: Picklable render callable.
+            *args: Positional arguments for render.
+            **kwargs: Keyword arguments for render.
+
+        Returns:
+            bytes: PNG image of the chart.
+        """
+        metrics.hit('chart', key in self._entries)
+        if key in self._entries:
+            self._entries.move_to_end(key)
+            return self._entries[key]
+        if key not in self._inflight:
+            self._inflight[key] = asyncio.ensure_future(executors.run_cpu(render, *args, **kwargs))
+        task = self._inflight[key]
+        try:
+            image_bytes = await asyncio.shield(task)
+        finally:
+            if task.done():
+                self._inflight.pop(key, None)
+        self._entries[key] = image_bytes
+        while len(self._entries) > self.maxsize:
+            self._entries.popitem(last=False)
+        return image_bytes
+
+cache = ChartCache()
+
+async def chart(ticker, period, data, title, overlays=(), buy_price=None):
+    """Get the PNG chart of a price history, reusing it while no new bar has arrived.
+
+    Args:
+        ticker: The stock ticker symbol.
+        period: The period the history covers, part of the cache key.
+        data: DataFrame of daily bars with a 'Close' column.
+        title: The chart title, part of the cache key.
+        overlays: Sequence of (label, values) lines drawn over the closes.
+        buy_price: Optional buy price to display as a horizontal line.
+
+    Returns:
+        bytes: PNG image of the chart.
+    """
+    closes = data['Close']
+    last_bar = (data.index[-1].isoformat(), float(closes.iloc[-1])) if len(data) else None
+    key = (ticker, period, title, tuple(label for label, _ in overlays), buy_price, last_bar) # el titulo cambia si falla el nombre
+    dates = data.index.to_pydatetime().tolist()
+    overlays = [(label, list(values)) for label, values in overlays]
+    return await cache.get(key, render_chart, dates, closes.tolist(), title, overlays, buy_price)
+
+async def grid(title, items, period):
+    """Get the PNG grid of several price histories, reusing it while no new bar has arrived.
+
+    Args:
+        title: The figure title.
+        items: Sequence of (ticker, data, buy_price) tuples, data is a DataFrame of daily bars.
+        period: The period the histories cover, part of the cache key.
+
+    Returns:
+        bytes: PNG image of the grid.
+    """
+    key = ('grid', title, period, tuple((ticker, buy_price, data.index[-1].isoformat(), float(data['Close'].iloc[-1])) for ticker, data, buy_price in items))
+    panels = [(ticker if not buy_price else f'{ticker} (buy {buy_price})', data.index.to_pydatetime().tolist(), data['Close'].tolist(), buy_price)
+              for ticker, data, buy_price in items]
+    return await cache.get(key, render_grid, panels, title)
@@ -0,0 +1,166 @@
+import asyncio, contextlib, functools, logging, sqlite3
+from concurrent.futures import ThreadPoolExecutor
+
+DB_PATH = 'bot.db'
+
+class Batch:
+    """Statements collected during a cycle and committed together in one transaction."""
+
+    def __init__(self):
+        self.statements = []
+
+    def execute(self, sql, params=()):
+        """Queue a parameterized statement.
+
+        Args:
+            sql: The SQL statement with ? placeholders.
+            params: The statement parameters.
+        """
+        self.statements.append((sql, params))
+
+    def __len__(self):
+        return len(self.statements)
+
+class Database:
+    """Data access layer over the bot SQLite database.
+
+    The connection runs in WAL mode and lives in a dedicated thread, so queries
+    never block the event loop and readers do not wait for writers. Statements
+    are always parameterized, which lets sqlite3 reuse its prepared statements.
+    """
+
+    def __init__(self, path=DB_PATH):
+        """Create the layer, the connection is opened on first use.
+
+        Args:
+            path: Path of the SQLite database file.
+        """
+        self.path = path
+        self.con = None
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='db')
+
+    def _connect(self):
+        con = sqlite3.connect(self.path, check_same_thread=False, cached_statements=256)
+        con.row_factory = sqlite3.Row
+        con.execute("PRAGMA journal_mode=WAL;")
+        con.execute("PRAGMA synchronous=NORMAL;") # suficiente con WAL, evita un fsync por commit
+        con.execute("PRAGMA busy_timeout=5000;")
+        return con
+
+    def _call(self, fn, *args):
+        if self.con is None:
+            self.con = self._connect()
+        return fn(self.con, *args)
+
+    def call(self, fn, *args):
+        """Run fn(connection, *args) in the database thread and wait for it, for use outside the event loop.
+
+        Args:
+            fn: Callable taking the connection as first argument.
+            *args: Extra arguments for fn.
+
+        Returns:
+            The value returned by fn.
+        """
+        return self._executor.submit(self._call, fn, *args).result()
+
+    def submit(self, fn, *args):
+        """Queue fn(connection, *args) in the database thread without waiting for it.
+
+        Calls run in the order they are queued, so a later query sees the change.
+        Errors are logged.
+
+        Args:
+            fn: Callable taking the connection as first argument.
+            *args: Extra arguments for fn.
+
+        Returns:
+            concurrent.futures.Future: Resolves to the value returned by fn.
+        """
+        future = self._executor.submit(self._call, fn, *args)
+        future.add_done_callback(lambda f: f.exception() and logging.error(f"Error in a queued database write: {f.exception()}"))
+        return future
+
+    async def run(self, fn, *args):
+        """Run fn(connection, *args) in the database thread.
+
+        Args:
+            fn: Callable taking the connection as first argument.
+            *args: Extra arguments for fn.
+
+        Returns:
+            The value returned by fn.
+        """
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self._executor, functools.partial(self._call, fn, *args))
+
+    async def fetchall(self, sql, params=()):
+        """Run a query and return all its rows.
+
+        Args:
+            sql: The SQL query with ? placeholders.
+            params: The query parameters.
+
+        Returns:
+            list: sqlite3.Row objects.
+        """
+        return await self.run(lambda con: con.execute(sql, params).fetchall())
+
+    async def fetchone(self, sql, params=()):
+        """Run a query and return its first row.
+
+        Args:
+            sql: The SQL query with ? placeholders.
+            params: The query parameters.
+
+        Returns:
+            sqlite3.Row: The first row, or None.
+        """
+        return await self.run(lambda con: con.execute(sql, params).fetchone())
+
+    async def execute(self, sql, params=()):
+        """Run a statement in its own transaction.
+
+        Args:
+            sql: The SQL statement with ? placeholders.
+            params: The statement parameters.
+
+        Returns:
+            sqlite3.Cursor: The cursor, for lastrowid and rowcount.
+        """
+        def _execute(con):
+            with con:
+                return con.execute(sql, params)
+        return await self.run(_execute)
+
+    async def commit(self, batch):
+        """Run every statement of a batch in a single transaction.
+
+        Args:
+            batch: The Batch to commit.
+        """
+        def _commit(con):
+            with con:
+                for sql, params in batch.statements:
+                    con.execute(sql, params)
+        if batch.statements:
+            await self.run(_commit)
+        batch.statements = []
+
+    @contextlib.asynccontextmanager
+    async def batch(self):
+        """Collect the writes of a cycle and commit them together when the block ends.
+
+        Yields:
+            Batch: The batch to queue statements on.
+        """
+        batch = Batch()
+        yield batch
+        await self.commit(batch)
+
+    def close(self):
+        """Close the connection and stop the database thread."""
+        if self.con is not None:
+            self._executor.submit(self.con.close).result()
+            self.con = None
+        self._executor.shutdown(wait=True)
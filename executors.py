@@ -0,0 +1,65 @@
+import asyncio, functools, multiprocessing, os
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
+
+IO_WORKERS = int(os.getenv('IO_WORKERS', 8)) # hilos para llamadas de red (yfinance)
+CPU_WORKERS = int(os.getenv('CPU_WORKERS', 2)) # procesos para renderizar graficos
+IO_TIMEOUT = 30 # segundos
+CPU_TIMEOUT = 60 # segundos
+
+_io_pool = None
+_cpu_pool = None
+
+def io_pool():
+    """Return the shared thread pool for blocking I/O, creating it on first use."""
+    global _io_pool
+    if _io_pool is None:
+        _io_pool = ThreadPoolExecutor(max_workers=IO_WORKERS, thread_name_prefix='io')
+    return _io_pool
+
+def cpu_pool():
+    """Return the shared process pool for CPU bound work, creating it on first use."""
+    global _cpu_pool
+    if _cpu_pool is None:
+        # spawn evita heredar locks de los hilos de I/O al hacer fork, pero vuelve a ejecutar el script principal: el bot arranca desde main.py
+        _cpu_pool = ProcessPoolExecutor(max_workers=CPU_WORKERS, mp_context=multiprocessing.get_context('spawn'))
+    return _cpu_pool
+
+async def run_io(fn, *args, timeout=IO_TIMEOUT, **kwargs):
+    """Run a blocking network or disk call in the I/O thread pool.
+
+    Args:
+        fn: The blocking callable.
+        *args: Positional arguments for fn.
+        timeout: Seconds to wait before raising asyncio.TimeoutError.
+        **kwargs: Keyword arguments for fn.
+
+    Returns:
+        The value returned by fn.
+    """
+    loop = asyncio.get_running_loop()
+    return await asyncio.wait_for(loop.run_in_executor(io_pool(), functools.partial(fn, *args, **kwargs)), timeout)
+
+async def run_cpu(fn, *args, timeout=CPU_TIMEOUT, **kwargs):
+    """Run a CPU bound call, such as a chart render, in the process pool.
+
+    Args:
+        fn: A picklable module level callable.
+        *args: Picklable positional arguments for fn.
+        timeout: Seconds to wait before raising asyncio.TimeoutError.
+        **kwargs: Picklable keyword arguments for fn.
+
+    Returns:
+        The value returned by fn.
+    """
+    loop = asyncio.get_running_loop()
+    return await asyncio.wait_for(loop.run_in_executor(cpu_pool(), functools.partial(fn, *args, **kwargs)), timeout)
+
+def shutdown():
+    """Stop both pools without waiting for queued work."""
+    global _io_pool, _cpu_pool
+    if _io_pool is not None:
+        _io_pool.shutdown(wait=False, cancel_futures=True)
+        _io_pool = None
+    if _cpu_pool is not None:
+        _cpu_pool.shutdown(wait=False, cancel_futures=True)
+        _cpu_pool = None
@@ -0,0 +1,268 @@
+import asyncio, base64, json, logging, os, time
+from collections import namedtuple
+import market_hours, metrics, quotes, scheduler
+
+POLL_INTERVAL = 5*60 # segundos entre consultas de un mismo ticker en modo polling
+STREAM_URL = 'wss://streamer.finance.yahoo.com/?version=2'
+STREAM_HEARTBEAT = 15 # segundos entre renovaciones de las suscripciones del websocket
+
+Tick = namedtuple('Tick', ['ticker', 'price', 'time'])
+
+class QuoteSource:
+    """Source of price ticks for a set of subscribed tickers.
+
+    Subclasses implement ticks() and may react to subscription changes.
+    """
+
+    def __init__(self):
+        self.tickers = set()
+
+    async def subscribe(self, tickers):
+        """Start receiving ticks for some tickers.
+
+        Args:
+            tickers: Iterable of stock ticker symbols.
+        """
+        self.tickers.update(tickers)
+
+    async def unsubscribe(self, tickers):
+        """Stop receiving ticks for some tickers.
+
+        Args:
+            tickers: Iterable of stock ticker symbols.
+        """
+        self.tickers.difference_update(tickers)
+
+    async def set_tickers(self, tickers):
+        """Subscribe to exactly the given tickers.
+
+        Args:
+            tickers: Iterable of stock ticker symbols.
+        """
+        tickers = set(tickers)
+        if tickers-self.tickers:
+            await self.subscribe(tickers-self.tickers)
+        if self.tickers-tickers:
+            await self.unsubscribe(self.tickers-tickers)
+
+    async def ticks(self):
+        """Yield a Tick for every new price of a subscribed ticker."""
+        raise NotImplementedError
+        yield
+
+    async def close(self):
+        """Release the connections of the source."""
+
+class PollingSource(QuoteSource):
+    """Polls the shared quote cache for every subscribed ticker at a fixed interval."""
+
+    def __init__(self, interval=POLL_INTERVAL):
+        """Create the source.
+
+        Args:
+            interval: Seconds between two polls of the same ticker.
+        """
+        super().__init__()
+        self.interval = interval
+        self.scheduler = scheduler.DeadlineScheduler()
+        self._polled = {} # ticker -> ultima consulta con exito
+
+    async def subscribe(self, tickers):
+        tickers = set(tickers)-self.tickers
+        await super().subscribe(tickers)
+        for ticker in tickers:
+            self.scheduler.schedule(ticker, time.time())
+
+    async def unsubscribe(self, tickers):
+        await super().unsubscribe(tickers)
+        for ticker in tickers:
+            self.scheduler.cancel(ticker)
+            self._polled.pop(ticker, None)
+
+    async def ticks(self):
+        while True:
+            due = await self.scheduler.wait_due()
+            # con el mercado cerrado el precio no cambia, se espera a la apertura tras la ultima consulta
+            cerrados = await market_hours.closed_until({ticker: self._polled.get(ticker, 0) for ticker in due})
+            if cerrados:
+                for ticker, apertura in cerrados.items():
+                    self.scheduler.schedule(ticker, apertura)
+                metrics.inc('market_closed_skips_total', len(cerrados), loop='price_alerts')
+                due = [ticker for ticker in due if ticker not in cerrados]
+                if not due:
+                    continue
+            for ticker in due:
+                self.scheduler.schedule(ticker, time.time()+self.interval)
+            try:
+                precios = await quotes.get_quotes(due)
+            except Exception as e:
+                logging.error(f"Error polling prices: {e}")
+                continue
+            ahora = time.time()
+            for ticker in due:
+                if ticker in precios:
+                    self._polled[ticker] = ahora
+                if ticker in precios and ticker in self.tickers:
+                    yield Tick(ticker, precios[ticker]['regularMarketPrice'], ahora)
+
+class StreamingSource(QuoteSource):
+    """Receives pushed prices from Yahoo Finance's live websocket feed.
+
+    Messages are decoded with yfinance's protobuf schema, but the connection is
+    handled here: yfinance's listen() spins on a connection that was closed.
+    """
+
+    def __init__(self, url=STREAM_URL):
+        """Create the source.
+
+        Args:
+            url: Websocket URL of the live feed.
+        """
+        super().__init__()
+        self.url = url
+        self._ws = None
+        self._queue = asyncio.Queue()
+        self._symbols = {} # simbolo en mayusculas -> tickers tal como los escribio el usuario
+
+    async def _websocket(self):
+        if self._ws is None:
+            from websockets.asyncio.client import connect
+            ws = await connect(self.url)
+            # un socket nuevo no conoce las suscripciones del anterior
+            if self._symbols:
+                try:
+                    await ws.send(json.dumps({'subscribe': sorted(self._symbols)}))
+                except BaseException:
+                    await ws.close()
+                    raise
+            self._ws = ws
+        return self._ws
+
+    async def subscribe(self, tickers):
+        tickers = set(tickers)-self.tickers
+        await super().subscribe(tickers)
+        for ticker in tickers:
+            self._symbols.setdefault(ticker.upper(), set()).add(ticker)
+        if tickers and self._ws is not None:
+            await self._ws.send(json.dumps({'subscribe': sorted({ticker.upper() for ticker in tickers})}))
+        elif tickers:
+            await self._websocket()
+
+    async def unsubscribe(self, tickers):
+        await super().unsubscribe(tickers)
+        dropped = []
+        for ticker in tickers:
+            symbol = ticker.upper()
+            self._symbols.get(symbol, set()).discard(ticker)
+            if not self._symbols.get(symbol):
+                self._symbols.pop(symbol, None)
+                dropped.append(symbol)
+        if dropped and self._ws is not None:
+            await self._ws.send(json.dumps({'unsubscribe': dropped}))
+
+    def _on_message(self, message):
+        try:
+            tick_time = int(message.get('time', 0))/1000 or time.time()
+            for ticker in self._symbols.get(message['id'], ()):
+                self._queue.put_nowait(Tick(ticker, float(message['price']), tick_time))
+        except (KeyError, TypeError, ValueError) as e:
+            logging.error(f"Invalid message from the live feed: {e}")
+
+    async def _listen(self, ws):
+        from google.protobuf.json_format import MessageToDict
+        from yfinance.live import PricingData
+        async for raw in ws:
+            try:
+                pricing = PricingData()
+                pricing.ParseFromString(base64.b64decode(json.loads(raw)['message']))
+            except Exception as e:
+                logging.error(f"Invalid message from the live feed: {e}")
+                continue
+            self._on_message(MessageToDict(pricing, preserving_proto_field_name=True))
+        raise ConnectionError("The live feed closed the connection")
+
+    async def _heartbeat(self, ws):
+        # Yahoo deja de enviar precios si no se renuevan las suscripciones
+        while True:
+            await asyncio.sleep(STREAM_HEARTBEAT)
+            if self._symbols:
+                await ws.send(json.dumps({'subscribe': sorted(self._symbols)}))
+
+    async def ticks(self):
+        ws = await self._websocket()
+        listener = asyncio.ensure_future(asyncio.gather(self._listen(ws), self._heartbeat(ws)))
+        getter = None
+        try:
+            while True:
+                if not self._queue.empty():
+                    yield self._queue.get_nowait()
+                    continue
+                # si la escucha termina por un error no llegaria ningun tick mas
+                getter = asyncio.ensure_future(self._queue.get())
+                await asyncio.wait((getter, listener), return_when=asyncio.FIRST_COMPLETED)
+                if not getter.done():
+                    listener.result()
+                tick, getter = getter.result(), None
+                yield tick
+        finally:
+            if getter is not None:
+                getter.cancel()
+            listener.cancel()
+            await asyncio.gather(listener, return_exceptions=True)
+            await self.close()
+
+    async def close(self):
+        if self._ws is not None:
+            ws, self._ws = self._ws, None
+            await ws.close()
+
+class ReplaySource(QuoteSource):
+    """Replays recorded ticks from a JSON lines file, used for tests and benchmarks.
+
+    Each line is an object with 'ticker', 'price' and 'time' (Unix timestamp) keys.
+    """
+
+    def __init__(self, path, speed=0):
+        """Create the source.
+
+        Args:
+            path: Path of the recorded ticks file.
+            speed: Replay speed relative to the recorded times, 0 replays without waiting.
+        """
+        super().__init__()
+        self.path = path
+        self.speed = speed
+
+    async def ticks(self):
+        anterior = None
+        with open(self.path) as f:
+            for line in f:
+                if not line.strip():
+                    continue
+                record = json.loads(line)
+                tick = Tick(record['ticker'], float(record['price']), float(record['time']))
+                if self.speed and anterior is not None and tick.time > anterior:
+                    await asyncio.sleep((tick.time-anterior)/self.speed)
+                anterior = tick.time
+                if tick.ticker in self.tickers:
+                    yield tick
+                else:
+                    await asyncio.sleep(0)
+
+def make_source(mode=None):
+    """Create the quote source selected by the QUOTE_FEED environment variable.
+
+    Args:
+        mode: 'poll' (default), 'stream' or 'replay'. Replay reads QUOTE_REPLAY_FILE.
+
+    Returns:
+        QuoteSource: The quote source.
+    """
+    mode = mode or os.getenv('QUOTE_FEED', 'poll')
+    if mode == 'stream':
+        return StreamingSource()
+    if mode == 'replay':
+        return ReplaySource(os.getenv('QUOTE_REPLAY_FILE', 'ticks.jsonl'), float(os.getenv('QUOTE_REPLAY_SPEED', 0)))
+    if mode == 'poll':
+        return PollingSource()
+    raise ValueError(f"Invalid quote feed mode: {mode}")
@@ -0,0 +1,105 @@
+import hashlib, logging
+from collections import OrderedDict
+from telebot.asyncio_helper import ApiTelegramException
+import metrics
+
+MAX_FILE_IDS = 2000 # graficos recordados, se olvidan los menos usados
+
+class FileIdCache:
+    """Persistent LRU map from a chart's content hash to the Telegram file_id it got.
+
+    Sending a file_id instead of the PNG bytes skips the upload when the same
+    chart already went out.
+    """
+
+    def __init__(self, database, maxsize=MAX_FILE_IDS):
+        """Create the cache, call load() before using it.
+
+        Args:
+            database: The db.Database holding the chart_files table.
+            maxsize: Maximum number of file_ids kept.
+        """
+        self.database = database
+        self.maxsize = maxsize
+        self._entries = OrderedDict()
+
+    async def load(self):
+        """Read the stored file_ids, least recently used first."""
+        rows = await self.database.fetchall("SELECT hash, file_id FROM chart_files ORDER BY last_used;")
+        self._entries = OrderedDict((row['hash'], row['file_id']) for row in rows)
+
+    def get(self, digest):
+        """Get the file_id of a chart.
+
+        Args:
+            digest: SHA-256 hex digest of the PNG.
+
+        Returns:
+            str: The file_id, or None if the chart was never sent.
+        """
+        file_id = self._entries.get(digest)
+        if file_id is not None:
+            self._entries.move_to_end(digest)
+        return file_id
+
+    async def touch(self, digest):
+        """Record that a stored file_id was used again."""
+        await self.database.execute("UPDATE chart_files SET last_used=current_timestamp WHERE hash=?;", (digest,))
+
+    async def remember(self, digest, file_id):
+        """Store the file_id Telegram returned for a chart and evict the oldest ones.
+
+        Args:
+            digest: SHA-256 hex digest of the PNG.
+            file_id: The file_id of the largest photo size.
+        """
+        self._entries[digest] = file_id
+        self._entries.move_to_end(digest)
+        await self.database.execute("INSERT OR REPLACE INTO chart_files (hash, file_id, last_used) VALUES (?, ?, current_timestamp);", (digest, file_id))
+        if len(self._entries) > self.maxsize:
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+            await self.database.execute("DELETE FROM chart_files WHERE hash NOT IN (SELECT hash FROM chart_files ORDER BY last_used DESC LIMIT ?);", (self.maxsize,))
+
+    async def forget(self, digest):
+        """Drop a file_id Telegram no longer accepts."""
+        self._entries.pop(digest, None)
+        await self.database.execute("DELETE FROM chart_files WHERE hash=?;", (digest,))
+
+    async def send_photo(self, bot, chat_id, photo, **kwargs):
+        """Send a chart, reusing its file_id when the same PNG was sent before.
+
+        Args:
+            bot: The AsyncTeleBot used to send.
+            chat_id: The destination chat.
+            photo: PNG bytes of the chart.
+            **kwargs: Other arguments of send_photo, such as caption.
+
+        Returns:
+            Message: The sent message.
+        """
+        digest = hashlib.sha256(photo).hexdigest()
+        file_id = self.get(digest)
+        metrics.hit('file_id', file_id is not None)
+        if file_id is not None:
+            try:
+                message = await bot.send_photo(chat_id=chat_id, photo=file_id, **kwargs)
+            except ApiTelegramException as e:
+                if e.error_code != 400:
+                    raise
+                logging.info(f"Stored file_id of chart {digest} rejected, uploading it again: {e}")
+                await self.forget(digest)
+            else:
+                await self._guarda(self.touch(digest))
+                return message
+        message = await bot.send_photo(chat_id=chat_id, photo=photo, **kwargs)
+        if message.photo:
+            await self._guarda(self.remember(digest, message.photo[-1].file_id))
+        return message
+
+    async def _guarda(self, escritura):
+        # la foto ya salio, un error de la base de datos no debe hacer que se reintente el envio
+        try:
+            await escritura
+        except Exception as e:
+            logging.error(f"Error storing a chart file_id: {e}")
@@ -1,16 +1,35 @@
-import yfinance as yf
-import matplotlib.pyplot as plt
 from dotenv import load_dotenv
-import os, asyncio, logging, sqlite3, io, datetime
+import os, asyncio, contextlib, logging, datetime, time, html
+import numpy as np
 from telebot import asyncio_filters
-from telebot.types import *
+from telebot.types import BotCommand
 from telebot.async_telebot import AsyncTeleBot
+import quotes, executors, charts, history, indicators, alerts, feeds, db, sender, fileids, metrics, providers, webhook, jobs, market_hours
 
 # Replace with your actual Telegram Bot Token
 load_dotenv()
 TOKEN = os.getenv('KEY_TELEGRAM')
 bot = AsyncTeleBot(token=TOKEN)
-con=None
+outbox = sender.SendQueue(bot) # envios de los procesos en segundo plano, con limites de Telegram y reintentos
+database = db.Database()
+chart_files = fileids.FileIdCache(database) # file_id de Telegram de cada grafico ya enviado
+quotes.set_store(quotes.MetaStore(database)) # nombre, moneda y mercado de cada ticker, se piden una vez
+alert_index = alerts.AlertIndex()
+WORKER_ID = jobs.worker_id() # identifica a este proceso en las reservas de trabajos y el liderazgo
+# las colas viven en bot.db, cada trabajo vencido lo reclama un solo proceso
+track_scheduler = jobs.JobQueue(database, 'track', WORKER_ID) # id de seguimiento -> proxima actualizacion
+alert_scheduler = jobs.JobQueue(database, 'cross', WORKER_ID) # ticker con alertas de cruce -> proxima comprobacion
+leader = jobs.Lease(database, 'leader', WORKER_ID) # el lider escucha las cotizaciones y evalua las alertas de precio
+quote_feed = feeds.make_source() # las alertas de precio se evaluan con cada cotizacion que llega
+feed_task = None # tarea de escucha_cotizaciones mientras este proceso es el lider
+ALERT_INTERVAL = 5*60 # segundos entre comprobaciones de las alertas de cruce de un ticker
+TRACK_RETRY = 60*60 # segundos hasta reintentar un seguimiento que ha fallado
+TRACK_CONCURRENCY = int(os.getenv('TRACK_CONCURRENCY', 8)) # tickers procesados a la vez en cada ciclo
+DIGEST_PANELS = 12 # seguimientos por grafico de resumen, los demas van en otro mensaje
+CAPTION_LIMIT = 1024 # caracteres maximos del pie de una foto en Telegram
+BOT_MODE = os.getenv('BOT_MODE', 'polling') # 'webhook' recibe las actualizaciones por HTTP, tambien con -webhook, y 'worker' solo los trabajos, tambien con -worker
+PRELOAD_DELAY = 1 # segundos tras arrancar hasta importar yfinance y matplotlib en segundo plano
+LOOP_BACKOFF = 30 # segundos de espera de un bucle de fondo tras un error, p. ej. con la base de datos bloqueada
 
 def is_admin_user(id):
     """Check if the user ID is admin.
@@ -74,10 +93,37 @@ async def send_help(message):
     /untrack <ticker> - Stop tracking a stock.
     /tracks - Show tracked stocks.
     /update_tracks [update_intervals] - Update tracked stocks without changing the next update time, use 'update_intervals' to also update the next update time.
+    /digest - Toggle digest mode: get all your due tracks in one chart with a P&L table instead of one message per track.
+    /indicators <ticker> - Get SMA, EMA, RSI, MACD and Bollinger bands of a stock.
     /alert <ticker> <limit_value> - Set an alert for a stock, use < for high limit and > for low limit, example: /alert AUCO.L <1.5
+        Use x<short>/<long> to be alerted when SMA short crosses SMA long, example: /alert AAPL x9/20
     /alerts - Show active alerts.
     /unalert <ticker> - Remove an alert for a stock, format: /unalert <stock_ticker>''')
-def is_tracking(user_id, ticker):
+async def send_chart(chat_id, photo, **kwargs):
+    """Send a chart image, reusing the Telegram file_id if the same PNG was already sent.
+
+    Args:
+        chat_id: The destination chat.
+        photo: PNG bytes of the chart.
+        **kwargs: Other arguments of send_photo, such as caption.
+
+    Returns:
+        Message: The sent message.
+    """
+    return await chart_files.send_photo(bot, chat_id, photo, **kwargs)
+
+def db_time(timestamp):
+    """Convert a SQLite UTC timestamp into a Unix timestamp.
+
+    Args:
+        timestamp: Text timestamp as stored by CURRENT_TIMESTAMP or datetime('now').
+
+    Returns:
+        float: Unix timestamp.
+    """
+    return datetime.datetime.fromisoformat(timestamp).replace(tzinfo=datetime.timezone.utc).timestamp()
+
+async def is_tracking(user_id, ticker):
     """Check if a user is tracking a specific stock ticker.
 
     Args:
@@ -87,10 +133,7 @@ def is_tracking(user_id, ticker):
     Returns:
         The tracking record if found, None otherwise.
     """
-    global con
-    cursor= con.cursor()
-    cursor.execute("SELECT * FROM tracks WHERE user_id=? AND ticker=?;", (user_id, ticker))
-    return cursor.fetchone()
+    return await database.fetchone("SELECT * FROM tracks WHERE user_id=? AND ticker=?;", (user_id, ticker))
 
 @bot.message_handler(commands=['price'])
 async def send_price(message):
@@ -105,9 +148,9 @@ async def send_price(message):
     ticker = message.text.split()[1] if len(message.text.split()) > 1 else None
     logging.info(f"User {message.from_user.id} requested price for {ticker}.")
     try:
-        stock = yf.Ticker(ticker)
-        current_price = stock.info['regularMarketPrice']
-        await bot.reply_to(message,f"Current price of {stock.info['longName']} ({ticker}): {current_price}")
+        quote, info = await asyncio.gather(quotes.get_quote(ticker), quotes.get_info(ticker))
+        current_price = quote['regularMarketPrice']
+        await bot.reply_to(message,f"Current price of {info['longName']} ({ticker}): {current_price}")
     except Exception as e:
         logging.error(f"Error fetching price for {ticker}: {e}")
         await bot.reply_to(message,"Invalid ticker symbol.")
@@ -129,36 +172,55 @@ async def send_sma(message) -> None:
     logging.info(f"User {message.from_user.id} requested SMA crossover graph for {ticker} with short period {short_period} and long period {long_period}.")
 
     try:
-        stock = yf.Ticker(ticker)
-        data = stock.history(period="1y")
-        data['SMA_short'] = data['Close'].rolling(short_period).mean()
-        data['SMA_long'] = data['Close'].rolling(long_period).mean()
-
-        plt.figure(figsize=(12, 6))
-        plt.plot(data['Close'], label='Close')
-        plt.plot(data['SMA_short'], label=f'SMA {short_period}')
-        plt.plot(data['SMA_long'], label=f'SMA {long_period}')
-        plt.xlabel('Date')
-        plt.ylabel('Price')
-        plt.title(f'SMA Crossover for {ticker}')
-        plt.legend()
-        plt.grid(True)
-
-
-        # Save the graph to a bytes buffer
-        buf = io.BytesIO()
-        plt.savefig(buf, format='png')
-        image_bytes = buf.getvalue()
+        data = await history.get_history(ticker, "1y")
+        closes = data['Close'].to_numpy()
+        sma_short = indicators.sma(closes, short_period)
+        sma_long = indicators.sma(closes, long_period)
+        overlays = [(f'SMA {short_period}', sma_short), (f'SMA {long_period}', sma_long)]
+        image_bytes = await charts.chart(ticker, "1y", data, f'SMA Crossover for {ticker}', overlays=overlays)
+        index, direction = indicators.last_crossover(sma_short, sma_long)
+        caption = f"SMA Crossover graph for {ticker} with short period {short_period} and long period {long_period}:"
+        if index[0] >= 0:
+            caption += f"\nLast crossover: {'golden cross' if direction[0] > 0 else 'death cross'} on {data.index[index[0]].date()}"
         # Send the graph to the user
-        await bot.send_photo(chat_id=message.chat.id, photo=image_bytes, caption=f"SMA Crossover graph for {ticker} with short period {short_period} and long period {long_period}:")
-        buf.close()
-        plt.close()
+        await send_chart(message.chat.id, image_bytes, caption=caption)
 
     except Exception as e:
         logging.error(f"Error generating SMA graph for {ticker}: {e}")
         await bot.reply_to(message,"Error generating SMA graph.")
 
-def graph(ticket, period="1y", buy_price=None):
+@bot.message_handler(commands=['indicators'])
+async def send_indicators(message):
+    """Send the latest technical indicators of a stock ticker.
+
+    Args:
+        message: The message object containing user and chat information. Format: /indicators <ticker>
+    """
+    if not is_valid_user(message.from_user.id):
+        await bot.reply_to(message, "Unauthorized access.")
+        return
+    ticker = message.text.split()[1] if len(message.text.split()) > 1 else None
+    logging.info(f"User {message.from_user.id} requested indicators for {ticker}.")
+    try:
+        data = await history.get_history(ticker, "1y")
+        closes = data['Close'].to_numpy()
+        macd_line, signal_line, _ = indicators.macd(closes)
+        middle, upper, lower = indicators.bollinger(closes)
+        index, direction = indicators.last_crossover(indicators.sma(closes, 9), indicators.sma(closes, 20))
+        response = (f"Indicators for {ticker} (close {closes[-1]:.2f} on {data.index[-1].date()}):\n"
+                    f"SMA 9: {indicators.sma(closes, 9)[-1]:.2f}\nSMA 20: {indicators.sma(closes, 20)[-1]:.2f}\n"
+                    f"EMA 12: {indicators.ema(closes, 12)[-1]:.2f}\nEMA 26: {indicators.ema(closes, 26)[-1]:.2f}\n"
+                    f"RSI 14: {indicators.rsi(closes)[-1]:.1f}\n"
+                    f"MACD: {macd_line[-1]:.3f} (signal {signal_line[-1]:.3f})\n"
+                    f"Bollinger 20: {lower[-1]:.2f} - {middle[-1]:.2f} - {upper[-1]:.2f}")
+        if index[0] >= 0:
+            response += f"\nLast SMA 9/20 crossover: {'golden cross' if direction[0] > 0 else 'death cross'} on {data.index[index[0]].date()}"
+        await bot.reply_to(message, response)
+    except Exception as e:
+        logging.error(f"Error computing indicators for {ticker}: {e}")
+        await bot.reply_to(message,"Error computing indicators.")
+
+async def graph(ticket, period="1y", buy_price=None):
     """Generate a price graph for a stock ticker.
 
     Args:
@@ -169,25 +231,9 @@ def graph(ticket, period="1y", buy_price=None):
     Returns:
         bytes: PNG image of the stock price graph.
     """
-    stock = yf.Ticker(ticket)
-    data = stock.history(period=period)
-
-    plt.figure(figsize=(12, 6))
-    plt.plot(data['Close'], label='Close')
-    plt.xlabel('Date')
-    plt.ylabel('Price')
-    plt.title(f'Price Graph for {stock.info["longName"]} ({ticket})')
-    if buy_price:
-        plt.axhline(y=buy_price, color='r', linestyle='--', label=f'Buy Price: {buy_price}')
-    plt.legend()
-    plt.grid(True)
-
-    buf = io.BytesIO()
-    plt.savefig(buf, format='png')
-    image_bytes = buf.getvalue()
-    buf.close()
-    plt.close()
-    return image_bytes
+    data, nombre = await asyncio.gather(history.get_history(ticket, period), quotes.get_name(ticket))
+    title = f'Price Graph for {nombre} ({ticket})'
+    return await charts.chart(ticket, period, data, title, buy_price=buy_price)
 
 @bot.message_handler(commands=['graph'])
 async def send_graph(message):
@@ -204,8 +250,8 @@ async def send_graph(message):
     periodo=message.text.split()[2] if len(message.text.split()) > 2 else '1y' # 1d, 5d, 1mo, 3mo, 6mo, 1y, 2y, 5y, 10y, ytd, max
     logging.info(f"User {message.from_user.id} requested price graph for {ticker} with period {periodo}.")
     try:
-        track=is_tracking(message.from_user.id, ticker)
-        await bot.send_photo(chat_id=message.chat.id, photo=graph(ticker,periodo,buy_price=track['buy_price'] if track else None), caption=f"Price graph for {ticker} with period {periodo}:")
+        track=await is_tracking(message.from_user.id, ticker)
+        await send_chart(message.chat.id, await graph(ticker,periodo,buy_price=track['buy_price'] if track else None), caption=f"Price graph for {ticker} with period {periodo}:")
     except Exception as e:
         logging.error(f"Error generating price graph for {ticker}: {e}")
         await bot.reply_to(message,"Error generating price graph.")
@@ -220,10 +266,7 @@ async def alerts_show(message):
     if not is_valid_user(message.from_user.id):
         await bot.reply_to(message, "Unauthorized access.")
         return
-    global con
-    cursor= con.cursor()
-    cursor.execute("SELECT id, ticker, limit_value FROM alerts WHERE user_id=?;", (message.from_user.id,))
-    alerts = cursor.fetchall()
+    alerts = await database.fetchall("SELECT id, ticker, limit_value FROM alerts WHERE user_id=?;", (message.from_user.id,))
     if alerts:
         response = "Active alerts:\n"
         for id, ticker, limit_value in alerts:
@@ -245,13 +288,17 @@ async def alert_ticket(message):
     try:
         ticker = message.text.split()[1]
         limit = message.text.split()[2]
-        if not (limit.startswith('<') or limit.startswith('>')):
-            await bot.reply_to(message, "Invalid limit format. Use < for high limit and > for low limit, example: /alert AUCO.L <1.5")
+        try:
+            direction, threshold = alerts.parse_limit(limit)
+        except ValueError:
+            await bot.reply_to(message, "Invalid limit format. Use < for high limit and > for low limit, example: /alert AUCO.L <1.5, or x<short>/<long> for a SMA crossover, example: /alert AAPL x9/20")
             return
-        global con
-        cursor= con.cursor()
-        cursor.execute("INSERT INTO alerts (user_id, ticker, limit_value) VALUES (?, ?, ?);", (message.from_user.id, ticker, limit))
-        con.commit()
+        cursor = await database.execute("INSERT INTO alerts (user_id, ticker, limit_value, direction, threshold) VALUES (?, ?, ?, ?, ?);", (message.from_user.id, ticker, limit, direction, threshold))
+        alert_index.add(cursor.lastrowid, message.from_user.id, ticker, direction, threshold, limit)
+        if direction == alerts.CROSS:
+            alert_scheduler.schedule(ticker, time.time()+ALERT_INTERVAL, only_if_earlier=True)
+        elif escuchando():
+            await quote_feed.subscribe([ticker])
         await bot.reply_to(message,f"Alert set for {ticker} with limit value {limit}.")
     except Exception as e:
         logging.error(f"Error setting alert for {ticker}: {e}")
@@ -269,10 +316,12 @@ async def unalert_ticket(message):
         return
     ticker = message.text.split()[1] if len(message.text.split()) > 1 else None
     try:
-        global con
-        cursor= con.cursor()
-        cursor.execute("DELETE FROM alerts WHERE user_id=? AND ticker=?;", (message.from_user.id, ticker))
-        con.commit()
+        await database.execute("DELETE FROM alerts WHERE user_id=? AND ticker=?;", (message.from_user.id, ticker))
+        alert_index.remove_user_ticker(message.from_user.id, ticker)
+        if escuchando():
+            await quote_feed.set_tickers(alert_index.tickers())
+        if not await database.fetchone("SELECT 1 FROM alerts WHERE ticker=? AND direction=? LIMIT 1;", (ticker, alerts.CROSS)):
+            alert_scheduler.cancel(ticker)
         await bot.reply_to(message,f"Alert removed for {ticker}.")
     except Exception as e:
         logging.error(f"Error removing alert for {ticker}: {e}")
@@ -293,11 +342,21 @@ async def track_ticket(message):
     buy_price = float(message.text.split()[2]) if len(message.text.split()) > 2 else 0
     update_interval= int(message.text.split()[3]) if len(message.text.split()) > 3 else 12 # default update every 12 hours
     try:
-        stock = yf.Ticker(ticker)
-        global con
-        cursor= con.cursor()
-        cursor.execute("INSERT INTO tracks (user_id, ticker, buy_price, update_interval) VALUES (?, ?, ?, ?);", (message.from_user.id, ticker, buy_price, update_interval))
-        con.commit()
+        # el ticker se valida con los metadatos guardados, solo se consulta al proveedor la primera vez
+        if not ticker:
+            await bot.reply_to(message, "Invalid ticker symbol.")
+            return
+        try:
+            info = await quotes.get_info(ticker)
+        except Exception as e:
+            logging.error(f"Error checking ticker {ticker}: {e}")
+            await bot.reply_to(message, f"Could not check {ticker} right now, please try again later.")
+            return
+        if not info:
+            await bot.reply_to(message, "Invalid ticker symbol.")
+            return
+        cursor = await database.execute("INSERT INTO tracks (user_id, ticker, buy_price, update_interval) VALUES (?, ?, ?, ?);", (message.from_user.id, ticker, buy_price, update_interval))
+        track_scheduler.schedule(cursor.lastrowid, time.time())
         await bot.reply_to(message,f"Tracking {ticker} for price updates every {update_interval} hours.")
     except Exception as e:
         logging.error(f"Error tracking {ticker}: {e}")
@@ -313,10 +372,7 @@ async def tracks(message):
     if not is_valid_user(message.from_user.id):
         await bot.reply_to(message, "Unauthorized access.")
         return
-    global con
-    cursor= con.cursor()
-    cursor.execute("SELECT ticker, buy_price, next_check, update_interval FROM tracks WHERE user_id=?;", (message.from_user.id,))
-    tracks = cursor.fetchall()
+    tracks = await database.fetchall("SELECT ticker, buy_price, next_check, update_interval FROM tracks WHERE user_id=?;", (message.from_user.id,))
     if tracks:
         response = "Tracked tickets:\n"
         for ticker, buy_price, next_check, update_interval in tracks:
@@ -341,10 +397,10 @@ async def track_change_interval(message):
         await bot.reply_to(message, "Invalid update interval. Please provide a valid number of hours.")
         return
     try:
-        global con
-        cursor= con.cursor()
-        cursor.execute("UPDATE tracks SET update_interval=? WHERE user_id=? AND ticker=?;", (update_interval, message.from_user.id, ticker))
-        con.commit()
+        # la proxima actualizacion se recalcula desde la ultima enviada con el nuevo intervalo
+        await database.execute("UPDATE tracks SET next_check=datetime(next_check, (?-update_interval)||' hours'), update_interval=? WHERE user_id=? AND ticker=?;", (update_interval, update_interval, message.from_user.id, ticker))
+        for id, next_check in await database.fetchall("SELECT id, next_check FROM tracks WHERE user_id=? AND ticker=?;", (message.from_user.id, ticker)):
+            track_scheduler.schedule(id, db_time(next_check))
         await bot.reply_to(message,f"Update interval for {ticker} changed to every {update_interval} hours.")
     except Exception as e:
         logging.error(f"Error changing update interval for {ticker}: {e}")
@@ -362,15 +418,37 @@ async def untrack_ticket(message):
         return
     ticker = message.text.split()[1] if len(message.text.split()) > 1 else None
     try:
-        global con
-        cursor= con.cursor()
-        cursor.execute("DELETE FROM tracks WHERE user_id=? AND ticker=?;", (message.from_user.id, ticker))
-        con.commit()
+        ids = [row['id'] for row in await database.fetchall("SELECT id FROM tracks WHERE user_id=? AND ticker=?;", (message.from_user.id, ticker))]
+        await database.execute("DELETE FROM tracks WHERE user_id=? AND ticker=?;", (message.from_user.id, ticker))
+        for id in ids:
+            track_scheduler.cancel(id)
         await bot.reply_to(message,f"Untracked {ticker}.")
     except Exception as e:
         logging.error(f"Error untracking {ticker}: {e}")
         await bot.reply_to(message,"Error untracking the ticket.")
 
+@bot.message_handler(commands=['digest'])
+async def digest_toggle(message):
+    """Toggle the digest mode of the user's track updates.
+
+    Args:
+        message: The message object containing user and chat information.
+    """
+    if not is_valid_user(message.from_user.id):
+        await bot.reply_to(message, "Unauthorized access.")
+        return
+    def _toggle(con):
+        with con:
+            return con.execute("INSERT INTO user_settings (user_id, digest) VALUES (?, 1) ON CONFLICT (user_id) DO UPDATE SET digest=1-digest RETURNING digest;", (message.from_user.id,)).fetchone()[0]
+    try:
+        if await database.run(_toggle):
+            await bot.reply_to(message, "Digest mode enabled: your due tracks will arrive together in one chart with a P&L table.")
+        else:
+            await bot.reply_to(message, "Digest mode disabled: you will get one message per track.")
+    except Exception as e:
+        logging.error(f"Error toggling digest mode: {e}")
+        await bot.reply_to(message, "Error changing digest mode.")
+
 @bot.message_handler(commands=['bd'])
 async def envia_bd(message):
     """Send the bot database file to the user (admin only).
@@ -381,7 +459,8 @@ async def envia_bd(message):
     if not is_admin_user(message.from_user.id):
         await bot.reply_to(message, "Unauthorized access.")
         return
-    await bot.send_document(message.chat.id,open('bot.db','rb'))
+    await database.execute("PRAGMA wal_checkpoint(TRUNCATE);") # vuelca el WAL para que el fichero este completo
+    await bot.send_document(message.chat.id,open(database.path,'rb'))
     return
 
 @bot.message_handler(commands=['sql'])
@@ -396,123 +475,563 @@ async def comando_sql(message):
         return
     sql=" ".join(message.text.split()[1:])
     try:
-        con.execute(sql)
-        con.commit()
+        await database.execute(sql)
+        # la sentencia puede haber tocado las tablas de alertas o seguimientos
+        await load_alert_index()
+        await load_schedules()
+        if escuchando():
+            await quote_feed.set_tickers(alert_index.tickers())
         await bot.reply_to(message, "Ejecutado", parse_mode='Markdown')
     except Exception as e:
         logging.error(f"Error executing SQL command: {e}")
 
+@bot.message_handler(commands=['stats'])
+async def envia_stats(message):
+    """Send the runtime metrics of the bot (admin only).
+
+    Args:
+        message: The message object containing user and chat information.
+    """
+    if not is_admin_user(message.from_user.id):
+        await bot.reply_to(message, "Unauthorized access.")
+        return
+    await bot.reply_to(message, metrics.registry.report())
+
 @bot.message_handler(commands=['update_tracks'])
 async def comando_update_tracks(message):
     await update_tracks_ciclo(forzado=True,user_id=message.from_user.id, update_interval='update_intervals' in message.text.split())
 
-async def update_tracks_ciclo(forzado=False,user_id=None, update_interval=True):
-    global con
-    cursor= con.cursor()
-    comandosql= "SELECT * FROM tracks WHERE TRUE"
+async def update_tracks_ciclo(forzado=False,user_id=None, update_interval=True, ids=None):
+    """Send the price update of tracked stocks.
+
+    Args:
+        forzado: Send every track of the user, not only the due ones.
+        user_id: Only send the tracks of this user.
+        update_interval: Move the next update time forward after sending.
+        ids: IDs of the due tracks, used when not forced.
+    """
+    comandosql= "SELECT id, user_id, ticker, next_check, buy_price, update_interval, last_sent FROM tracks WHERE TRUE"
+    parametros = []
     if not forzado:
-        comandosql += " AND next_check < datetime('now','+10 minutes')"
+        ids = list(ids or [])
+        comandosql += f" AND id IN ({','.join('?'*len(ids))})"
+        parametros += ids
     if user_id:
-        comandosql += f" AND user_id={user_id}"
-    seguimentos= cursor.execute(comandosql).fetchall()
-    if seguimentos:
+        comandosql += " AND user_id=?"
+        parametros.append(user_id)
+    seguimentos= await database.fetchall(comandosql, parametros)
+    if not forzado:
+        seguimentos = await aplaza_cerrados(seguimentos)
+    if not seguimentos:
+        return
+    usuarios = list({seguimiento['user_id'] for seguimiento in seguimentos})
+    resumen = {row['user_id'] for row in await database.fetchall(f"SELECT user_id FROM user_settings WHERE digest=1 AND user_id IN ({','.join('?'*len(usuarios))});", usuarios)}
+    # cada ticker se consulta y se dibuja una sola vez aunque lo sigan muchos usuarios
+    por_ticker = {}
+    por_usuario = {} # usuarios en modo resumen, reciben todos sus seguimientos juntos
+    for seguimiento in seguimentos:
+        if seguimiento['user_id'] in resumen:
+            por_usuario.setdefault(seguimiento['user_id'], []).append(seguimiento)
+        else:
+            por_ticker.setdefault(seguimiento['ticker'], []).append(seguimiento)
+    try:
+        precios = await quotes.get_quotes(dict.fromkeys(seguimiento['ticker'] for seguimiento in seguimentos))
+    except Exception as e:
+        logging.error(f"Error fetching prices for tracks: {e.__str__()}")
+        precios = {}
+    limite = asyncio.Semaphore(TRACK_CONCURRENCY)
+    # todas las actualizaciones de next_check del ciclo se confirman en una sola transaccion
+    async with database.batch() as cambios:
+        await asyncio.gather(*(envia_seguimientos(ticker, lista, precios.get(ticker), limite, cambios, forzado, update_interval)
+                               for ticker, lista in por_ticker.items()),
+                             *(envia_resumen(user_id, lista, precios, limite, cambios, forzado, update_interval)
+                               for user_id, lista in por_usuario.items()))
+
+async def aplaza_cerrados(seguimentos):
+    """Postpone to the next session the tracks whose last update already had the closing price.
+
+    Tracks that were never sent go out now, so a new track gets its first update
+    even with the market closed. The new next_check is saved for /tracks.
+
+    Args:
+        seguimentos: Due track rows.
+
+    Returns:
+        list: The tracks to send now.
+    """
+    calendarios = await market_hours.exchanges({seguimiento['ticker'] for seguimiento in seguimentos})
+    pendientes = []
+    async with database.batch() as cambios:
+        for seguimiento in seguimentos:
+            calendario = calendarios[seguimiento['ticker']]
+            if calendario and seguimiento['last_sent'] and not calendario.has_new_data(db_time(seguimiento['last_sent'])):
+                apertura = calendario.next_open()
+                cambios.execute("UPDATE tracks SET next_check=datetime(?, 'unixepoch') WHERE id=?;", (apertura, seguimiento['id']))
+                track_scheduler.schedule(seguimiento['id'], apertura)
+            else:
+                pendientes.append(seguimiento)
+    if len(pendientes) < len(seguimentos):
+        metrics.inc('market_closed_skips_total', len(seguimentos)-len(pendientes), loop='tracks')
+    return pendientes
+
+async def envia_seguimientos(ticker, seguimentos, quote, limite, cambios, forzado, update_interval):
+    """Send the price update of every track of one ticker from shared data.
+
+    The metadata is fetched once and one chart is rendered per distinct buy price.
+
+    Args:
+        ticker: The stock ticker symbol.
+        seguimentos: Track rows of the ticker.
+        quote: Quote dict of the ticker from the cycle snapshot, or None if it failed.
+        limite: Semaphore bounding how many tickers are processed at once.
+        cambios: db.Batch collecting the next_check updates of the cycle.
+        forzado: The update was requested by the user.
+        update_interval: Move the next update time forward after sending.
+    """
+    async with limite:
+        try:
+            if quote is None:
+                raise ValueError(f"No price data for {ticker}")
+            precios_compra = sorted({seguimiento['buy_price'] for seguimiento in seguimentos})
+            nombre, *imagenes = await asyncio.gather(quotes.get_name(ticker), *(graph(ticker,'1mo', buy_price=buy_price if buy_price!=0 else None) for buy_price in precios_compra))
+            graficos = dict(zip(precios_compra, imagenes))
+        except Exception as e:
+            logging.error(f"Error updating tracks of {ticker}: {e.__str__()}")
+            if not forzado:
+                for seguimiento in seguimentos:
+                    track_scheduler.schedule(seguimiento['id'], time.time()+TRACK_RETRY)
+            return
+    current_price = quote['regularMarketPrice']
+    min_price=quote['dayLow']
+    max_price=quote['dayHigh']
+    open_price=quote['open']
+    change=round((current_price-open_price)/current_price*100,2) if current_price else 0
+    for seguimiento in seguimentos:
+        id, user_id, ticker, next_check, buy_price, intervalo, last_sent = seguimiento
+        buy_change=round((current_price-buy_price)/current_price*100,2) if current_price and buy_price else 0
+        outbox.send(send_chart, sender.PRIORITY_REPLY if forzado else sender.PRIORITY_TRACK, user_id, photo=graficos[buy_price],caption=f"Current price of {nombre} ({ticker}): {current_price}\nOpen price: {open_price}\nMin: {min_price}\nMax: {max_price}\nChange: {change}%\nBuy Change: {buy_change}%")
+        programa_siguiente(cambios, id, intervalo if update_interval else 0)
+
+def programa_siguiente(cambios, id, intervalo):
+    """Record the send of a track and move its next update one interval forward.
+
+    Args:
+        cambios: db.Batch collecting the next_check updates of the cycle.
+        id: The track ID.
+        intervalo: Hours between updates, 0 only records the send.
+    """
+    if intervalo:
+        cambios.execute("UPDATE tracks SET next_check=datetime('now', ?), last_sent=CURRENT_TIMESTAMP WHERE id=?;", (f'+{intervalo} hours', id))
+        track_scheduler.schedule(id, time.time()+intervalo*60*60)
+    else:
+        cambios.execute("UPDATE tracks SET last_sent=CURRENT_TIMESTAMP WHERE id=?;", (id,))
+
+def tabla_resumen(seguimentos, precios):
+    """Build the P&L table of a digest from the quote snapshot of the cycle.
+
+    The changes of every track are computed at once with NumPy.
+
+    Args:
+        seguimentos: Track rows, all of them with a quote in precios.
+        precios: Quote dict by ticker.
+
+    Returns:
+        str: Monospaced table with the price, day change and buy change of each track.
+    """
+    actual = np.array([precios[seguimiento['ticker']]['regularMarketPrice'] for seguimiento in seguimentos], dtype=float)
+    apertura = np.array([precios[seguimiento['ticker']]['open'] for seguimiento in seguimentos], dtype=float)
+    compra = np.array([seguimiento['buy_price'] for seguimiento in seguimentos], dtype=float)
+    # mismas formulas que los mensajes individuales, en % del precio actual
+    dia = np.divide(actual-apertura, actual, out=np.zeros_like(actual), where=actual != 0)*100
+    desde_compra = np.divide(actual-compra, actual, out=np.zeros_like(actual), where=(actual != 0) & (compra != 0))*100
+    ancho = max(6, *(len(seguimiento['ticker']) for seguimiento in seguimentos))
+    lineas = [f"{'Ticker':<{ancho}} {'Price':>10} {'Day%':>7} {'Buy%':>7}"]
+    for seguimiento, precio, cambio, cambio_compra in zip(seguimentos, actual, dia, desde_compra):
+        lineas.append(f"{seguimiento['ticker']:<{ancho}} {precio:>10.2f} {cambio:>+7.2f} {cambio_compra if seguimiento['buy_price'] else 0:>+7.2f}")
+    return '\n'.join(lineas)
+
+async def envia_resumen(user_id, seguimentos, precios, limite, cambios, forzado, update_interval):
+    """Send every due track of a digest user as one grid chart with a P&L table.
+
+    Args:
+        user_id: The user's ID.
+        seguimentos: Track rows of the user.
+        precios: Quote dict by ticker from the cycle snapshot.
+        limite: Semaphore bounding how many tickers or users are processed at once.
+        cambios: db.Batch collecting the next_check updates of the cycle.
+        forzado: The update was requested by the user.
+        update_interval: Move the next update time forward after sending.
+    """
+    async with limite:
+        tickers = list(dict.fromkeys(seguimiento['ticker'] for seguimiento in seguimentos if seguimiento['ticker'] in precios))
+        historicos = dict(zip(tickers, await asyncio.gather(*(history.get_history(ticker, '1mo') for ticker in tickers), return_exceptions=True)))
+        validos, fallidos = [], []
         for seguimiento in seguimentos:
-            id, user_id, ticker, next_check, buy_price, update_interval = seguimiento
+            data = historicos.get(seguimiento['ticker'])
+            (fallidos if data is None or isinstance(data, Exception) else validos).append(seguimiento)
+        if fallidos:
+            logging.error(f"No price data for the tracks of {', '.join(sorted({seguimiento['ticker'] for seguimiento in fallidos}))} in the digest of user {user_id}.")
+            if not forzado:
+                for seguimiento in fallidos:
+                    track_scheduler.schedule(seguimiento['id'], time.time()+TRACK_RETRY)
+        prioridad = sender.PRIORITY_REPLY if forzado else sender.PRIORITY_TRACK
+        for inicio in range(0, len(validos), DIGEST_PANELS):
+            bloque = validos[inicio:inicio+DIGEST_PANELS]
             try:
-                stock = yf.Ticker(ticker)
-                current_price = stock.info['regularMarketPrice']
-                min_price=stock.info['dayLow']
-                max_price=stock.info['dayHigh']
-                open_price=stock.info['open']
-                change=round((current_price-open_price)/current_price*100,2) if current_price else 0
-                buy_change=round((current_price-buy_price)/current_price*100,2) if current_price and buy_price else 0
-                await bot.send_photo(chat_id=user_id, photo=graph(ticker,'1mo', buy_price=buy_price if buy_price!=0 else None),caption=f"Current price of {stock.info['longName']} ({ticker}): {current_price}\nOpen price: {open_price}\nMin: {min_price}\nMax: {max_price}\nChange: {change}%\nBuy Change: {buy_change}%")
-                if update_interval:
-                    cursor.execute(f"UPDATE tracks SET next_check=datetime('now', '+{update_interval} hours') WHERE id={id};")
-                    con.commit()
+                imagen = await charts.grid('Tracks digest', [(seguimiento['ticker'], historicos[seguimiento['ticker']], seguimiento['buy_price'] or None) for seguimiento in bloque], '1mo')
             except Exception as e:
-                logging.error(f"Error sending message to {user_id}: {e.__str__()}")
+                logging.error(f"Error rendering the digest of user {user_id}: {e.__str__()}")
+                if not forzado:
+                    for seguimiento in bloque:
+                        track_scheduler.schedule(seguimiento['id'], time.time()+TRACK_RETRY)
+                continue
+            tabla = f"<pre>{html.escape(tabla_resumen(bloque, precios))}</pre>"
+            if len(tabla) <= CAPTION_LIMIT:
+                outbox.send(send_chart, prioridad, user_id, photo=imagen, caption=tabla, parse_mode='HTML')
+            else:
+                outbox.send(send_chart, prioridad, user_id, photo=imagen)
+                outbox.send('send_message', prioridad, user_id, text=tabla, parse_mode='HTML')
+            for seguimiento in bloque:
+                programa_siguiente(cambios, seguimiento['id'], seguimiento['update_interval'] if update_interval else 0)
 
 async def actualiza_tracks():
-    """Continuously monitor and send price updates for tracked stocks every 12 hours.
+    """Continuously send price updates for tracked stocks when they are due.
 
-    This function runs in an infinite loop, checking for stocks that need updates
-    and sending price information to their respective users.
+    This function runs in an infinite loop, sleeping until the next due track in
+    the scheduler and sending price information to their respective users. An
+    error, e.g. a locked database, is logged and the loop goes on after a pause,
+    the claimed tracks return to the queue when their claim expires.
     """
     while True:
-        logging.info("Checking for tickets ...")
-        await update_tracks_ciclo(forzado=False)
-        logging.info("Price updates checked. Next check in 1 hour.")
-        await asyncio.sleep(60*60) # se ejecuta cada 1 hora
+        try:
+            ids = await track_scheduler.wait_due()
+            logging.info(f"Sending {len(ids)} due price updates ...")
+            with metrics.timer('cycle_seconds', cycle='tracks'):
+                await update_tracks_ciclo(forzado=False, ids=ids)
+            track_scheduler.done(ids)
+        except Exception as e:
+            logging.error(f"Error in the track updates loop: {e}")
+            metrics.inc('loop_errors_total', loop='tracks')
+            await asyncio.sleep(LOOP_BACKOFF)
+
+async def borra_alertas(ids):
+    """Delete triggered alerts, returning only the ones this call removed.
+
+    Another worker, or the user with /unalert, may have removed an alert first.
+    Only the alerts returned here must be notified, so each one is sent once.
+
+    Args:
+        ids: IDs of the triggered alerts.
+
+    Returns:
+        dict: Deleted alert rows by ID, to restore them if the notification fails.
+    """
+    def _borra(con):
+        with con:
+            return {row['id']: dict(row) for row in con.execute(f"DELETE FROM alerts WHERE id IN ({','.join('?'*len(ids))}) RETURNING id, user_id, ticker, last_check, limit_value, direction, threshold;", list(ids)).fetchall()}
+    return await database.run(_borra) if ids else {}
+
+def avisa_alerta(alerta, texto):
+    """Queue the notification of a deleted alert, restoring the alert if it cannot be sent yet.
+
+    An alert whose send was cancelled at shutdown or failed with a transient error
+    is restored. After any other Telegram error, e.g. the user blocked the bot, it
+    stays deleted, otherwise it would trigger and fail again on every tick.
+
+    Args:
+        alerta: Alert row returned by borra_alertas.
+        texto: The notification text.
+    """
+    def _enviado(envio):
+        if envio.cancelled() or sender.is_transient(envio.exception()):
+            restaura_alerta(alerta)
+        elif envio.exception():
+            logging.error(f"Alert {alerta['id']} for {alerta['ticker']} and user {alerta['user_id']} could not be delivered, dropping it: {envio.exception()}")
+    outbox.send('send_message', sender.PRIORITY_ALERT, alerta['user_id'], text=texto).add_done_callback(_enviado)
+
+def restaura_alerta(alerta):
+    """Put back an alert whose notification failed, so it triggers again.
+
+    Args:
+        alerta: Alert row returned by borra_alertas.
+    """
+    logging.error(f"Alert {alerta['id']} for {alerta['ticker']} and user {alerta['user_id']} could not be sent, restoring it.")
+    def _inserta(con):
+        with con:
+            con.execute("INSERT OR IGNORE INTO alerts (id, user_id, ticker, last_check, limit_value, direction, threshold) VALUES (?, ?, ?, ?, ?, ?, ?);",
+                        (alerta['id'], alerta['user_id'], alerta['ticker'], alerta['last_check'], alerta['limit_value'], alerta['direction'], alerta['threshold']))
+    database.submit(_inserta)
+    if alerta['direction'] == alerts.CROSS:
+        alert_scheduler.schedule(alerta['ticker'], time.time()+ALERT_INTERVAL, only_if_earlier=True)
+    else:
+        alert_index.add(alerta['id'], alerta['user_id'], alerta['ticker'], alerta['direction'], alerta['threshold'], alerta['limit_value'])
+
+async def check_tick(tick):
+    """Check the price alerts of a ticker against a new price tick.
+
+    The alert index finds the triggered alerts by bisection, so the cost does not
+    depend on how many alerts the ticker has.
+
+    Args:
+        tick: The feeds.Tick with the new price.
+    """
+    ids = alert_index.triggered(tick.ticker, tick.price)
+    if not ids:
+        return
+    current_price = tick.price
+    for id in ids:
+        alert_index.remove(id)
+    for id, alerta in (await borra_alertas(ids)).items():
+        ticker, limit_value = alerta['ticker'], alerta['limit_value']
+        logging.info(f"Alert {id} for {ticker} and user {alerta['user_id']} triggered: current price {current_price}, limit {limit_value}")
+        if alerta['direction'] == alerts.BELOW:
+            avisa_alerta(alerta, f"Alert: {ticker} has fallen below your low limit of {limit_value[1:]}. Current price: {current_price}\nAlert removed.")
+        else:
+            avisa_alerta(alerta, f"Alert: {ticker} has risen above your high limit of {limit_value[1:]}. Current price: {current_price}\nAlert removed.")
+    if tick.ticker not in alert_index.tickers():
+        await quote_feed.unsubscribe([tick.ticker])
+
+async def check_cross_alerts(cambios, alertas):
+    """Check SMA crossover alerts of every ticker in one vectorized pass.
+
+    An alert triggers on the latest cross in the daily bars since the day of its
+    last check, so crosses completed between checks or while the market was
+    closed are not missed, and a new alert ignores crosses older than itself.
+
+    Args:
+        cambios: db.Batch collecting the last_check updates of the cycle.
+        alertas: Alert rows (id, user_id, ticker, limit_value, last_check) with a 'x<short>/<long>' limit value.
+    """
+    tickers = list(dict.fromkeys(alerta['ticker'] for alerta in alertas))
+    historicos = await asyncio.gather(*(history.get_history(ticker, "1y") for ticker in tickers), return_exceptions=True)
+    closes = {}
+    fechas = {} # fecha de cada barra como texto YYYY-MM-DD, ordenadas
+    for ticker, data in zip(tickers, historicos):
+        if isinstance(data, Exception):
+            logging.error(f"Error fetching history for crossover alerts of {ticker}: {data}")
+        else:
+            closes[ticker] = data['Close'].to_numpy()
+            fechas[ticker] = data.index.strftime('%Y-%m-%d').to_numpy()
+    tickers = list(closes)
+    filas = {ticker: fila for fila, ticker in enumerate(tickers)}
+    matriz = indicators.stack([closes[ticker] for ticker in tickers])
+    # una matriz de cruces por cada par de periodos, calculada para todos los tickers a la vez
+    cruces = {}
+    if tickers:
+        for periodos in {alerts.parse_cross(alerta['limit_value']) for alerta in alertas}:
+            cruces[periodos] = indicators.crossovers(indicators.sma(matriz, periodos[0]), indicators.sma(matriz, periodos[1]))
+    avisos = {}
+    for alerta in alertas:
+        id, user_id, ticker, limit_value, last_check = alerta
+        if ticker not in closes:
+            continue
+        try:
+            short_period, long_period = alerts.parse_cross(limit_value)
+            # las series van alineadas a la derecha en la matriz
+            desde = np.searchsorted(fechas[ticker], last_check[:10]) if last_check else len(closes[ticker])-1
+            ventana = cruces[(short_period, long_period)][filas[ticker], matriz.shape[1]-len(closes[ticker])+desde:]
+            con_cruce = np.flatnonzero(ventana)
+            evento = ventana[con_cruce[-1]] if con_cruce.size else 0
+            if evento:
+                avisos[id] = f"Alert: SMA {short_period} of {ticker} has crossed {'above' if evento > 0 else 'below'} SMA {long_period}. Current price: {closes[ticker][-1]}\nAlert removed."
+            else:
+                cambios.execute("UPDATE alerts SET last_check=current_timestamp WHERE id=?;", (id,))
+        except Exception as e:
+            logging.error(f"Error checking alert for {ticker} and user {user_id}: {e.__str__()}")
+    for id, alerta in (await borra_alertas(list(avisos))).items():
+        avisa_alerta(alerta, avisos[id])
+
+async def escucha_cotizaciones():
+    """Evaluate price alerts as each tick of the quote feed arrives.
+
+    The feed is subscribed only to the tickers with active price alerts.
+    """
+    await quote_feed.set_tickers(alert_index.tickers())
+    # aclosing libera la conexion aunque se cancele la tarea mientras se evalua un tick
+    async with contextlib.aclosing(quote_feed.ticks()) as ticks:
+        async for tick in ticks:
+            metrics.inc('price_ticks_total')
+            await check_tick(tick)
 
 async def actualiza_alertas():
-    """Continuously monitor stock prices and send alerts based on user-defined limits every 5 minutes.
+    """Continuously check SMA crossover alerts and notify users when they trigger.
 
-    This function runs in an infinite loop, checking for active alerts and sending notifications
-    to users when their specified price limits are breached.
+    This function runs in an infinite loop, sleeping until the crossover alerts of
+    some ticker are due and checking them every 5 minutes. Tickers whose market
+    is closed and was already checked after its last session wait for the next one.
+    Errors are logged and the loop goes on after a pause.
     """
-    global con
-    cursor= con.cursor()
     while True:
-        logging.info("Checking for alerts ...")
-        if datetime.datetime.today().weekday()>=5: # no se actualizan los fines de semana
-            logging.info("Weekend detected, skipping alert checks.")
-        else:
-            #Si no es fin de semana, se buscan las alertas
-            alertas= cursor.execute("SELECT * FROM alerts WHERE last_check < datetime('now', '-4 minutes');").fetchall()
-            if alertas:
-                for alerta in alertas:
-                    id, user_id, ticker, last_check, limit_value = alerta
-                    try:
-                        stock = yf.Ticker(ticker)
-                        current_price = stock.info['regularMarketPrice']
-                        logging.info(f"Checking alert for {ticker} and user {user_id}: current price {current_price}, limit {limit_value}")
-                        if limit_value.startswith('<') and current_price < float(limit_value[1:]):
-                            await bot.send_message(chat_id=user_id, text=f"Alert: {ticker} has fallen below your low limit of {limit_value[1:]}. Current price: {current_price}\nAlert removed.")
-                            cursor.execute(f"DELETE FROM alerts WHERE id={id};")
-                        elif limit_value.startswith('>') and current_price > float(limit_value[1:]):
-                            await bot.send_message(chat_id=user_id, text=f"Alert: {ticker} has risen above your high limit of {limit_value[1:]}. Current price: {current_price}\nAlert removed.")
-                            cursor.execute(f"DELETE FROM alerts WHERE id={id};")
-                        else:
-                            cursor.execute(f"UPDATE alerts SET last_check=current_timestamp WHERE id={id};")
-                        con.commit()
-                    except Exception as e:
-                        logging.error(f"Error checking alert for {ticker} and user {user_id}: {e.__str__()}")
-        logging.info("Alert checks completed. Next check in 5 minutes.")
-        await asyncio.sleep(5*60) # se ejecuta cada 5 minutos para revisar las alertas
-
-async def main():
+        try:
+            tickers = await alert_scheduler.wait_due()
+            revisiones = await database.fetchall(f"SELECT ticker, MIN(last_check) FROM alerts WHERE direction=? AND ticker IN ({','.join('?'*len(tickers))}) GROUP BY ticker;", (alerts.CROSS, *tickers))
+            cerrados = await market_hours.closed_until({ticker: db_time(last_check) for ticker, last_check in revisiones})
+            if cerrados:
+                logging.info(f"Markets closed, postponing the crossover alerts of {len(cerrados)} tickers.")
+                for ticker, apertura in cerrados.items():
+                    alert_scheduler.schedule(ticker, apertura)
+                metrics.inc('market_closed_skips_total', len(cerrados), loop='cross_alerts')
+                tickers = [ticker for ticker in tickers if ticker not in cerrados]
+            if tickers:
+                with metrics.timer('cycle_seconds', cycle='cross_alerts'):
+                    await comprueba_cruces(tickers)
+                alert_scheduler.done(tickers)
+        except Exception as e:
+            logging.error(f"Error in the crossover alerts loop: {e}")
+            metrics.inc('loop_errors_total', loop='cross_alerts')
+            await asyncio.sleep(LOOP_BACKOFF)
+
+def escuchando():
+    """Whether this process is the leader listening to the quote feed."""
+    return feed_task is not None and not feed_task.done()
+
+async def lider():
+    """Hold the leader lease and listen to the quote feed only while holding it.
+
+    Price alerts are evaluated tick by tick from a single feed, so only one process
+    listens. The leader reloads the alert index on every renewal to pick up the
+    alerts added through other processes, and another process takes over if it dies.
+    Errors are logged and the next renewal tries again.
+    """
+    global feed_task
+    try:
+        while True:
+            try:
+                es_lider = await leader.acquire()
+            except Exception as e:
+                logging.error(f"Error renewing the leader lease: {e}")
+                es_lider = False
+            try:
+                if es_lider:
+                    await load_alert_index()
+                    if feed_task is None:
+                        logging.info(f"Worker {WORKER_ID} is now the leader, listening to the quote feed.")
+                        feed_task = asyncio.ensure_future(escucha_cotizaciones())
+                    elif feed_task.done():
+                        logging.error(f"Quote feed stopped, restarting it: {feed_task.exception() if not feed_task.cancelled() else 'cancelled'}")
+                        feed_task = asyncio.ensure_future(escucha_cotizaciones())
+                    else:
+                        await quote_feed.set_tickers(alert_index.tickers())
+                elif feed_task is not None:
+                    logging.info(f"Worker {WORKER_ID} lost the leader lease, stopping the quote feed.")
+                    feed_task.cancel()
+                    await asyncio.gather(feed_task, return_exceptions=True)
+                    feed_task = None
+            except Exception as e:
+                # el lider sigue escuchando con el indice que ya tenia y lo recarga en la siguiente renovacion
+                logging.error(f"Error in the leader loop: {e}")
+                metrics.inc('loop_errors_total', loop='leader')
+            await asyncio.sleep(leader.ttl/3)
+    finally:
+        if feed_task is not None:
+            feed_task.cancel()
+            await asyncio.gather(feed_task, return_exceptions=True)
+            feed_task = None
+
+async def comprueba_cruces(tickers):
+    """Check the crossover alerts of some tickers and schedule their next check.
+
+    Args:
+        tickers: Tickers whose crossover alerts are due.
+    """
+    logging.info(f"Checking crossover alerts of {len(tickers)} tickers ...")
+    marcadores = ','.join('?'*len(tickers))
+    cruces = await database.fetchall(f"SELECT id, user_id, ticker, limit_value, last_check FROM alerts WHERE direction=? AND ticker IN ({marcadores});", (alerts.CROSS, *tickers))
+    if cruces:
+        async with database.batch() as cambios:
+            await check_cross_alerts(cambios, cruces)
+    pendientes = await database.fetchall(f"SELECT DISTINCT ticker FROM alerts WHERE direction=? AND ticker IN ({marcadores});", (alerts.CROSS, *tickers))
+    for row in pendientes:
+        alert_scheduler.schedule(row['ticker'], time.time()+ALERT_INTERVAL)
+    logging.info("Alert checks completed.")
+
+async def registra_comandos():
+    """Publish the command list shown by Telegram clients, in the background so polling starts first."""
+    try:
+        await bot.set_my_commands([
+            BotCommand("start","Start the bot"),
+            BotCommand("help","Show help message"),
+            BotCommand("price","Show current price of a stock, format: /price <ticker>"),
+            BotCommand("sma","Show SMA of a stock, format: /sma <ticker> [short_period] [long_period], default periods are 9 and 20"),
+            BotCommand("graph","Show price graph of a stock, format: /graph <ticker> [period], default period is 1y, valid values: 1d, 5d, 1mo, 3mo, 6mo, 1y, 2y, 5y, 10y, ytd, max"),
+            BotCommand("track","Track a stock, format: /track <ticker> [buy_price] [update_every_x_hours], optional buy_price defaults to 0 if not provided, default update every 12 hours"),
+            BotCommand("track_change_interval","Change the update interval for a tracked stock, format: /track_change_interval <ticker> <update_interval_in_hours>"),
+            BotCommand("untrack","Untrack a stock"),
+            BotCommand("tracks","Show tracked stocks"),
+            BotCommand("update_tracks","Update tracked stocks without changing the next update time"),
+            BotCommand("digest","Toggle getting all due tracks in one chart with a P&L table"),
+            BotCommand("indicators","Show technical indicators of a stock, format: /indicators <ticker>"),
+            BotCommand("alert","Add an alert for a stock, usa < for high limit and > for low limit, example: /alert AUCO.L <1.5"),
+            BotCommand("alerts","Show active alerts"),
+            BotCommand("unalert","Remove an alert, format: /unalert <stock_ticker>")
+        ])
+    except Exception as e:
+        logging.error(f"Error setting the bot commands: {e}")
+
+async def precarga():
+    """Load the heavy dependencies once the bot is already answering.
+
+    yfinance, pandas and matplotlib are imported on first use, this moves that
+    cost out of the first request that needs them.
+    """
+    await asyncio.sleep(PRELOAD_DELAY)
+    await asyncio.gather(providers.warm_up(), charts.warm_up())
+
+async def escucha_polling():
+    """Long poll Telegram for updates, removing the webhook a previous run may have registered.
+
+    Telegram refuses getUpdates with a 409 while a webhook is set.
+    """
+    try:
+        await bot.delete_webhook()
+    except Exception as e:
+        logging.error(f"Error removing the webhook before polling: {e}")
+    await bot.polling(non_stop=True)
+
+async def main(modo=BOT_MODE):
     """Initialize and start the bot with all available commands and background tasks.
 
     This is the main entry point that sets up the bot commands and starts the polling loop
     along with the price update background task.
+
+    Args:
+        modo: 'polling' to long poll Telegram, 'webhook' to receive updates with webhook.WebhookServer,
+              or 'worker' to only run background jobs next to another process that receives the updates.
     """
-    await bot.set_my_commands([
-        BotCommand("start","Start the bot"),
-        BotCommand("help","Show help message"),
-        BotCommand("price","Show current price of a stock, format: /price <ticker>"),
-        BotCommand("sma","Show SMA of a stock, format: /sma <ticker> [short_period] [long_period], default periods are 9 and 20"),
-        BotCommand("graph","Show price graph of a stock, format: /graph <ticker> [period], default period is 1y, valid values: 1d, 5d, 1mo, 3mo, 6mo, 1y, 2y, 5y, 10y, ytd, max"),
-        BotCommand("track","Track a stock, format: /track <ticker> [buy_price] [update_every_x_hours], optional buy_price defaults to 0 if not provided, default update every 12 hours"),
-        BotCommand("track_change_interval","Change the update interval for a tracked stock, format: /track_change_interval <ticker> <update_interval_in_hours>"),
-        BotCommand("untrack","Untrack a stock"),
-        BotCommand("tracks","Show tracked stocks"),
-        BotCommand("update_tracks","Update tracked stocks without changing the next update time"),
-        BotCommand("alert","Add an alert for a stock, usa < for high limit and > for low limit, example: /alert AUCO.L <1.5"),
-        BotCommand("alerts","Show active alerts"),
-        BotCommand("unalert","Remove an alert, format: /unalert <stock_ticker>")
-    ])
+    if modo not in ('polling', 'webhook', 'worker'):
+        raise ValueError(f"Invalid bot mode: {modo}")
+    await load_alert_index()
+    await load_schedules()
+    await chart_files.load()
+
+    bot.setup_middleware(metrics.HandlerMiddleware(command for handler in bot.message_handlers for command in handler['filters'].get('commands') or ()))
+    metrics.time_sends(bot)
+    metrics.gauge('queue_depth', outbox.qsize, queue='outbox')
+    metrics.gauge('scheduled', lambda: len(track_scheduler), kind='tracks')
+    metrics.gauge('scheduled', lambda: len(alert_scheduler), kind='cross_alert_tickers')
+    metrics.gauge('price_alerts', lambda: len(alert_index))
 
     try:
         bot.add_custom_filter(asyncio_filters.StateFilter(bot))
+        outbox.start()
+        asyncio.ensure_future(registra_comandos())
+        asyncio.ensure_future(precarga())
         L = await asyncio.gather(
             # update_cambios(),
             actualiza_tracks(),
             actualiza_alertas(),
-            bot.polling(non_stop=True)
+            lider(),
+            metrics.watch_loop_lag(),
+            metrics.serve(),
+            *([webhook.WebhookServer(bot).serve()] if modo == 'webhook' else [escucha_polling()] if modo == 'polling' else [])
             )
     finally:
+        await outbox.stop()
         await bot.close()
+        await quote_feed.close()
+        await leader.release()
+        executors.shutdown()
+        database.close()
 
 def init_db():
     """Initialize the database connection and create the tracks table if it doesn't exist.
@@ -520,16 +1039,71 @@ def init_db():
     This function sets up the SQLite database for storing tracked stocks information.
     """
     logging.info("Initializing database connection...")
-    global con
-    con = sqlite3.connect("bot.db")
-    con.row_factory = sqlite3.Row
+    database.call(crear_tablas)
+
+def crear_tablas(con):
+    """Create the tables and indexes and migrate databases from older versions.
+
+    Args:
+        con: The SQLite connection, runs in the database thread.
+    """
     # Create the tracks table if it doesn't exist
-    con.execute("CREATE TABLE IF NOT EXISTS tracks (id INTEGER PRIMARY KEY AUTOINCREMENT, user_id INTEGER, ticker TEXT, next_check TIMESTAMP DEFAULT CURRENT_TIMESTAMP, buy_price REAL NOT NULL DEFAULT 0, update_interval INTEGER NOT NULL DEFAULT 12);")
-    con.execute("CREATE TABLE IF NOT EXISTS alerts (id INTEGER PRIMARY KEY AUTOINCREMENT, user_id INTEGER, ticker TEXT, last_check TIMESTAMP DEFAULT CURRENT_TIMESTAMP, limit_value TEXT NOT NULL);")
+    con.execute("CREATE TABLE IF NOT EXISTS tracks (id INTEGER PRIMARY KEY AUTOINCREMENT, user_id INTEGER, ticker TEXT, next_check TIMESTAMP DEFAULT CURRENT_TIMESTAMP, buy_price REAL NOT NULL DEFAULT 0, update_interval INTEGER NOT NULL DEFAULT 12, last_sent TIMESTAMP);")
+    # last_sent es NULL hasta el primer envio, un seguimiento nuevo no se aplaza aunque el mercado este cerrado
+    if 'last_sent' not in [columna['name'] for columna in con.execute("PRAGMA table_info(tracks);").fetchall()]:
+        con.execute("ALTER TABLE tracks ADD COLUMN last_sent TIMESTAMP;")
+    con.execute("CREATE TABLE IF NOT EXISTS alerts (id INTEGER PRIMARY KEY AUTOINCREMENT, user_id INTEGER, ticker TEXT, last_check TIMESTAMP DEFAULT CURRENT_TIMESTAMP, limit_value TEXT NOT NULL, direction TEXT, threshold REAL);")
+    # las bases de datos anteriores guardan el limite solo como texto, se migran a direccion y umbral
+    columnas = [columna['name'] for columna in con.execute("PRAGMA table_info(alerts);").fetchall()]
+    if 'direction' not in columnas:
+        con.execute("ALTER TABLE alerts ADD COLUMN direction TEXT;")
+        con.execute("ALTER TABLE alerts ADD COLUMN threshold REAL;")
+    for id, limit_value in con.execute("SELECT id, limit_value FROM alerts WHERE direction IS NULL;").fetchall():
+        try:
+            direction, threshold = alerts.parse_limit(limit_value)
+        except ValueError:
+            logging.error(f"Invalid limit value {limit_value} in alert {id}, it will not be checked.")
+            continue
+        con.execute("UPDATE alerts SET direction=?, threshold=? WHERE id=?;", (direction, threshold, id))
+    jobs.crear_tablas(con)
+    quotes.crear_tablas(con)
+    con.execute("CREATE TABLE IF NOT EXISTS user_settings (user_id INTEGER PRIMARY KEY, digest INTEGER NOT NULL DEFAULT 0);")
+    con.execute("CREATE TABLE IF NOT EXISTS chart_files (hash TEXT PRIMARY KEY, file_id TEXT NOT NULL, last_used TIMESTAMP DEFAULT CURRENT_TIMESTAMP);")
+    con.execute("CREATE INDEX IF NOT EXISTS chart_files_last_used ON chart_files (last_used);")
+    con.execute("CREATE INDEX IF NOT EXISTS tracks_user_ticker ON tracks (user_id, ticker);")
+    con.execute("CREATE INDEX IF NOT EXISTS tracks_next_check ON tracks (next_check);")
+    con.execute("CREATE INDEX IF NOT EXISTS alerts_user_ticker ON alerts (user_id, ticker);")
+    con.execute("CREATE INDEX IF NOT EXISTS alerts_ticker_direction ON alerts (ticker, direction);")
+    con.commit()
 
-if __name__ == '__main__':
-    if '-log' in os.sys.argv:
+async def load_alert_index():
+    """Rebuild the in-memory alert index from the alerts table."""
+    alert_index.load(await database.fetchall("SELECT id, user_id, ticker, direction, threshold, limit_value FROM alerts WHERE direction IN (?, ?);", (alerts.BELOW, alerts.ABOVE)))
+    logging.info(f"Alert index loaded with {len(alert_index)} price alerts.")
+
+async def load_schedules():
+    """Sync the track and alert job queues with the tracks and alerts tables.
+
+    Jobs claimed by a running worker keep their claim, so any worker can call this.
+    """
+    seguimientos = [(id, db_time(next_check)) for id, next_check in await database.fetchall("SELECT id, next_check FROM tracks WHERE next_check IS NOT NULL;")]
+    cruces = [(ticker, db_time(last_check)+ALERT_INTERVAL) for ticker, last_check in
+              await database.fetchall("SELECT ticker, MIN(last_check) FROM alerts WHERE direction=? GROUP BY ticker;", (alerts.CROSS,))]
+    await track_scheduler.sync(seguimientos)
+    await alert_scheduler.sync(cruces)
+    logging.info(f"Scheduled {len(seguimientos)} tracks and the crossover alerts of {len(cruces)} tickers.")
+
+def run(argv):
+    """Start the bot from the command line, see main.py.
+
+    Args:
+        argv: Command line arguments, '-log', '-webhook' and '-worker' are recognized.
+    """
+    if '-log' in argv:
         logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s', filename='bot.log')
         logging.info("Bot started with info logging enabled.")
     init_db()
-    asyncio.run(main())
+    asyncio.run(main('webhook' if '-webhook' in argv else 'worker' if '-worker' in argv else BOT_MODE))
+
+if __name__ == '__main__':
+    run(os.sys.argv)
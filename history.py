@@ -0,0 +1,144 @@
+import datetime, logging, sqlite3, threading, time
+from collections import defaultdict
+import executors, metrics, providers
+
+DB_PATH = 'history.db' # junto a bot.db
+REFRESH_SECONDS = 5*60 # no se vuelve a pedir el delta de un ticker antes de este tiempo
+DOWNLOAD_TIMEOUT = 60 # segundos, la primera descarga de 'max' puede ser larga
+
+PERIOD_DAYS = {'1mo': 31, '3mo': 92, '6mo': 183, '1y': 366, '2y': 731, '5y': 1827, '10y': 3653}
+PERIOD_BARS = {'1d': 1, '5d': 5}
+COLUMNS = ['Open', 'High', 'Low', 'Close', 'Volume']
+
+def period_start(period, today=None):
+    """Get the first date a period covers.
+
+    Args:
+        period: The time period. Valid values: 1d, 5d, 1mo, 3mo, 6mo, 1y, 2y, 5y, 10y, ytd, max.
+        today: Reference date, defaults to today.
+
+    Returns:
+        datetime.date: First date of the period, or None for 'max'.
+    """
+    today = today or datetime.date.today()
+    if period == 'max':
+        return None
+    if period == 'ytd':
+        return datetime.date(today.year, 1, 1)
+    if period in PERIOD_BARS:
+        # margen para fines de semana y festivos, luego se recortan las barras
+        return today-datetime.timedelta(days=PERIOD_BARS[period]*2+7)
+    if period in PERIOD_DAYS:
+        return today-datetime.timedelta(days=PERIOD_DAYS[period])
+    raise ValueError(f"Invalid period: {period}")
+
+class HistoryStore:
+    """Persistent store of daily OHLCV bars that only downloads what is missing.
+
+    Each ticker remembers the earliest date it covers. Requests inside that span
+    only fetch the bars since the last stored one, older periods trigger a single
+    backfill, and any period is then served as a slice of the stored bars.
+    """
+
+    def __init__(self, path=DB_PATH, refresh_seconds=REFRESH_SECONDS):
+        """Open the store, creating its tables if needed.
+
+        Args:
+            path: Path of the SQLite database file.
+            refresh_seconds: Minimum age of the last download before fetching a new delta.
+        """
+        self.refresh_seconds = refresh_seconds
+        self.con = sqlite3.connect(path, check_same_thread=False)
+        self.con.execute("PRAGMA journal_mode=WAL;") # varios procesos del bot comparten el fichero
+        self.con.execute("CREATE TABLE IF NOT EXISTS bars (ticker TEXT NOT NULL, ts TEXT NOT NULL, open REAL, high REAL, low REAL, close REAL, volume REAL, PRIMARY KEY (ticker, ts)) WITHOUT ROWID;")
+        self.con.execute("CREATE TABLE IF NOT EXISTS coverage (ticker TEXT PRIMARY KEY, first_ts TEXT, complete INTEGER NOT NULL DEFAULT 0, fetched_at REAL NOT NULL);")
+        self.con.commit()
+        self._db_lock = threading.Lock()
+        self._locks_lock = threading.Lock()
+        self._ticker_locks = defaultdict(threading.Lock)
+
+    def _ticker_lock(self, ticker):
+        with self._locks_lock:
+            return self._ticker_locks[ticker]
+
+    def _download(self, ticker, start=None):
+        with metrics.timer('upstream_seconds', call='history'):
+            return providers.provider.history(ticker, start)
+
+    def _save(self, ticker, data, first_ts, complete, replace=False):
+        rows = [(ticker, ts.strftime('%Y-%m-%d'), row.Open, row.High, row.Low, row.Close, row.Volume)
+                for ts, row in zip(data.index, data[COLUMNS].itertuples(index=False))]
+        with self._db_lock:
+            if replace:
+                self.con.execute("DELETE FROM bars WHERE ticker=?;", (ticker,))
+            self.con.executemany("INSERT OR REPLACE INTO bars (ticker, ts, open, high, low, close, volume) VALUES (?, ?, ?, ?, ?, ?, ?);", rows)
+            self.con.execute("INSERT OR REPLACE INTO coverage (ticker, first_ts, complete, fetched_at) VALUES (?, ?, ?, ?);", (ticker, first_ts, int(complete), time.time()))
+            self.con.commit()
+
+    def _sync(self, ticker, start):
+        with self._db_lock:
+            coverage = self.con.execute("SELECT first_ts, complete, fetched_at FROM coverage WHERE ticker=?;", (ticker,)).fetchone()
+            last_ts = self.con.execute("SELECT MAX(ts) FROM bars WHERE ticker=?;", (ticker,)).fetchone()[0]
+        if coverage:
+            first_ts, complete, fetched_at = coverage
+            covered = complete or (start is not None and first_ts <= start.isoformat())
+        if not coverage or not covered:
+            logging.info(f"Downloading history for {ticker} since {start or 'the beginning'}.")
+            data = self._download(ticker, start)
+            if not data.empty:
+                self._save(ticker, data, start.isoformat() if start else None, start is None, replace=True)
+            return
+        if time.time()-fetched_at < self.refresh_seconds:
+            return
+        # se vuelve a pedir la ultima barra guardada porque puede haber cambiado durante la sesion
+        data = self._download(ticker, datetime.date.fromisoformat(last_ts) if last_ts else None)
+        actions = [column for column in ('Dividends', 'Stock Splits') if column in data]
+        if actions and (data[actions].iloc[1:] != 0).any().any():
+            # un dividendo o split nuevo cambia los precios ajustados de todo el historico
+            logging.info(f"Corporate action detected for {ticker}, downloading its history again.")
+            data = self._download(ticker, None if complete else datetime.date.fromisoformat(first_ts))
+            if not data.empty:
+                self._save(ticker, data, first_ts, complete, replace=True)
+        else:
+            self._save(ticker, data, first_ts, complete)
+
+    def get(self, ticker, period='1y'):
+        """Get the daily bars of a ticker for a period, downloading only the missing ones.
+
+        Args:
+            ticker: The stock ticker symbol.
+            period: The time period. Valid values: 1d, 5d, 1mo, 3mo, 6mo, 1y, 2y, 5y, 10y, ytd, max.
+
+        Returns:
+            DataFrame: Open, High, Low, Close and Volume columns indexed by date.
+        """
+        start = period_start(period)
+        with self._ticker_lock(ticker):
+            self._sync(ticker, start)
+        with self._db_lock:
+            rows = self.con.execute("SELECT ts, open, high, low, close, volume FROM bars WHERE ticker=? AND ts>=? ORDER BY ts;",
+                                    (ticker, start.isoformat() if start else '')).fetchall()
+        import pandas as pd # carga perezosa, ya esta importado si se ha descargado algo
+        data = pd.DataFrame([row[1:] for row in rows], columns=COLUMNS, index=pd.DatetimeIndex([row[0] for row in rows], name='Date'))
+        if data.empty:
+            raise ValueError(f"No price history for {ticker}.")
+        if period in PERIOD_BARS:
+            data = data.iloc[-PERIOD_BARS[period]:]
+        return data
+
+store = None
+
+async def get_history(ticker, period='1y'):
+    """Get the daily bars of a ticker for a period from the shared store.
+
+    Args:
+        ticker: The stock ticker symbol.
+        period: The time period. Valid values: 1d, 5d, 1mo, 3mo, 6mo, 1y, 2y, 5y, 10y, ytd, max.
+
+    Returns:
+        DataFrame: Open, High, Low, Close and Volume columns indexed by date.
+    """
+    global store
+    if store is None:
+        store = HistoryStore()
+    return await executors.run_io(store.get, ticker, period, timeout=DOWNLOAD_TIMEOUT)
@@ -0,0 +1,166 @@
+import numpy as np
+
+# Todas las funciones aceptan un array 1D (un ticker) o 2D (un ticker por fila,
+# barras por columna, alineadas a la derecha y rellenas con NaN por la izquierda)
+# y devuelven arrays con la misma forma.
+
+def _as_2d(values):
+    x = np.asarray(values, dtype=float)
+    return x.reshape(1, -1) if x.ndim == 1 else x
+
+def _same_shape(result, values):
+    return result.reshape(-1) if np.ndim(values) == 1 else result
+
+def stack(series_list):
+    """Stack price series of different lengths into one right aligned 2D array.
+
+    Args:
+        series_list: Sequence of 1D price sequences, one per ticker.
+
+    Returns:
+        ndarray: Array of shape (len(series_list), longest length), padded with NaN on the left.
+    """
+    width = max((len(series) for series in series_list), default=0)
+    out = np.full((len(series_list), width), np.nan)
+    for row, series in enumerate(series_list):
+        if len(series):
+            out[row, width-len(series):] = np.asarray(series, dtype=float)
+    return out
+
+def _rolling_sum(x, period):
+    valid = ~np.isnan(x)
+    zeros = np.zeros((x.shape[0], 1))
+    total = np.concatenate([zeros, np.cumsum(np.where(valid, x, 0.0), axis=1)], axis=1)
+    count = np.concatenate([zeros, np.cumsum(valid, axis=1)], axis=1)
+    window_total = total[:, period:]-total[:, :-period]
+    window_count = count[:, period:]-count[:, :-period]
+    out = np.full(x.shape, np.nan)
+    out[:, period-1:] = np.where(window_count == period, window_total, np.nan)
+    return out
+
+def _ewm(x, alpha):
+    out = np.full(x.shape, np.nan)
+    prev = np.full(x.shape[0], np.nan)
+    for t in range(x.shape[1]):
+        cur = x[:, t]
+        prev = np.where(np.isnan(prev), cur, np.where(np.isnan(cur), prev, alpha*cur+(1-alpha)*prev))
+        out[:, t] = prev
+    return out
+
+def sma(values, period):
+    """Simple moving average.
+
+    Args:
+        values: 1D or 2D array of prices.
+        period: Number of bars in the window.
+
+    Returns:
+        ndarray: SMA values, NaN until a full window is available.
+    """
+    return _same_shape(_rolling_sum(_as_2d(values), period)/period, values)
+
+def ema(values, period):
+    """Exponential moving average seeded with the first price.
+
+    Args:
+        values: 1D or 2D array of prices.
+        period: Span of the average, alpha is 2/(period+1).
+
+    Returns:
+        ndarray: EMA values.
+    """
+    return _same_shape(_ewm(_as_2d(values), 2/(period+1)), values)
+
+def rsi(values, period=14):
+    """Relative strength index with Wilder smoothing.
+
+    Args:
+        values: 1D or 2D array of prices.
+        period: Smoothing period.
+
+    Returns:
+        ndarray: RSI values between 0 and 100, NaN for the first bar.
+    """
+    x = _as_2d(values)
+    delta = np.full(x.shape, np.nan)
+    delta[:, 1:] = np.diff(x, axis=1)
+    gains = _ewm(np.where(np.isnan(delta), np.nan, np.clip(delta, 0, None)), 1/period)
+    losses = _ewm(np.where(np.isnan(delta), np.nan, np.clip(-delta, 0, None)), 1/period)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        out = np.where(losses == 0, 100.0, 100-100/(1+gains/losses))
+    out[np.isnan(gains)] = np.nan
+    return _same_shape(out, values)
+
+def macd(values, fast=12, slow=26, signal=9):
+    """Moving average convergence divergence.
+
+    Args:
+        values: 1D or 2D array of prices.
+        fast: Period of the fast EMA.
+        slow: Period of the slow EMA.
+        signal: Period of the signal line EMA.
+
+    Returns:
+        tuple: (macd, signal, histogram) arrays.
+    """
+    x = _as_2d(values)
+    line = _ewm(x, 2/(fast+1))-_ewm(x, 2/(slow+1))
+    signal_line = _ewm(line, 2/(signal+1))
+    return tuple(_same_shape(out, values) for out in (line, signal_line, line-signal_line))
+
+def bollinger(values, period=20, width=2):
+    """Bollinger bands around a simple moving average.
+
+    Args:
+        values: 1D or 2D array of prices.
+        period: Number of bars in the window.
+        width: Number of standard deviations between the middle and each band.
+
+    Returns:
+        tuple: (middle, upper, lower) arrays.
+    """
+    x = _as_2d(values)
+    mean = _rolling_sum(x, period)/period
+    variance = np.clip(_rolling_sum(x*x, period)/period-mean*mean, 0, None)
+    deviation = width*np.sqrt(variance)
+    return tuple(_same_shape(out, values) for out in (mean, mean+deviation, mean-deviation))
+
+def crossovers(fast, slow):
+    """Detect the bars where a fast line crosses a slow one.
+
+    Args:
+        fast: 1D or 2D array of the fast line, e.g. a short SMA.
+        slow: Array of the slow line with the same shape.
+
+    Touching the slow line and going back is not a cross: bars where both lines
+    are equal keep the side of the last bar where they were not.
+
+    Returns:
+        ndarray: +1 where fast crosses above slow, -1 where it crosses below, 0 elsewhere.
+    """
+    diff = _as_2d(fast)-_as_2d(slow)
+    side = np.nan_to_num(np.sign(diff)) # 0 si son iguales o faltan datos
+    # indice del ultimo lado distinto de 0 en cada barra, -1 si aun no hay ninguno
+    last = np.maximum.accumulate(np.where(side != 0, np.arange(side.shape[1]), -1), axis=1)
+    carried = np.where(last >= 0, np.take_along_axis(side, np.maximum(last, 0), axis=1), 0)
+    out = np.zeros(diff.shape, dtype=int)
+    previous, current = carried[:, :-1], carried[:, 1:]
+    out[:, 1:][(previous < 0) & (current > 0)] = 1
+    out[:, 1:][(previous > 0) & (current < 0)] = -1
+    return _same_shape(out, fast)
+
+def last_crossover(fast, slow):
+    """Find the most recent crossover of each row.
+
+    Args:
+        fast: 1D or 2D array of the fast line.
+        slow: Array of the slow line with the same shape.
+
+    Returns:
+        tuple: (index, direction) arrays, index is -1 and direction 0 for rows that never crossed.
+    """
+    events = _as_2d(crossovers(fast, slow))
+    has_event = events != 0
+    index = np.where(has_event.any(axis=1), events.shape[1]-1-np.argmax(has_event[:, ::-1], axis=1), -1)
+    direction = np.where(index >= 0, events[np.arange(events.shape[0]), index], 0)
+    return index, direction
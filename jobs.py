@@ -0,0 +1,179 @@
+import asyncio, os, socket, time, uuid
+
+JOB_POLL = 15 # segundos maximos sin mirar la cola, otro proceso puede haber adelantado un trabajo
+JOB_LEASE = 15*60 # segundos que un trabajo reclamado queda reservado antes de volver a la cola
+JOB_BATCH = int(os.getenv('JOB_BATCH', 200)) # trabajos reclamados de una vez, el resto queda para otros procesos
+LEADER_TTL = 30 # segundos que dura el liderazgo si no se renueva
+
+def worker_id():
+    """Build an identifier for this process that is unique across hosts and restarts.
+
+    Returns:
+        str: host:pid:random suffix.
+    """
+    return f'{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}'
+
+def crear_tablas(con):
+    """Create the job queue and lease tables.
+
+    Args:
+        con: The SQLite connection, runs in the database thread.
+    """
+    # key sin tipo para guardar tal cual ids enteros y tickers
+    con.execute("CREATE TABLE IF NOT EXISTS jobs (kind TEXT NOT NULL, key NOT NULL, due REAL NOT NULL, claimed_by TEXT, claimed_until REAL, PRIMARY KEY (kind, key));")
+    con.execute("CREATE INDEX IF NOT EXISTS jobs_kind_due ON jobs (kind, due);")
+    con.execute("CREATE TABLE IF NOT EXISTS leases (name TEXT PRIMARY KEY, owner TEXT NOT NULL, expires REAL NOT NULL);")
+
+class JobQueue:
+    """Due jobs of one kind stored in the jobs table and shared by every bot process.
+
+    It has the interface of scheduler.DeadlineScheduler, but wait_due() claims
+    the due keys atomically, so each one goes to a single process. A claim lasts
+    JOB_LEASE seconds. Scheduling a key again releases it, done() removes the
+    keys that were not rescheduled, and the claims of a process that dies expire
+    so the jobs run elsewhere.
+
+    Writes are queued in the database thread without waiting, in order, so the
+    call sites stay synchronous.
+    """
+
+    def __init__(self, database, kind, owner, batch=JOB_BATCH, lease=JOB_LEASE):
+        """Create the queue.
+
+        Args:
+            database: The db.Database holding the jobs table.
+            kind: Job kind, e.g. 'track'.
+            owner: Identifier of this process, see worker_id().
+            batch: Maximum keys claimed by one wait_due().
+            lease: Seconds a claim lasts.
+        """
+        self.database = database
+        self.kind = kind
+        self.owner = owner
+        self.batch = batch
+        self.lease = lease
+        self._pending = 0
+        self._wakeup = asyncio.Event()
+
+    def _write(self, sql, params):
+        def _execute(con):
+            with con:
+                con.execute(sql, params)
+        self.database.submit(_execute)
+        self._wakeup.set()
+
+    def schedule(self, key, when, only_if_earlier=False):
+        """Set the due time of a key, replacing any previous one and releasing its claim.
+
+        Args:
+            key: Job key, e.g. a track ID.
+            when: Due time as a Unix timestamp.
+            only_if_earlier: Keep the current due time if the key is already due earlier.
+        """
+        self._write("INSERT INTO jobs (kind, key, due) VALUES (?, ?, ?) ON CONFLICT (kind, key) DO UPDATE SET due=excluded.due, claimed_by=NULL, claimed_until=NULL WHERE NOT ? OR excluded.due<jobs.due;",
+                    (self.kind, key, when, only_if_earlier))
+
+    def cancel(self, key):
+        """Remove a key from the queue.
+
+        Args:
+            key: The job key.
+        """
+        self._write("DELETE FROM jobs WHERE kind=? AND key=?;", (self.kind, key))
+
+    def done(self, keys):
+        """Remove claimed keys that were not scheduled again.
+
+        Args:
+            keys: Keys returned by wait_due().
+        """
+        keys = list(keys)
+        if keys:
+            self._write(f"DELETE FROM jobs WHERE kind=? AND claimed_by=? AND key IN ({','.join('?'*len(keys))});", (self.kind, self.owner, *keys))
+
+    async def sync(self, rows):
+        """Make the queue match the due times stored in the bot tables.
+
+        Keys missing from rows are removed and claimed keys keep their claim.
+
+        Args:
+            rows: Iterable of (key, due) pairs.
+        """
+        now = time.time()
+        rows = list(rows)
+        await self.database.run(self._sync, rows, now)
+        self._wakeup.set()
+
+    def _sync(self, con, rows, now):
+        with con:
+            con.execute("CREATE TEMP TABLE IF NOT EXISTS sync_keys (key PRIMARY KEY);")
+            con.execute("DELETE FROM sync_keys;")
+            con.executemany("INSERT OR IGNORE INTO sync_keys (key) VALUES (?);", [(key,) for key, _ in rows])
+            con.execute("DELETE FROM jobs WHERE kind=? AND key NOT IN (SELECT key FROM sync_keys);", (self.kind,))
+            con.executemany("INSERT INTO jobs (kind, key, due) VALUES (?, ?, ?) ON CONFLICT (kind, key) DO UPDATE SET due=excluded.due WHERE claimed_until IS NULL OR claimed_until<?;",
+                            [(self.kind, key, due, now) for key, due in rows])
+
+    def _claim(self, con, now):
+        with con:
+            claimed = con.execute("UPDATE jobs SET claimed_by=?, claimed_until=? WHERE rowid IN (SELECT rowid FROM jobs WHERE kind=? AND due<=? AND (claimed_until IS NULL OR claimed_until<?) ORDER BY due LIMIT ?) RETURNING key, due;",
+                                  (self.owner, now+self.lease, self.kind, now, now, self.batch)).fetchall()
+        # RETURNING no sigue el ORDER BY de la subconsulta
+        keys = [row[0] for row in sorted(claimed, key=lambda row: row[1])]
+        pending, next_due = con.execute("SELECT COUNT(*), MIN(MAX(due, COALESCE(claimed_until, 0))) FROM jobs WHERE kind=?;", (self.kind,)).fetchone()
+        return keys, pending, next_due
+
+    async def wait_due(self):
+        """Sleep until at least one key is due and claim the due keys.
+
+        Returns:
+            list: Keys claimed by this process. Schedule them again or pass them to done().
+        """
+        while True:
+            self._wakeup.clear()
+            now = time.time()
+            keys, self._pending, next_due = await self.database.run(self._claim, now)
+            if keys:
+                return keys
+            timeout = JOB_POLL if next_due is None else min(max(next_due-now, 0), JOB_POLL)
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout)
+            except asyncio.TimeoutError:
+                pass
+
+    def __len__(self):
+        """Number of queued keys of this kind at the last check, claimed or not."""
+        return self._pending
+
+class Lease:
+    """Named lease held by at most one process at a time, e.g. to elect a leader."""
+
+    def __init__(self, database, name, owner, ttl=LEADER_TTL):
+        """Create the lease.
+
+        Args:
+            database: The db.Database holding the leases table.
+            name: Lease name.
+            owner: Identifier of this process, see worker_id().
+            ttl: Seconds the lease lasts unless renewed.
+        """
+        self.database = database
+        self.name = name
+        self.owner = owner
+        self.ttl = ttl
+
+    async def acquire(self):
+        """Take the lease if it is free or expired, or renew it if this process holds it.
+
+        Returns:
+            bool: True if this process holds the lease for the next ttl seconds.
+        """
+        def _acquire(con):
+            now = time.time()
+            with con:
+                return con.execute("INSERT INTO leases (name, owner, expires) VALUES (?, ?, ?) ON CONFLICT (name) DO UPDATE SET owner=excluded.owner, expires=excluded.expires WHERE leases.owner=excluded.owner OR leases.expires<? RETURNING owner;",
+                                   (self.name, self.owner, now+self.ttl, now)).fetchone() is not None
+        return await self.database.run(_acquire)
+
+    async def release(self):
+        """Give the lease up if this process holds it."""
+        await self.database.execute("DELETE FROM leases WHERE name=? AND owner=?;", (self.name, self.owner))
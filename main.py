@@ -0,0 +1,14 @@
+"""Command line entry point of the bot.
+
+    python main.py [-log] [-webhook | -worker]
+
+Every render process of executors runs the main script again as __mp_main__
+when it starts, so this script only imports the bot inside the __main__ guard.
+Running finanzasbot.py directly also works, but then each render process loads
+the whole bot: its imports, the database and the Telegram client.
+"""
+import sys
+
+if __name__ == '__main__':
+    import finanzasbot
+    finanzasbot.run(sys.argv)
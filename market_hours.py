@@ -0,0 +1,290 @@
+import asyncio, datetime, time
+from zoneinfo import ZoneInfo
+import quotes
+
+DATA_DELAY = datetime.timedelta(minutes=30) # Yahoo publica las cotizaciones con hasta 20 minutos de retraso
+SEARCH_DAYS = 15 # dias que se buscan hacia delante o atras, mas que cualquier racha de festivos
+
+clock = time.time # el benchmark lo sustituye para fijar la hora que ve el calendario
+
+def easter(year):
+    """Compute Easter Sunday of the Gregorian calendar.
+
+    Args:
+        year: The year.
+
+    Returns:
+        date: Easter Sunday.
+    """
+    # algoritmo anonimo gregoriano (Meeus/Jones/Butcher)
+    a, b, c = year % 19, year // 100, year % 100
+    d, e = divmod(b, 4)
+    f = (b+8) // 25
+    g = (b-f+1) // 3
+    h = (19*a+b-d-g+15) % 30
+    i, k = divmod(c, 4)
+    l = (32+2*e+2*i-h-k) % 7
+    m = (a+11*h+22*l) // 451
+    month, day = divmod(h+l-7*m+114, 31)
+    return datetime.date(year, month, day+1)
+
+def nth_weekday(year, month, weekday, n):
+    """Find the n-th given weekday of a month, e.g. the third Monday of January.
+
+    Args:
+        year: The year.
+        month: The month.
+        weekday: Day of the week, 0 for Monday.
+        n: Position from 1, or -1 for the last one.
+
+    Returns:
+        date: The day.
+    """
+    if n > 0:
+        first = datetime.date(year, month, 1)
+        return first+datetime.timedelta(days=(weekday-first.weekday()) % 7+7*(n-1))
+    last = datetime.date(year+month // 12, month % 12+1, 1)-datetime.timedelta(days=1)
+    return last-datetime.timedelta(days=(last.weekday()-weekday) % 7)
+
+def _observed_us(day):
+    # festivos en sabado se pasan al viernes y en domingo al lunes
+    if day.weekday() == 5:
+        return day-datetime.timedelta(days=1)
+    if day.weekday() == 6:
+        return day+datetime.timedelta(days=1)
+    return day
+
+def _substitute_uk(days):
+    # los festivos en fin de semana pasan al siguiente dia laborable libre
+    observed = set()
+    for day in sorted(days):
+        while day.weekday() >= 5 or day in observed:
+            day += datetime.timedelta(days=1)
+        observed.add(day)
+    return observed
+
+def _us_holidays(year):
+    new_year = datetime.date(year, 1, 1)
+    days = {new_year if new_year.weekday() != 6 else new_year+datetime.timedelta(days=1), # en sabado no se pasa al viernes
+            nth_weekday(year, 1, 0, 3), nth_weekday(year, 2, 0, 3), easter(year)-datetime.timedelta(days=2),
+            nth_weekday(year, 5, 0, -1), _observed_us(datetime.date(year, 7, 4)), nth_weekday(year, 9, 0, 1),
+            nth_weekday(year, 11, 3, 4), _observed_us(datetime.date(year, 12, 25))}
+    if year >= 2022:
+        days.add(_observed_us(datetime.date(year, 6, 19)))
+    return days
+
+def _uk_holidays(year):
+    pascua = easter(year)
+    return _substitute_uk([datetime.date(year, 1, 1), datetime.date(year, 12, 25), datetime.date(year, 12, 26)]) | {
+        pascua-datetime.timedelta(days=2), pascua+datetime.timedelta(days=1),
+        nth_weekday(year, 5, 0, 1), nth_weekday(year, 5, 0, -1), nth_weekday(year, 8, 0, -1)}
+
+def _europe_holidays(*fixed, easter_offsets=(-2, 1)):
+    # festivos fijos (mes, dia) mas los relativos al domingo de Pascua
+    def holidays(year):
+        pascua = easter(year)
+        return {datetime.date(year, month, day) for month, day in fixed} | {pascua+datetime.timedelta(days=offset) for offset in easter_offsets}
+    return holidays
+
+class Exchange:
+    """Trading calendar of an exchange: session hours in its timezone, weekends and holidays.
+
+    A session is taken to last DATA_DELAY past the close, until the delayed
+    closing quotes have arrived. Holidays are computed once per year.
+    """
+
+    def __init__(self, code, timezone, opens, closes, holidays=None):
+        """Create the calendar.
+
+        Args:
+            code: Short name of the exchange, e.g. 'BME'.
+            timezone: IANA timezone of the session hours.
+            opens: Local opening time.
+            closes: Local closing time.
+            holidays: Callable taking a year and returning the set of closed weekdays.
+        """
+        self.code = code
+        self.zone = ZoneInfo(timezone)
+        self.opens = opens
+        self.closes = closes
+        self._holidays = holidays or (lambda year: set())
+        self._years = {}
+
+    def holidays(self, year):
+        """Get the holidays of a year.
+
+        Args:
+            year: The year.
+
+        Returns:
+            set: Dates the exchange is closed on a weekday.
+        """
+        if year not in self._years:
+            self._years[year] = frozenset(self._holidays(year))
+        return self._years[year]
+
+    def is_trading_day(self, day):
+        """Check if the exchange has a session on a date.
+
+        Args:
+            day: The local date.
+
+        Returns:
+            bool: True on weekdays that are not holidays.
+        """
+        return day.weekday() < 5 and day not in self.holidays(day.year)
+
+    def _session(self, day):
+        # inicio y fin de la sesion en timestamps, el fin incluye el retraso de los datos
+        start = datetime.datetime.combine(day, self.opens, self.zone)
+        end = datetime.datetime.combine(day, self.closes, self.zone)+DATA_DELAY
+        return start.timestamp(), end.timestamp()
+
+    def _days(self, when, step):
+        day = datetime.datetime.fromtimestamp(when, self.zone).date()-datetime.timedelta(days=step)
+        for _ in range(SEARCH_DAYS+1):
+            if self.is_trading_day(day):
+                yield self._session(day)
+            day += datetime.timedelta(days=step)
+
+    def is_open(self, when=None):
+        """Check if quotes are changing: a session is open or its close is still arriving.
+
+        Args:
+            when: Unix timestamp, now if None.
+
+        Returns:
+            bool: True during a session and DATA_DELAY after it.
+        """
+        when = clock() if when is None else when
+        for start, end in self._days(when, 1):
+            if when < start:
+                return False
+            if when < end:
+                return True
+        return False
+
+    def next_open(self, when=None):
+        """Find when quotes start changing again.
+
+        Args:
+            when: Unix timestamp, now if None.
+
+        Returns:
+            float: Start of the next session, or when itself if a session is open.
+        """
+        when = clock() if when is None else when
+        for start, end in self._days(when, 1):
+            if when < end:
+                return max(start, when)
+        return when+SEARCH_DAYS*24*60*60
+
+    def last_update(self, when=None):
+        """Find when the quotes last stopped changing.
+
+        Args:
+            when: Unix timestamp, now if None.
+
+        Returns:
+            float: End of the last finished session, including DATA_DELAY.
+        """
+        when = clock() if when is None else when
+        for start, end in self._days(when, -1):
+            if end <= when:
+                return end
+        return 0
+
+    def has_new_data(self, since, when=None):
+        """Check if quotes may have changed since a moment.
+
+        Args:
+            since: Unix timestamp of the last fetch.
+            when: Unix timestamp, now if None.
+
+        Returns:
+            bool: True if a session is open or one finished after since.
+        """
+        when = clock() if when is None else when
+        return self.is_open(when) or self.last_update(when) > since
+
+_german_holidays = _europe_holidays((1, 1), (5, 1), (12, 24), (12, 25), (12, 26), (12, 31))
+
+EXCHANGES = {exchange.code: exchange for exchange in [
+    Exchange('US', 'America/New_York', datetime.time(9, 30), datetime.time(16), _us_holidays),
+    Exchange('LSE', 'Europe/London', datetime.time(8), datetime.time(16, 30), _uk_holidays),
+    Exchange('BME', 'Europe/Madrid', datetime.time(9), datetime.time(17, 30), _europe_holidays((1, 1), (5, 1), (12, 25), (12, 26))),
+    Exchange('XETRA', 'Europe/Berlin', datetime.time(9), datetime.time(17, 30), _german_holidays),
+    Exchange('FRA', 'Europe/Berlin', datetime.time(8), datetime.time(22), _german_holidays), # el parque de Frankfurt negocia mas horas que Xetra
+    Exchange('EURONEXT', 'Europe/Paris', datetime.time(9), datetime.time(17, 30), _europe_holidays((1, 1), (5, 1), (12, 25), (12, 26))),
+    Exchange('MIL', 'Europe/Rome', datetime.time(9), datetime.time(17, 30), _europe_holidays((1, 1), (5, 1), (8, 15), (12, 24), (12, 25), (12, 26), (12, 31))),
+    Exchange('SIX', 'Europe/Zurich', datetime.time(9), datetime.time(17, 30), _europe_holidays((1, 1), (1, 2), (5, 1), (8, 1), (12, 24), (12, 25), (12, 26), (12, 31), easter_offsets=(-2, 1, 39, 50))),
+    Exchange('FX', 'UTC', datetime.time(0), datetime.time.max), # divisas, todo el dia entre semana
+]}
+
+SUFFIXES = {'L': 'LSE', 'IL': 'LSE', 'MC': 'BME', 'DE': 'XETRA', 'F': 'FRA', 'PA': 'EURONEXT', 'AS': 'EURONEXT',
+            'BR': 'EURONEXT', 'LS': 'EURONEXT', 'MI': 'MIL', 'SW': 'SIX'}
+INDICES = {'^GSPC': 'US', '^DJI': 'US', '^IXIC': 'US', '^NDX': 'US', '^RUT': 'US', '^VIX': 'US', '^FTSE': 'LSE',
+           '^IBEX': 'BME', '^GDAXI': 'XETRA', '^FCHI': 'EURONEXT', '^AEX': 'EURONEXT', '^SSMI': 'SIX'}
+YAHOO_EXCHANGES = {'NMS': 'US', 'NYQ': 'US', 'NGM': 'US', 'NCM': 'US', 'ASE': 'US', 'PCX': 'US', 'BTS': 'US',
+                   'LSE': 'LSE', 'IOB': 'LSE', 'MCE': 'BME', 'GER': 'XETRA', 'FRA': 'FRA', 'PAR': 'EURONEXT',
+                   'AMS': 'EURONEXT', 'BRU': 'EURONEXT', 'LIS': 'EURONEXT', 'MIL': 'MIL', 'EBS': 'SIX', 'CCY': 'FX'}
+CRYPTO_QUOTES = {'USD', 'USDT', 'EUR', 'GBP', 'BTC', 'ETH'} # BTC-USD cotiza siempre, BRK-B no
+
+UNKNOWN = object() # el simbolo no basta, hacen falta los metadatos
+
+def exchange_of(ticker):
+    """Find the calendar of a ticker from its symbol alone.
+
+    Args:
+        ticker: The stock ticker symbol.
+
+    Returns:
+        Exchange: The calendar, None for markets that never close such as crypto
+        and futures, or UNKNOWN if the metadata must decide.
+    """
+    symbol = ticker.upper()
+    if symbol.endswith('=X'):
+        return EXCHANGES['FX']
+    if symbol.endswith('=F'):
+        return None
+    if symbol.startswith('^'):
+        return EXCHANGES[INDICES[symbol]] if symbol in INDICES else UNKNOWN
+    if '.' in symbol:
+        suffix = symbol.rsplit('.', 1)[1]
+        return EXCHANGES[SUFFIXES[suffix]] if suffix in SUFFIXES else UNKNOWN
+    if '-' in symbol and symbol.rsplit('-', 1)[1] in CRYPTO_QUOTES:
+        return None
+    return EXCHANGES['US'] # sin sufijo Yahoo usa los mercados de Estados Unidos
+
+async def exchanges(tickers):
+    """Find the calendar of many tickers, reading the stored metadata for unknown suffixes.
+
+    Args:
+        tickers: Iterable of stock ticker symbols.
+
+    Returns:
+        dict: Exchange by ticker, None if the market never closes or is not known,
+        in which case the ticker is always fetched.
+    """
+    resultado = {ticker: exchange_of(ticker) for ticker in tickers}
+    desconocidos = [ticker for ticker, exchange in resultado.items() if exchange is UNKNOWN]
+    # si fallan los metadatos el ticker se consulta siempre
+    infos = await asyncio.gather(*(quotes.get_info(ticker) for ticker in desconocidos), return_exceptions=True)
+    for ticker, info in zip(desconocidos, infos):
+        code = YAHOO_EXCHANGES.get(info['exchange']) if isinstance(info, dict) else None
+        resultado[ticker] = EXCHANGES[code] if code else None
+    return resultado
+
+async def closed_until(last_fetch):
+    """Find the tickers whose price cannot have changed since they were last fetched.
+
+    Args:
+        last_fetch: Dict of ticker to the Unix timestamp of its last fetch, 0 if never.
+
+    Returns:
+        dict: Start of the next session by ticker, only for the tickers whose
+        market is closed and was fetched after its last session.
+    """
+    calendarios = await exchanges(last_fetch)
+    return {ticker: calendario.next_open() for ticker, calendario in calendarios.items()
+            if calendario and not calendario.has_new_data(last_fetch[ticker])}
@@ -0,0 +1,289 @@
+import asyncio, bisect, contextlib, logging, os, threading, time
+from telebot.asyncio_handler_backends import BaseMiddleware
+
+METRICS_HOST = os.getenv('METRICS_HOST', '127.0.0.1') # solo local por defecto
+METRICS_PORT = int(os.getenv('METRICS_PORT', 0)) # 0 desactiva el endpoint de Prometheus
+LAG_INTERVAL = 1 # segundos entre medidas del retraso del bucle de eventos
+SEND_METHODS = ('send_message', 'send_photo', 'send_document') # reply_to llama a send_message
+BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60) # segundos
+
+class Histogram:
+    """Latency distribution with fixed buckets, enough for percentiles and Prometheus."""
+
+    def __init__(self, buckets=BUCKETS):
+        self.buckets = buckets
+        self.counts = [0]*(len(buckets)+1) # el ultimo cubo recoge lo que supera al mayor limite
+        self.count = 0
+        self.sum = 0
+        self.max = 0
+
+    def observe(self, value):
+        """Add a sample.
+
+        Args:
+            value: The sample, in seconds.
+        """
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.count += 1
+        self.sum += value
+        self.max = max(self.max, value)
+
+    def percentile(self, p):
+        """Estimate a percentile as the upper limit of the bucket it falls in.
+
+        Args:
+            p: The percentile, from 0 to 100.
+
+        Returns:
+            float: The estimated value, the maximum seen if it falls beyond the last bucket.
+        """
+        rank = self.count*p/100
+        seen = 0
+        for limit, count in zip(self.buckets, self.counts):
+            seen += count
+            if seen >= rank:
+                return min(limit, self.max)
+        return self.max
+
+class Registry:
+    """Process wide counters, histograms and gauges identified by name and labels.
+
+    Updates take a lock, so they can come from the I/O threads as well as from
+    the event loop. Gauges are callables read when the metrics are exported.
+    """
+
+    def __init__(self):
+        self.counters = {}
+        self.histograms = {}
+        self.gauges = {}
+        self._lock = threading.Lock()
+
+    def inc(self, name, value=1, **labels):
+        """Increase a counter.
+
+        Args:
+            name: The metric name.
+            value: Amount to add.
+            **labels: Label values, e.g. command='price'.
+        """
+        key = _key(name, labels)
+        with self._lock:
+            self.counters[key] = self.counters.get(key, 0)+value
+
+    def observe(self, name, value, **labels):
+        """Add a sample to a histogram.
+
+        Args:
+            name: The metric name.
+            value: The sample, in seconds.
+            **labels: Label values.
+        """
+        key = _key(name, labels)
+        with self._lock:
+            if key not in self.histograms:
+                self.histograms[key] = Histogram()
+            self.histograms[key].observe(value)
+
+    def gauge(self, name, read, **labels):
+        """Register a gauge read on export, e.g. a queue length.
+
+        Args:
+            name: The metric name.
+            read: Callable with no arguments returning the current value.
+            **labels: Label values.
+        """
+        self.gauges[_key(name, labels)] = read
+
+    @contextlib.contextmanager
+    def timer(self, name, **labels):
+        """Time a block into a histogram, also when it raises.
+
+        Args:
+            name: The metric name.
+            **labels: Label values.
+        """
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(name, time.perf_counter()-start, **labels)
+
+    def hit(self, cache, hit, count=1):
+        """Count lookups of a cache.
+
+        Args:
+            cache: The cache name, e.g. 'quote' or 'chart'.
+            hit: True for hits, False for misses.
+            count: Number of lookups.
+        """
+        self.inc('cache_lookups_total', count, cache=cache, result='hit' if hit else 'miss')
+
+    def _read_gauges(self):
+        values = {}
+        for key, read in list(self.gauges.items()):
+            try:
+                values[key] = float(read())
+            except Exception as e:
+                logging.error(f"Error reading gauge {key[0]}: {e}")
+        return values
+
+    def report(self):
+        """Summarize the metrics as plain text for the /stats command.
+
+        Returns:
+            str: One line per metric.
+        """
+        with self._lock:
+            counters = dict(self.counters)
+            histograms = {key: (h.count, h.sum, h.percentile(50), h.percentile(95), h.max) for key, h in self.histograms.items()}
+        lines = []
+        ratios = {}
+        for (name, labels), value in counters.items():
+            labels = dict(labels)
+            if name == 'cache_lookups_total':
+                hits, total = ratios.get(labels['cache'], (0, 0))
+                ratios[labels['cache']] = (hits+(value if labels['result'] == 'hit' else 0), total+value)
+        if ratios:
+            lines.append("Cache hit ratio:")
+            lines += [f"  {cache}: {hits/total:.1%} of {total:g}" for cache, (hits, total) in sorted(ratios.items()) if total]
+        gauges = self._read_gauges()
+        if gauges:
+            lines.append("Current values:")
+            lines += [f"  {_label(name, labels)}: {value:g}" for (name, labels), value in sorted(gauges.items())]
+        if histograms:
+            lines.append("Latencies (count, mean, p50, p95, max in ms):")
+            for (name, labels), (count, total, p50, p95, maximum) in sorted(histograms.items()):
+                lines.append(f"  {_label(name, labels)}: {count}, {total/count*1000:.0f}, {p50*1000:.0f}, {p95*1000:.0f}, {maximum*1000:.0f}")
+        others = sorted((key, value) for key, value in counters.items() if key[0] != 'cache_lookups_total')
+        if others:
+            lines.append("Counters:")
+            lines += [f"  {_label(name, labels)}: {value:g}" for (name, labels), value in others]
+        return '\n'.join(lines) or "No metrics recorded yet."
+
+    def prometheus(self):
+        """Export the metrics in the Prometheus text format.
+
+        Returns:
+            str: The exposition text.
+        """
+        with self._lock:
+            counters = dict(self.counters)
+            histograms = {key: (list(h.counts), h.count, h.sum) for key, h in self.histograms.items()}
+        lines = []
+        for name in sorted({name for name, _ in counters}):
+            lines.append(f"# TYPE finanzasbot_{name} counter")
+            lines += [f"finanzasbot_{_label(name, labels)} {value:g}" for (n, labels), value in sorted(counters.items()) if n == name]
+        gauges = self._read_gauges()
+        for name in sorted({name for name, _ in gauges}):
+            lines.append(f"# TYPE finanzasbot_{name} gauge")
+            lines += [f"finanzasbot_{_label(name, labels)} {value:g}" for (n, labels), value in sorted(gauges.items()) if n == name]
+        for name in sorted({name for name, _ in histograms}):
+            lines.append(f"# TYPE finanzasbot_{name} histogram")
+            for (n, labels), (counts, count, total) in sorted(histograms.items()):
+                if n != name:
+                    continue
+                cumulative = 0
+                for limit, bucket in zip(BUCKETS+('+Inf',), counts):
+                    cumulative += bucket
+                    lines.append(f"finanzasbot_{_label(name+'_bucket', labels+(('le', limit),))} {cumulative}")
+                lines.append(f"finanzasbot_{_label(name+'_sum', labels)} {total:g}")
+                lines.append(f"finanzasbot_{_label(name+'_count', labels)} {count}")
+        return '\n'.join(lines)+'\n'
+
+def _key(name, labels):
+    return name, tuple(sorted((key, str(value)) for key, value in labels.items()))
+
+def _label(name, labels):
+    if not labels:
+        return name
+    return name+'{'+','.join(f'{key}="{value}"' for key, value in labels)+'}'
+
+registry = Registry()
+inc = registry.inc
+observe = registry.observe
+gauge = registry.gauge
+timer = registry.timer
+hit = registry.hit
+
+def time_sends(bot, methods=SEND_METHODS):
+    """Time every call of the bot's send methods into telegram_send_seconds.
+
+    Handler replies and the sends of the outbox both go through these methods,
+    so interactive and background sends are measured alike.
+
+    Args:
+        bot: The AsyncTeleBot.
+        methods: Names of the bot methods that call Telegram.
+    """
+    for name in methods:
+        async def timed(*args, _send=getattr(bot, name), _name=name, **kwargs):
+            with timer('telegram_send_seconds', method=_name):
+                return await _send(*args, **kwargs)
+        setattr(bot, name, timed)
+
+class HandlerMiddleware(BaseMiddleware):
+    """Telebot middleware timing every command handler and counting its errors.
+
+    Only the given commands get their own label, anything else is counted as
+    'other' so random text cannot grow the metrics without bound.
+    """
+
+    def __init__(self, commands):
+        """Create the middleware.
+
+        Args:
+            commands: Names of the registered commands, without the slash.
+        """
+        self.update_sensitive = False
+        self.update_types = ['message']
+        self.commands = set(commands)
+
+    def _command(self, message):
+        word = (message.text or '').split(maxsplit=1)[0] if message.text and message.text.startswith('/') else ''
+        command = word[1:].split('@')[0]
+        return command if command in self.commands else 'other'
+
+    async def pre_process(self, message, data):
+        data['metrics_start'] = time.perf_counter()
+
+    async def post_process(self, message, data, exception):
+        command = self._command(message)
+        observe('handler_seconds', time.perf_counter()-data['metrics_start'], command=command)
+        inc('handler_calls_total', command=command, result='error' if exception else 'ok')
+
+async def watch_loop_lag(interval=LAG_INTERVAL):
+    """Measure how late the event loop wakes up a sleeping task, forever.
+
+    A busy loop delays every handler and send by the same amount, so this is the
+    best single health signal of the bot.
+
+    Args:
+        interval: Seconds between measures.
+    """
+    while True:
+        start = time.perf_counter()
+        await asyncio.sleep(interval)
+        observe('event_loop_lag_seconds', max(0, time.perf_counter()-start-interval))
+
+async def serve(port=METRICS_PORT, host=METRICS_HOST):
+    """Serve the metrics in the Prometheus format at /metrics until cancelled.
+
+    Args:
+        port: TCP port, nothing is served if 0.
+        host: Address to listen on.
+    """
+    if not port:
+        return
+    from aiohttp import web
+    async def handle(request):
+        return web.Response(text=registry.prometheus(), content_type='text/plain', charset='utf-8')
+    app = web.Application()
+    app.router.add_get('/metrics', handle)
+    runner = web.AppRunner(app, access_log=None)
+    await runner.setup()
+    await web.TCPSite(runner, host, port).start()
+    logging.info(f"Serving metrics at http://{host}:{port}/metrics")
+    try:
+        await asyncio.Event().wait()
+    finally:
+        await runner.cleanup()
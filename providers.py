@@ -0,0 +1,101 @@
+import importlib, logging
+import executors
+
+CHUNK_SIZE = 100 # tickers por descarga masiva
+
+class YahooProvider:
+    """Upstream market data from Yahoo Finance through yfinance.
+
+    Every method blocks on the network and is meant to run in the I/O pool. Other
+    providers with the same methods can replace it, e.g. for offline benchmarks.
+    """
+
+    def quotes(self, tickers):
+        """Download the latest daily bar of many tickers with chunked bulk requests.
+
+        Args:
+            tickers: List of stock ticker symbols.
+
+        Returns:
+            dict: Quote dict (regularMarketPrice, open, dayLow, dayHigh) by ticker.
+        """
+        import yfinance as yf # carga perezosa, importar yfinance y pandas cuesta mas de un segundo
+        quotes = {}
+        for i in range(0, len(tickers), CHUNK_SIZE):
+            chunk = tickers[i:i+CHUNK_SIZE]
+            symbols = {ticker: ticker.upper() for ticker in chunk}
+            data = yf.download(sorted(set(symbols.values())), period='5d', interval='1d', group_by='ticker', auto_adjust=False, threads=True, progress=False)
+            for ticker, symbol in symbols.items():
+                try:
+                    bars = data[symbol].dropna(subset=['Close'])
+                except KeyError:
+                    logging.error(f"No price data returned for {ticker}.")
+                    continue
+                if bars.empty:
+                    continue
+                last = bars.iloc[-1]
+                quotes[ticker] = {
+                    'regularMarketPrice': float(last['Close']),
+                    'open': float(last['Open']),
+                    'dayLow': float(last['Low']),
+                    'dayHigh': float(last['High']),
+                }
+        return quotes
+
+    def info(self, tickers):
+        """Fetch the static metadata of each ticker.
+
+        Args:
+            tickers: List of stock ticker symbols.
+
+        Returns:
+            dict: Metadata dict (longName, currency, exchange, timezone) by ticker, unknown tickers are left out.
+
+        Raises:
+            Exception: If Yahoo Finance could not be queried, so it is not mistaken for an unknown ticker.
+        """
+        import yfinance as yf
+        infos = {}
+        for ticker in tickers:
+            info = yf.Ticker(ticker).info
+            name = info.get('longName') or info.get('shortName')
+            if not name:
+                continue
+            infos[ticker] = {
+                'longName': name,
+                'currency': info.get('currency'),
+                'exchange': info.get('exchange'),
+                'timezone': info.get('exchangeTimezoneName'),
+            }
+        return infos
+
+    def history(self, ticker, start=None):
+        """Download the daily bars of a ticker.
+
+        Args:
+            ticker: The stock ticker symbol.
+            start: First date to download, None downloads the whole history.
+
+        Returns:
+            DataFrame: Daily bars with Open, High, Low, Close, Volume, Dividends and Stock Splits columns.
+        """
+        import yfinance as yf
+        stock = yf.Ticker(ticker)
+        if start is None:
+            return stock.history(period='max', interval='1d')
+        return stock.history(start=start.isoformat(), interval='1d')
+
+provider = YahooProvider()
+
+async def warm_up():
+    """Import yfinance, and pandas with it, in the I/O pool ahead of the first request."""
+    await executors.run_io(importlib.import_module, 'yfinance')
+
+def set_provider(new_provider):
+    """Replace the upstream data provider used by the quote cache and the history store.
+
+    Args:
+        new_provider: Object with quotes, info and history methods like YahooProvider.
+    """
+    global provider
+    provider = new_provider
@@ -0,0 +1,241 @@
+import asyncio, logging, time
+from collections import OrderedDict
+import executors, metrics, providers
+
+PRICE_TTL = 60 # segundos, los precios caducan rapido
+META_TTL = 7*24*60*60 # una semana para datos estaticos como longName
+META_REFRESH = 30*24*60*60 # un mes, los nombres y mercados casi nunca cambian
+
+class QuoteCache:
+    """Bounded LRU cache with per-kind TTLs and single-flight loading.
+
+    Entries are keyed by (kind, ticker). Concurrent misses for the same key share
+    one upstream call, so a burst of requests for a ticker costs a single fetch.
+    """
+
+    def __init__(self, maxsize=2048, ttls=None):
+        """Create an empty cache.
+
+        Args:
+            maxsize: Maximum number of entries kept before evicting the least recently used.
+            ttls: Optional dict of time to live in seconds by kind.
+        """
+        self.maxsize = maxsize
+        self.ttls = ttls or {'quote': PRICE_TTL, 'meta': META_TTL}
+        self._entries = OrderedDict()
+        self._inflight = {}
+
+    def _get(self, key):
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        expires, value = entry
+        if expires < time.monotonic():
+            del self._entries[key]
+            return None
+        self._entries.move_to_end(key)
+        return value
+
+    def _set(self, key, value):
+        self._entries[key] = (time.monotonic()+self.ttls[key[0]], value)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.maxsize:
+            self._entries.popitem(last=False)
+
+    def invalidate(self, kind, ticker):
+        """Drop a cached entry so the next read goes upstream.
+
+        Args:
+            kind: The entry kind, 'quote' or 'meta'.
+            ticker: The stock ticker symbol.
+        """
+        self._entries.pop((kind, ticker), None)
+
+    async def _load(self, kind, tickers, loader, futures):
+        try:
+            with metrics.timer('upstream_seconds', call=kind):
+                values = await executors.run_io(loader, tickers)
+        except Exception as e:
+            metrics.inc('upstream_errors_total', call=kind)
+            for future in futures.values():
+                if not future.done():
+                    future.set_exception(e)
+        else:
+            for ticker, future in futures.items():
+                value = values.get(ticker)
+                if value is not None:
+                    self._set((kind, ticker), value)
+                if not future.done():
+                    future.set_result(value)
+        finally:
+            for ticker in tickers:
+                self._inflight.pop((kind, ticker), None)
+
+    async def get_many(self, kind, tickers, loader):
+        """Return cached values for many tickers, loading the missing ones in one call.
+
+        Args:
+            kind: The entry kind, selects the TTL.
+            tickers: Iterable of stock ticker symbols.
+            loader: Blocking callable taking a list of tickers and returning a dict by ticker.
+
+        Returns:
+            dict: Value by ticker, tickers the loader could not resolve are left out.
+        """
+        results = {}
+        pending = {}
+        missing = []
+        for ticker in dict.fromkeys(tickers):
+            value = self._get((kind, ticker))
+            if value is not None:
+                results[ticker] = value
+            elif (kind, ticker) in self._inflight:
+                pending[ticker] = self._inflight[(kind, ticker)]
+            else:
+                missing.append(ticker)
+        metrics.hit(kind, True, len(results))
+        metrics.hit(kind, False, len(pending)+len(missing))
+        if missing:
+            loop = asyncio.get_running_loop()
+            futures = {ticker: loop.create_future() for ticker in missing}
+            for ticker, future in futures.items():
+                self._inflight[(kind, ticker)] = future
+            pending.update(futures)
+            # la carga va en su propia tarea para que cancelar a un llamante no deje colgados al resto
+            asyncio.ensure_future(self._load(kind, missing, loader, futures))
+        for ticker, future in pending.items():
+            value = await asyncio.shield(future)
+            if value is not None:
+                results[ticker] = value
+        return results
+
+def crear_tablas(con):
+    """Create the ticker metadata table.
+
+    Args:
+        con: The SQLite connection, runs in the database thread.
+    """
+    con.execute("CREATE TABLE IF NOT EXISTS tickers (ticker TEXT PRIMARY KEY, name TEXT NOT NULL, currency TEXT, exchange TEXT, timezone TEXT, updated_at REAL NOT NULL);")
+
+class MetaStore:
+    """Ticker metadata kept in the tickers table of the bot database.
+
+    The metadata comes from the heavy info request of the provider, so it is
+    fetched once per ticker and refreshed after META_REFRESH seconds. If the
+    refresh fails the stored rows are still used, and the error is raised only
+    when some ticker has no stored row.
+    """
+
+    def __init__(self, database, refresh=META_REFRESH):
+        """Create the store.
+
+        Args:
+            database: The db.Database holding the tickers table.
+            refresh: Age in seconds after which a row is fetched again.
+        """
+        self.database = database
+        self.refresh = refresh
+
+    def load(self, tickers):
+        """Read the metadata of many tickers, fetching the missing or old ones.
+
+        Blocks on the database and the network, it is the loader of the 'meta'
+        entries of the quote cache and runs in the I/O pool.
+
+        Args:
+            tickers: List of stock ticker symbols.
+
+        Returns:
+            dict: Metadata dict (longName, currency, exchange, timezone) by ticker, unknown tickers are left out.
+
+        Raises:
+            Exception: If the provider failed for a ticker without a stored row.
+        """
+        now = time.time()
+        def _select(con):
+            return con.execute(f"SELECT ticker, name, currency, exchange, timezone, updated_at FROM tickers WHERE ticker IN ({','.join('?'*len(tickers))});", tickers).fetchall()
+        stored = {row['ticker']: row for row in self.database.call(_select)}
+        infos = {ticker: {'longName': row['name'], 'currency': row['currency'], 'exchange': row['exchange'], 'timezone': row['timezone']}
+                 for ticker, row in stored.items()}
+        old = [ticker for ticker in tickers if ticker not in stored or stored[ticker]['updated_at'] < now-self.refresh]
+        if not old:
+            return infos
+        try:
+            fetched = providers.provider.info(old)
+        except Exception as e:
+            if any(ticker not in stored for ticker in old):
+                raise
+            logging.error(f"Error refreshing the metadata of {len(old)} tickers, using the stored one: {e}")
+            return infos
+        def _upsert(con):
+            with con:
+                con.executemany("INSERT INTO tickers (ticker, name, currency, exchange, timezone, updated_at) VALUES (?, ?, ?, ?, ?, ?) ON CONFLICT (ticker) DO UPDATE SET name=excluded.name, currency=excluded.currency, exchange=excluded.exchange, timezone=excluded.timezone, updated_at=excluded.updated_at;",
+                                [(ticker, info['longName'], info['currency'], info['exchange'], info['timezone'], now) for ticker, info in fetched.items()])
+        if fetched:
+            self.database.call(_upsert)
+        infos.update(fetched)
+        return infos
+
+cache = QuoteCache()
+meta_store = None # sin almacen los metadatos se piden siempre al proveedor
+
+def set_store(store):
+    """Keep the ticker metadata in a persistent store.
+
+    Args:
+        store: A MetaStore, or None to always ask the provider.
+    """
+    global meta_store
+    meta_store = store
+
+async def get_quotes(tickers):
+    """Get the latest quote of many tickers, sharing one bulk download for the misses.
+
+    Args:
+        tickers: Iterable of stock ticker symbols.
+
+    Returns:
+        dict: Quote dict by ticker.
+    """
+    return await cache.get_many('quote', tickers, providers.provider.quotes)
+
+async def get_quote(ticker):
+    """Get the latest quote of a ticker.
+
+    Args:
+        ticker: The stock ticker symbol.
+
+    Returns:
+        dict: Quote dict, or None if the ticker has no price data.
+    """
+    return (await get_quotes([ticker])).get(ticker)
+
+async def get_info(ticker):
+    """Get the static metadata of a ticker.
+
+    Args:
+        ticker: The stock ticker symbol.
+
+    Returns:
+        dict: Metadata dict, or None if the ticker is unknown.
+
+    Raises:
+        Exception: If the metadata could not be fetched, the ticker may still exist.
+    """
+    return (await cache.get_many('meta', [ticker], meta_store.load if meta_store else providers.provider.info)).get(ticker)
+
+async def get_name(ticker):
+    """Get the long name of a ticker for captions and titles.
+
+    Args:
+        ticker: The stock ticker symbol.
+
+    Returns:
+        str: The long name, or the ticker itself if it is unknown or the metadata failed.
+    """
+    try:
+        info = await get_info(ticker)
+    except Exception as e:
+        logging.error(f"Error fetching the name of {ticker}: {e}")
+        return ticker
+    return info['longName'] if info else ticker
@@ -0,0 +1,85 @@
+import asyncio, heapq, itertools, time
+
+class DeadlineScheduler:
+    """Priority queue of keys with due times that sleeps exactly until the next one.
+
+    Rescheduling or cancelling a key leaves its old heap entry behind and it is
+    skipped when it reaches the top, so every change is O(log n).
+    """
+
+    def __init__(self):
+        self._heap = []
+        self._due = {} # key -> instante vigente, las entradas del heap que no coinciden estan obsoletas
+        self._counter = itertools.count()
+        self._wakeup = asyncio.Event()
+
+    def schedule(self, key, when, only_if_earlier=False):
+        """Set the due time of a key, replacing any previous one.
+
+        Args:
+            key: Hashable job key, e.g. a track ID.
+            when: Due time as a Unix timestamp.
+            only_if_earlier: Keep the current due time if the key is already scheduled earlier.
+        """
+        if only_if_earlier and key in self._due and self._due[key] <= when:
+            return
+        self._due[key] = when
+        heapq.heappush(self._heap, (when, next(self._counter), key))
+        self._wakeup.set()
+
+    def cancel(self, key):
+        """Remove a key from the schedule.
+
+        Args:
+            key: The job key.
+        """
+        if self._due.pop(key, None) is not None:
+            self._wakeup.set()
+
+    def clear(self):
+        """Remove every key from the schedule."""
+        self._heap.clear()
+        self._due.clear()
+        self._wakeup.set()
+
+    def due_time(self, key):
+        """Get the due time of a key.
+
+        Args:
+            key: The job key.
+
+        Returns:
+            float: Unix timestamp, or None if the key is not scheduled.
+        """
+        return self._due.get(key)
+
+    def _discard_stale(self):
+        while self._heap and self._due.get(self._heap[0][2]) != self._heap[0][0]:
+            heapq.heappop(self._heap)
+
+    async def wait_due(self):
+        """Sleep until at least one key is due and pop every due key.
+
+        Returns:
+            list: Keys whose due time has passed, in due order. They are no longer scheduled.
+        """
+        while True:
+            self._wakeup.clear()
+            self._discard_stale()
+            now = time.time()
+            if self._heap and self._heap[0][0] <= now:
+                keys = []
+                while self._heap and self._heap[0][0] <= now:
+                    when, _, key = heapq.heappop(self._heap)
+                    if self._due.get(key) == when:
+                        del self._due[key]
+                        keys.append(key)
+                return keys
+            timeout = self._heap[0][0]-now if self._heap else None
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout)
+            except asyncio.TimeoutError:
+                pass
+
+    def __len__(self):
+        return len(self._due)
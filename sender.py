@@ -0,0 +1,200 @@
+import asyncio, itertools, logging, time
+from telebot.asyncio_helper import ApiTelegramException
+import metrics
+
+PRIORITY_ALERT = 0 # las alertas salen antes que cualquier otra cosa
+PRIORITY_REPLY = 5 # respuestas diferidas a comandos, como /update_tracks
+PRIORITY_TRACK = 10 # actualizaciones periodicas de seguimientos
+
+GLOBAL_RATE = 30 # mensajes por segundo, limite global de Telegram
+CHAT_RATE = 1 # mensajes por segundo a un mismo chat
+MAX_RETRIES = 5
+BACKOFF = 1 # segundos de la primera espera, se duplica en cada reintento
+
+def is_transient(error):
+    """Whether a failed send may succeed later, so it is worth retrying.
+
+    Args:
+        error: The exception raised by the bot call.
+
+    Returns:
+        bool: True for 429s, 5xx answers and network errors, False for other Telegram errors, e.g. a bot blocked by the user.
+    """
+    if isinstance(error, ApiTelegramException):
+        return error.error_code == 429 or error.error_code >= 500
+    return True
+
+def _name(method):
+    return getattr(method, '__name__', method)
+
+class RateLimiter:
+    """Spaces out calls so that at most `rate` per second go through."""
+
+    def __init__(self, rate):
+        """Create the limiter.
+
+        Args:
+            rate: Maximum calls per second.
+        """
+        self.interval = 1/rate
+        self.next_slot = 0
+
+    def delay(self):
+        """Seconds until the next free slot, without reserving it."""
+        return max(0, self.next_slot-time.monotonic())
+
+    def reserve(self):
+        """Reserve the next free slot.
+
+        Returns:
+            float: Seconds to wait before using the slot.
+        """
+        now = time.monotonic()
+        slot = max(self.next_slot, now)
+        self.next_slot = slot+self.interval
+        return slot-now
+
+    def pause(self, seconds):
+        """Block the limiter, e.g. after Telegram asked to retry later.
+
+        Args:
+            seconds: Seconds to wait before the next call.
+        """
+        self.next_slot = max(self.next_slot, time.monotonic()+seconds)
+
+class SendQueue:
+    """Outbound Telegram queue served by a pool of concurrent senders.
+
+    Jobs leave in priority order, respecting Telegram's global and per chat rate
+    limits. A job whose chat has no free slot is parked until it has one, so the
+    senders keep serving other chats meanwhile. Failed sends are retried with
+    exponential backoff, and a 429 waits the retry_after Telegram returns.
+    """
+
+    def __init__(self, bot, workers=4, global_rate=GLOBAL_RATE, chat_rate=CHAT_RATE, max_retries=MAX_RETRIES):
+        """Create the queue, call start() inside the event loop to launch the senders.
+
+        Args:
+            bot: The AsyncTeleBot used to send.
+            workers: Number of concurrent senders.
+            global_rate: Maximum messages per second across all chats.
+            chat_rate: Maximum messages per second to one chat.
+            max_retries: Attempts after the first one before giving up.
+        """
+        self.bot = bot
+        self.workers = workers
+        self.chat_rate = chat_rate
+        self.max_retries = max_retries
+        self._global = RateLimiter(global_rate)
+        self._chats = {}
+        self._queue = asyncio.PriorityQueue()
+        self._counter = itertools.count()
+        self._tasks = []
+        self._pending = set() # futuros sin resolver, incluidos los que esperan un reintento
+        self._parked = 0 # trabajos apartados hasta que su chat tenga hueco
+
+    def start(self):
+        """Launch the sender tasks."""
+        if not self._tasks:
+            self._tasks = [asyncio.ensure_future(self._worker()) for _ in range(self.workers)]
+
+    async def stop(self):
+        """Cancel the sender tasks, queued jobs are dropped and their futures cancelled."""
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+        for future in list(self._pending):
+            future.cancel()
+        await asyncio.sleep(0) # deja correr los callbacks de los futuros cancelados
+
+    def send(self, method, priority, chat_id, **kwargs):
+        """Queue a bot call.
+
+        Args:
+            method: Name of the AsyncTeleBot method, e.g. 'send_message' or 'send_photo', or a coroutine function taking chat_id.
+            priority: PRIORITY_ALERT, PRIORITY_REPLY or PRIORITY_TRACK, lower goes first.
+            chat_id: The destination chat.
+            **kwargs: Other arguments of the bot method.
+
+        Returns:
+            asyncio.Future: Resolves to the sent message, or to the error after the last retry.
+        """
+        future = asyncio.get_running_loop().create_future()
+        # nadie tiene por que esperar el resultado, se marca como recogido para no avisar de excepciones
+        future.add_done_callback(lambda f: f.cancelled() or f.exception())
+        self._pending.add(future)
+        future.add_done_callback(self._pending.discard)
+        self._put(priority, [method, chat_id, kwargs, future, 0])
+        return future
+
+    async def join(self):
+        """Wait until every queued job has been sent or has given up."""
+        while self._pending:
+            await asyncio.gather(*self._pending, return_exceptions=True)
+
+    def qsize(self):
+        """Number of jobs waiting to be sent, including those waiting for their chat."""
+        return self._queue.qsize()+self._parked
+
+    def _put(self, priority, job, order=None):
+        self._queue.put_nowait((priority, next(self._counter) if order is None else order, job))
+
+    def _park(self, priority, order, job, delay):
+        # vuelve a la cola con su orden original para no adelantar a los mensajes posteriores del chat
+        def _unpark():
+            self._parked -= 1
+            self._put(priority, job, order)
+        self._parked += 1
+        asyncio.get_running_loop().call_later(delay, _unpark)
+
+    def _chat(self, chat_id):
+        if chat_id not in self._chats:
+            self._chats[chat_id] = RateLimiter(self.chat_rate)
+        return self._chats[chat_id]
+
+    def _retry(self, priority, job, delay):
+        asyncio.get_running_loop().call_later(delay, self._put, priority, job)
+
+    async def _worker(self):
+        while True:
+            priority, order, job = await self._queue.get()
+            method, chat_id, kwargs, future, attempt = job
+            if future.done():
+                continue
+            # si el chat no tiene hueco el trabajo se aparta y este emisor atiende otros chats
+            wait = self._chat(chat_id).delay()
+            if wait > 0:
+                self._park(priority, order, job, wait)
+                continue
+            self._chat(chat_id).reserve()
+            await asyncio.sleep(self._global.reserve())
+            try:
+                call = method if callable(method) else getattr(self.bot, method)
+                result = await call(chat_id=chat_id, **kwargs)
+            except ApiTelegramException as e:
+                metrics.inc('telegram_errors_total', method=_name(method), code=e.error_code)
+                if is_transient(e):
+                    retry_after = (e.result_json or {}).get('parameters', {}).get('retry_after')
+                    delay = retry_after if retry_after else BACKOFF*2**attempt
+                    if e.error_code == 429:
+                        self._chat(chat_id).pause(delay)
+                    self._fail_or_retry(priority, job, e, delay)
+                else:
+                    logging.error(f"Error sending {_name(method)} to {chat_id}: {e}")
+                    future.set_exception(e)
+            except Exception as e:
+                metrics.inc('telegram_errors_total', method=_name(method), code='other')
+                self._fail_or_retry(priority, job, e, BACKOFF*2**attempt)
+            else:
+                future.set_result(result)
+
+    def _fail_or_retry(self, priority, job, error, delay):
+        method, chat_id, kwargs, future, attempt = job
+        if attempt >= self.max_retries:
+            logging.error(f"Giving up sending {_name(method)} to {chat_id} after {attempt+1} attempts: {error}")
+            future.set_exception(error)
+            return
+        logging.info(f"Retrying {_name(method)} to {chat_id} in {delay}s: {error}")
+        job[4] = attempt+1
+        self._retry(priority, job, delay)
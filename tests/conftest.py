@@ -0,0 +1,4 @@
+import os, sys
+
+# los modulos del bot estan en la raiz del repositorio, como en bench/
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
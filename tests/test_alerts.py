@@ -0,0 +1,55 @@
+import pytest
+import alerts
+
+@pytest.fixture
+def index():
+    index = alerts.AlertIndex()
+    index.load([(1, 10, 'AAPL', alerts.BELOW, 100.0, '<100'),
+                (2, 10, 'AAPL', alerts.ABOVE, 120.0, '>120'),
+                (3, 11, 'AAPL', alerts.BELOW, 90.0, '<90'),
+                (4, 11, 'AAPL', alerts.ABOVE, 110.0, '>110'),
+                (5, 10, 'MSFT', alerts.CROSS, None, 'x9/20')])
+    return index
+
+def test_price_equal_to_the_threshold_does_not_trigger(index):
+    assert index.triggered('AAPL', 100.0) == []
+    assert index.triggered('AAPL', 110.0) == []
+    assert index.triggered('AAPL', 90.0) == [1]
+    assert index.triggered('AAPL', 120.0) == [4]
+
+def test_triggered_finds_every_crossed_threshold(index):
+    assert index.triggered('AAPL', 105.0) == []
+    assert sorted(index.triggered('AAPL', 89.99)) == [1, 3]
+    assert sorted(index.triggered('AAPL', 120.01)) == [2, 4]
+    assert index.triggered('MSFT', 1.0) == []
+
+def test_equal_thresholds_trigger_together(index):
+    index.add(6, 12, 'AAPL', alerts.BELOW, 100.0, '<100')
+    assert index.triggered('AAPL', 100.0) == []
+    assert sorted(index.triggered('AAPL', 99.0)) == [1, 6]
+
+def test_crossover_alerts_are_not_indexed(index):
+    assert len(index) == 4
+    assert index.get(5) is None
+    assert index.tickers() == {'AAPL'}
+
+def test_remove(index):
+    index.remove(1)
+    index.remove(1)
+    assert index.get(1) is None
+    assert index.triggered('AAPL', 80.0) == [3]
+    index.remove_user_ticker(11, 'AAPL')
+    assert len(index) == 1
+    assert index.triggered('AAPL', 80.0) == []
+    index.remove(2)
+    assert index.tickers() == set()
+
+@pytest.mark.parametrize('limit_value, parsed', [('<1.5', (alerts.BELOW, 1.5)), ('>20', (alerts.ABOVE, 20.0)),
+                                                 ('x9/20', (alerts.CROSS, None))])
+def test_parse_limit(limit_value, parsed):
+    assert alerts.parse_limit(limit_value) == parsed
+
+@pytest.mark.parametrize('limit_value', ['<nan', '>inf', '<-inf', '>abc', '<', '20', 'x20/9', 'x0/9', ''])
+def test_parse_limit_rejects_invalid_values(limit_value):
+    with pytest.raises(ValueError):
+        alerts.parse_limit(limit_value)
@@ -0,0 +1,67 @@
+import asyncio, base64, contextlib, json, time
+import pytest
+import feeds
+
+websockets = pytest.importorskip('websockets')
+from yfinance.live import PricingData
+
+class FakeFeed:
+    """Local websocket server that pushes a price for every subscribed symbol."""
+
+    def __init__(self):
+        self.connections = []
+        self.subscriptions = []
+
+    async def handler(self, conn):
+        self.connections.append(conn)
+        symbols = set()
+        async def pump():
+            while True:
+                await asyncio.sleep(0.02)
+                for symbol in sorted(symbols):
+                    pricing = PricingData(id=symbol, price=100, time=int(time.time()*1000))
+                    await conn.send(json.dumps({'message': base64.b64encode(pricing.SerializeToString()).decode()}))
+        pumping = asyncio.ensure_future(pump())
+        try:
+            async for raw in conn:
+                message = json.loads(raw)
+                self.subscriptions.append(message)
+                symbols.update(message.get('subscribe', ()))
+                symbols.difference_update(message.get('unsubscribe', ()))
+        finally:
+            pumping.cancel()
+
+async def serve(run):
+    feed = FakeFeed()
+    async with websockets.serve(feed.handler, '127.0.0.1', 0) as server:
+        port = server.sockets[0].getsockname()[1]
+        await run(feed, feeds.StreamingSource(f'ws://127.0.0.1:{port}'))
+
+async def first_tick(source):
+    async with contextlib.aclosing(source.ticks()) as ticks:
+        return await asyncio.wait_for(anext(ticks), 1)
+
+def test_restarted_listener_resubscribes_on_a_new_connection():
+    async def run(feed, source):
+        await source.set_tickers({'aapl', 'AAPL'})
+        assert {tick.ticker for tick in [await first_tick(source) for _ in range(2)]} <= {'aapl', 'AAPL'}
+        # cada reinicio abre una conexion nueva suscrita a los mismos simbolos
+        assert len(feed.connections) == 2
+        assert feed.subscriptions[-1] == {'subscribe': ['AAPL']}
+        await source.close()
+    asyncio.run(serve(run))
+
+def test_a_closed_connection_ends_ticks_with_an_error():
+    async def run(feed, source):
+        await source.set_tickers({'MSFT'})
+        async def consume():
+            async for tick in source.ticks():
+                pass
+        task = asyncio.ensure_future(consume())
+        await asyncio.sleep(0.1)
+        await feed.connections[0].close()
+        with pytest.raises(ConnectionError):
+            await asyncio.wait_for(task, 1)
+        assert (await first_tick(source)).ticker == 'MSFT'
+        await source.close()
+    asyncio.run(serve(run))
@@ -0,0 +1,64 @@
+import datetime
+import pytest
+import history, providers
+
+pd = pytest.importorskip('pandas')
+
+class FakeProvider:
+    """Serves a fixed series of daily bars and records the start of every download."""
+
+    def __init__(self, days=400):
+        dates = pd.bdate_range(end=datetime.date.today()-datetime.timedelta(days=1), periods=days, name='Date')
+        self.bars = pd.DataFrame({'Open': 10.0, 'High': 11.0, 'Low': 9.0, 'Close': 10.0, 'Volume': 1000.0,
+                                  'Dividends': 0.0, 'Stock Splits': 0.0}, index=dates)
+        self.starts = []
+
+    def history(self, ticker, start=None):
+        self.starts.append(start)
+        return self.bars if start is None else self.bars[self.bars.index >= pd.Timestamp(start)]
+
+    def add_bar(self, close, dividend=0.0):
+        day = self.bars.index[-1]+pd.offsets.BDay()
+        self.bars.loc[day] = [close, close, close, close, 1000.0, dividend, 0.0]
+
+@pytest.fixture
+def provider(monkeypatch):
+    provider = FakeProvider()
+    monkeypatch.setattr(providers, 'provider', provider)
+    return provider
+
+@pytest.fixture
+def store(tmp_path):
+    store = history.HistoryStore(tmp_path/'history.db', refresh_seconds=0)
+    yield store
+    store.con.close()
+
+def test_only_the_delta_is_downloaded_after_the_first_sync(provider, store):
+    first = store.get('AAPL', '1mo')
+    assert provider.starts == [history.period_start('1mo')]
+    provider.add_bar(12.0)
+    data = store.get('AAPL', '1mo')
+    # se vuelve a pedir desde la ultima barra guardada
+    assert provider.starts[1] == first.index[-1].date()
+    assert len(data) == len(first)+1
+    assert data['Close'].iloc[-1] == 12.0
+
+def test_a_longer_period_backfills_once(provider, store):
+    store.get('AAPL', '1mo')
+    year = store.get('AAPL', '1y')
+    assert provider.starts[1] == history.period_start('1y')
+    assert year.index[0].date() >= history.period_start('1y')
+    assert len(year) > 200
+    store.refresh_seconds = 60
+    store.get('AAPL', '6mo')
+    assert len(provider.starts) == 2
+
+def test_a_dividend_downloads_the_history_again(provider, store):
+    store.get('AAPL', '1mo')
+    # el dividendo ajusta todos los precios anteriores
+    provider.bars['Close'] = 9.5
+    provider.add_bar(9.6, dividend=0.5)
+    data = store.get('AAPL', '1mo')
+    assert provider.starts[2] == history.period_start('1mo')
+    assert (data['Close'].iloc[:-1] == 9.5).all()
+    assert data['Close'].iloc[-1] == 9.6
@@ -0,0 +1,22 @@
+import numpy as np
+import indicators
+
+def test_crossovers_marks_the_bar_of_each_cross():
+    assert indicators.crossovers([1, 3, 1], [2, 2, 2]).tolist() == [0, 1, -1]
+
+def test_touch_and_bounce_is_not_a_cross():
+    assert indicators.crossovers([3, 2, 3], [2, 2, 2]).tolist() == [0, 0, 0]
+    assert indicators.crossovers([1, 2, 2, 1], [2, 2, 2, 2]).tolist() == [0, 0, 0, 0]
+
+def test_cross_through_equal_bars_is_reported_once_on_the_other_side():
+    assert indicators.crossovers([3, 2, 2, 1], [2, 2, 2, 2]).tolist() == [0, 0, 0, -1]
+
+def test_crossovers_ignores_the_padding_of_stacked_rows():
+    fast = indicators.stack([[1, 3], [3, 2, 1]])
+    slow = indicators.stack([[2, 2], [2, 2, 2]])
+    assert indicators.crossovers(fast, slow).tolist() == [[0, 0, 1], [0, 0, -1]]
+
+def test_last_crossover():
+    index, direction = indicators.last_crossover(np.array([[1, 3, 1, 1], [1, 1, 1, 1]]), np.full((2, 4), 2))
+    assert index.tolist() == [2, -1]
+    assert direction.tolist() == [-1, 0]
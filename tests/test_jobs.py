@@ -0,0 +1,106 @@
+import asyncio, time
+import pytest
+import db, jobs
+
+@pytest.fixture
+def database(tmp_path):
+    database = db.Database(str(tmp_path/'bot.db'))
+    database.call(lambda con: (jobs.crear_tablas(con), con.commit()))
+    yield database
+    database.close()
+
+async def nothing_due(queue):
+    try:
+        await asyncio.wait_for(queue.wait_due(), 0.2)
+    except asyncio.TimeoutError:
+        return True
+    return False
+
+def test_due_keys_are_claimed_once_in_due_order(database):
+    async def run():
+        a = jobs.JobQueue(database, 'track', 'A')
+        b = jobs.JobQueue(database, 'track', 'B')
+        now = time.time()
+        a.schedule(2, now-1)
+        a.schedule(1, now-2)
+        a.schedule(3, now+60)
+        assert await a.wait_due() == [1, 2]
+        assert await nothing_due(b)
+        assert len(b) == 3
+    asyncio.run(run())
+
+def test_batch_leaves_the_rest_to_other_workers(database):
+    async def run():
+        a = jobs.JobQueue(database, 'track', 'A', batch=2)
+        b = jobs.JobQueue(database, 'track', 'B', batch=2)
+        await a.sync([(key, time.time()-10+key) for key in range(3)])
+        assert await a.wait_due() == [0, 1]
+        assert await b.wait_due() == [2]
+    asyncio.run(run())
+
+def test_expired_claims_are_claimed_again(database):
+    async def run():
+        a = jobs.JobQueue(database, 'track', 'A', lease=0.5)
+        b = jobs.JobQueue(database, 'track', 'B')
+        a.schedule('AAPL', time.time()-1)
+        assert await a.wait_due() == ['AAPL']
+        claimed_until = time.time()+0.5
+        assert await nothing_due(b)
+        # b se despierta solo cuando caduca la reserva
+        assert await asyncio.wait_for(b.wait_due(), 1) == ['AAPL']
+        assert time.time() >= claimed_until-0.05
+    asyncio.run(run())
+
+def test_done_removes_only_keys_not_scheduled_again(database):
+    async def run():
+        a = jobs.JobQueue(database, 'track', 'A')
+        b = jobs.JobQueue(database, 'track', 'B')
+        a.schedule(1, time.time()-1)
+        a.schedule(2, time.time()-1)
+        assert await a.wait_due() == [1, 2]
+        a.schedule(2, time.time()-1) # reprogramar libera la reserva
+        b.done([1, 2]) # otro proceso no puede terminar trabajos ajenos
+        a.done([1])
+        keys = await database.fetchall("SELECT key, claimed_by FROM jobs ORDER BY key;")
+        assert [tuple(row) for row in keys] == [(2, None)]
+    asyncio.run(run())
+
+def test_schedule_only_if_earlier(database):
+    async def run():
+        a = jobs.JobQueue(database, 'cross', 'A')
+        a.schedule('SAN.MC', 100)
+        a.schedule('SAN.MC', 200, only_if_earlier=True)
+        a.schedule('BBVA.MC', 200)
+        a.schedule('BBVA.MC', 100, only_if_earlier=True)
+        rows = await database.fetchall("SELECT key, due FROM jobs ORDER BY key;")
+        assert [tuple(row) for row in rows] == [('BBVA.MC', 100), ('SAN.MC', 100)]
+    asyncio.run(run())
+
+def test_sync_removes_orphans_and_keeps_claims(database):
+    async def run():
+        a = jobs.JobQueue(database, 'track', 'A')
+        other = jobs.JobQueue(database, 'cross', 'A')
+        other.schedule('AAPL', 100)
+        await a.sync([(1, time.time()-1), (2, time.time()+500)])
+        assert await a.wait_due() == [1]
+        await a.sync([(1, time.time()+700), (3, time.time()+800)])
+        rows = await database.fetchall("SELECT kind, key, due, claimed_by FROM jobs ORDER BY kind, key;")
+        assert [tuple(row)[:2] for row in rows] == [('cross', 'AAPL'), ('track', 1), ('track', 3)]
+        assert rows[1]['claimed_by'] == 'A' and rows[1]["due"] < time.time() # la reserva en curso se respeta
+    asyncio.run(run())
+
+def test_lease_has_one_holder_and_expires(database):
+    async def run():
+        a = jobs.Lease(database, 'leader', 'A', ttl=0.2)
+        b = jobs.Lease(database, 'leader', 'B', ttl=0.2)
+        assert await a.acquire()
+        assert not await b.acquire()
+        assert await a.acquire() # renovar
+        await asyncio.sleep(0.25)
+        assert await b.acquire()
+        assert not await a.acquire()
+        await a.release() # no suelta un liderazgo ajeno
+        assert not await a.acquire()
+        await b.release()
+        assert await a.acquire()
+    asyncio.run(run())
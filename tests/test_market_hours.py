@@ -0,0 +1,85 @@
+import asyncio, datetime
+import pytest
+import market_hours, quotes
+
+def ts(text):
+    return datetime.datetime.fromisoformat(text).timestamp()
+
+@pytest.mark.parametrize('year, sunday', [(2019, '2019-04-21'), (2024, '2024-03-31'), (2025, '2025-04-20'),
+                                          (2026, '2026-04-05'), (2038, '2038-04-25'), (2285, '2285-03-22')])
+def test_easter(year, sunday):
+    assert market_hours.easter(year) == datetime.date.fromisoformat(sunday)
+
+def test_nth_weekday():
+    assert market_hours.nth_weekday(2026, 1, 0, 3) == datetime.date(2026, 1, 19) # Martin Luther King
+    assert market_hours.nth_weekday(2026, 11, 3, 4) == datetime.date(2026, 11, 26) # Accion de Gracias
+    assert market_hours.nth_weekday(2026, 6, 0, 1) == datetime.date(2026, 6, 1) # el dia 1 ya es lunes
+    assert market_hours.nth_weekday(2026, 5, 0, -1) == datetime.date(2026, 5, 25)
+    assert market_hours.nth_weekday(2026, 12, 3, -1) == datetime.date(2026, 12, 31) # diciembre pasa de año
+
+def test_uk_weekend_holidays_move_to_the_next_free_weekday():
+    holidays = market_hours.EXCHANGES['LSE'].holidays(2021)
+    # Navidad en sabado y San Esteban en domingo
+    assert {datetime.date(2021, 12, 27), datetime.date(2021, 12, 28)} <= holidays
+    assert datetime.date(2021, 12, 25) not in holidays
+    assert datetime.date(2022, 1, 3) in market_hours.EXCHANGES['LSE'].holidays(2022) # año nuevo en sabado
+
+def test_us_observed_holidays():
+    assert datetime.date(2026, 7, 3) in market_hours.EXCHANGES['US'].holidays(2026) # 4 de julio en sabado
+    assert datetime.date(2021, 7, 5) in market_hours.EXCHANGES['US'].holidays(2021) # 4 de julio en domingo
+    assert datetime.date(2023, 1, 2) in market_hours.EXCHANGES['US'].holidays(2023) # año nuevo en domingo
+    # el año nuevo en sabado no se pasa al viernes anterior
+    assert datetime.date(2021, 12, 31) not in market_hours.EXCHANGES['US'].holidays(2021)
+    assert datetime.date(2026, 4, 3) in market_hours.EXCHANGES['US'].holidays(2026) # Viernes Santo
+
+def test_sessions_include_the_data_delay():
+    bme = market_hours.EXCHANGES['BME']
+    assert bme.is_open(ts('2026-10-14T09:00+02:00'))
+    assert bme.is_open(ts('2026-10-14T17:50+02:00'))
+    assert not bme.is_open(ts('2026-10-14T18:00+02:00'))
+    assert not bme.is_open(ts('2026-10-14T08:59+02:00'))
+    assert bme.last_update(ts('2026-10-14T12:00+02:00')) == ts('2026-10-13T18:00+02:00')
+
+def test_next_open_skips_weekends_and_holidays():
+    lse = market_hours.EXCHANGES['LSE']
+    # Viernes Santo y lunes de Pascua
+    assert lse.next_open(ts('2026-04-02T20:00+01:00')) == ts('2026-04-07T08:00+01:00')
+    us = market_hours.EXCHANGES['US']
+    assert us.next_open(ts('2026-10-17T12:00-04:00')) == ts('2026-10-19T09:30-04:00')
+    assert us.next_open(ts('2026-10-14T12:00-04:00')) == ts('2026-10-14T12:00-04:00') # abierto
+
+def test_fx_closes_only_at_weekends():
+    fx = market_hours.EXCHANGES['FX']
+    assert fx.is_open(ts('2026-10-14T23:00+00:00'))
+    assert not fx.is_open(ts('2026-10-17T12:00+00:00'))
+    assert fx.next_open(ts('2026-10-17T12:00+00:00')) == ts('2026-10-19T00:00+00:00')
+
+def test_exchange_of():
+    assert market_hours.exchange_of('AAPL').code == 'US'
+    assert market_hours.exchange_of('BRK-B').code == 'US'
+    assert market_hours.exchange_of('san.mc').code == 'BME'
+    assert market_hours.exchange_of('SAP.F').code == 'FRA'
+    assert market_hours.exchange_of('^IBEX').code == 'BME'
+    assert market_hours.exchange_of('EURUSD=X').code == 'FX'
+    assert market_hours.exchange_of('BTC-USD') is None
+    assert market_hours.exchange_of('ES=F') is None
+    assert market_hours.exchange_of('RY.TO') is market_hours.UNKNOWN
+
+def test_closed_until_across_a_weekend(monkeypatch):
+    monkeypatch.setattr(market_hours, 'clock', lambda: ts('2026-10-17T12:00+00:00')) # sabado
+    async def get_info(ticker):
+        if ticker == 'ERR.YY':
+            raise ConnectionError('Yahoo Finance is down')
+        return {'RY.TO': {'exchange': 'NMS'}, 'BAD.XX': {'exchange': 'XXX'}}[ticker]
+    monkeypatch.setattr(quotes, 'get_info', get_info)
+    since_friday_close = ts('2026-10-16T21:00+00:00')
+    closed = asyncio.run(market_hours.closed_until({'AAPL': since_friday_close, 'SAN.MC': since_friday_close, 'MSFT': ts('2026-10-16T15:00+00:00'),
+                                                    'BTC-USD': since_friday_close, 'RY.TO': since_friday_close, 'BAD.XX': since_friday_close,
+                                                    'ERR.YY': since_friday_close}))
+    # MSFT no se consulto tras el cierre del viernes, las criptomonedas y los mercados desconocidos siempre se consultan
+    assert closed == {'AAPL': ts('2026-10-19T09:30-04:00'), 'SAN.MC': ts('2026-10-19T09:00+02:00'), 'RY.TO': ts('2026-10-19T09:30-04:00')}
+
+def test_closed_until_across_a_holiday(monkeypatch):
+    monkeypatch.setattr(market_hours, 'clock', lambda: ts('2026-12-25T12:00+01:00'))
+    closed = asyncio.run(market_hours.closed_until({'SAN.MC': ts('2026-12-24T19:00+01:00'), 'SAP.DE': ts('2026-12-23T19:00+01:00')}))
+    assert closed == {'SAN.MC': ts('2026-12-28T09:00+01:00'), 'SAP.DE': ts('2026-12-28T09:00+01:00')}
@@ -0,0 +1,25 @@
+import asyncio
+import pytest
+import metrics
+
+class FakeBot:
+    async def send_message(self, chat_id, text):
+        if text == 'fail':
+            raise ConnectionError('network down')
+        return text
+
+    async def reply_to(self, message, text):
+        return await self.send_message(message, text)
+
+def sends(method):
+    histogram = metrics.registry.histograms.get(metrics._key('telegram_send_seconds', {'method': method}))
+    return histogram.count if histogram else 0
+
+def test_time_sends_counts_replies_once_and_failures_too():
+    bot = FakeBot()
+    metrics.time_sends(bot, methods=('send_message',))
+    antes = sends('send_message')
+    assert asyncio.run(bot.reply_to(1, 'hola')) == 'hola'
+    with pytest.raises(ConnectionError):
+        asyncio.run(bot.send_message(1, 'fail'))
+    assert sends('send_message') == antes+2
@@ -0,0 +1,71 @@
+import asyncio, threading
+import quotes
+
+class Loader:
+    """Blocking loader that counts its calls and can wait for a gate or fail."""
+
+    def __init__(self, error=None):
+        self.calls = []
+        self.gate = threading.Event()
+        self.gate.set()
+        self.error = error
+
+    def __call__(self, tickers):
+        self.calls.append(list(tickers))
+        self.gate.wait(1)
+        if self.error:
+            raise self.error
+        return {ticker: ticker.lower() for ticker in tickers if ticker != 'UNKNOWN'}
+
+def test_concurrent_misses_share_one_load():
+    async def run():
+        cache, loader = quotes.QuoteCache(), Loader()
+        loader.gate.clear()
+        pendientes = [asyncio.ensure_future(cache.get_many('quote', ['AAPL', 'MSFT'], loader)) for _ in range(5)]
+        pendientes.append(asyncio.ensure_future(cache.get_many('quote', ['AAPL', 'UNKNOWN'], loader)))
+        await asyncio.sleep(0.05)
+        loader.gate.set()
+        results = await asyncio.gather(*pendientes)
+        assert results[:5] == [{'AAPL': 'aapl', 'MSFT': 'msft'}]*5
+        # solo el ticker que no estaba en vuelo se pide aparte
+        assert results[5] == {'AAPL': 'aapl'}
+        assert loader.calls == [['AAPL', 'MSFT'], ['UNKNOWN']]
+        assert await cache.get_many('quote', ['MSFT', 'AAPL'], loader) == {'MSFT': 'msft', 'AAPL': 'aapl'}
+        assert len(loader.calls) == 2
+    asyncio.run(run())
+
+def test_entries_expire_after_their_ttl():
+    async def run():
+        cache, loader = quotes.QuoteCache(ttls={'quote': 0.1, 'meta': 60}), Loader()
+        await cache.get_many('quote', ['AAPL'], loader)
+        await cache.get_many('meta', ['AAPL'], loader)
+        await asyncio.sleep(0.15)
+        await cache.get_many('quote', ['AAPL'], loader)
+        await cache.get_many('meta', ['AAPL'], loader)
+        assert loader.calls == [['AAPL'], ['AAPL'], ['AAPL']]
+    asyncio.run(run())
+
+def test_least_recently_used_entries_are_evicted():
+    async def run():
+        cache, loader = quotes.QuoteCache(maxsize=2), Loader()
+        await cache.get_many('quote', ['A', 'B'], loader)
+        await cache.get_many('quote', ['A'], loader) # B pasa a ser la menos usada
+        await cache.get_many('quote', ['C'], loader)
+        await cache.get_many('quote', ['A', 'B'], loader)
+        assert loader.calls == [['A', 'B'], ['C'], ['B']]
+    asyncio.run(run())
+
+def test_a_loader_error_reaches_every_waiter():
+    async def run():
+        cache, loader = quotes.QuoteCache(), Loader(ConnectionError('Yahoo Finance is down'))
+        loader.gate.clear()
+        pendientes = [asyncio.ensure_future(cache.get_many('quote', ['AAPL'], loader)) for _ in range(3)]
+        await asyncio.sleep(0.05)
+        loader.gate.set()
+        results = await asyncio.gather(*pendientes, return_exceptions=True)
+        assert all(isinstance(result, ConnectionError) for result in results)
+        assert len(loader.calls) == 1
+        # el error no se guarda, la siguiente lectura vuelve a intentarlo
+        loader.error = None
+        assert await cache.get_many('quote', ['AAPL'], loader) == {'AAPL': 'aapl'}
+    asyncio.run(run())
@@ -0,0 +1,61 @@
+import asyncio, time
+from scheduler import DeadlineScheduler
+
+def test_keys_come_out_in_due_order():
+    async def run():
+        scheduler = DeadlineScheduler()
+        now = time.time()
+        scheduler.schedule('c', now-1)
+        scheduler.schedule('a', now-3)
+        scheduler.schedule('b', now-2)
+        scheduler.schedule('later', now+60)
+        assert await scheduler.wait_due() == ['a', 'b', 'c']
+        assert len(scheduler) == 1
+    asyncio.run(run())
+
+def test_wait_due_sleeps_until_the_next_deadline():
+    async def run():
+        scheduler = DeadlineScheduler()
+        start = time.time()
+        scheduler.schedule('a', start+0.2)
+        scheduler.schedule('b', start+0.1)
+        assert await scheduler.wait_due() == ['b']
+        assert time.time() >= start+0.1
+        assert await scheduler.wait_due() == ['a']
+        assert time.time() >= start+0.2
+    asyncio.run(run())
+
+def test_reschedule_and_cancel_skip_stale_entries():
+    async def run():
+        scheduler = DeadlineScheduler()
+        now = time.time()
+        scheduler.schedule('a', now-2)
+        scheduler.schedule('b', now-1)
+        scheduler.schedule('c', now-1)
+        scheduler.schedule('a', now+60) # reprogramada, la entrada vieja queda obsoleta
+        scheduler.cancel('c')
+        assert scheduler.due_time('c') is None
+        assert await scheduler.wait_due() == ['b']
+        assert scheduler.due_time('a') == now+60
+    asyncio.run(run())
+
+def test_only_if_earlier():
+    scheduler = DeadlineScheduler()
+    scheduler.schedule('a', 100.0)
+    scheduler.schedule('a', 200.0, only_if_earlier=True)
+    assert scheduler.due_time('a') == 100.0
+    scheduler.schedule('a', 50.0, only_if_earlier=True)
+    assert scheduler.due_time('a') == 50.0
+    scheduler.schedule('b', 300.0, only_if_earlier=True)
+    assert scheduler.due_time('b') == 300.0
+
+def test_an_earlier_key_wakes_a_sleeping_waiter():
+    async def run():
+        scheduler = DeadlineScheduler()
+        scheduler.schedule('later', time.time()+60)
+        waiter = asyncio.ensure_future(scheduler.wait_due())
+        await asyncio.sleep(0.05)
+        assert not waiter.done()
+        scheduler.schedule('now', time.time())
+        assert await asyncio.wait_for(waiter, 1) == ['now']
+    asyncio.run(run())
@@ -0,0 +1,68 @@
+import asyncio, time
+from telebot.asyncio_helper import ApiTelegramException
+import sender
+
+class FakeBot:
+    """Records every send_message call and fails the ones listed in errors."""
+
+    def __init__(self, errors=()):
+        self.sent = []
+        self.errors = list(errors)
+
+    async def send_message(self, chat_id, text):
+        self.sent.append((chat_id, text, time.monotonic()))
+        if self.errors:
+            raise self.errors.pop(0)
+        return text
+
+def telegram_error(code, **parameters):
+    return ApiTelegramException('sendMessage', None, {'error_code': code, 'description': 'error', 'parameters': parameters})
+
+def run(bot, jobs, **kwargs):
+    async def go():
+        outbox = sender.SendQueue(bot, **kwargs)
+        # todo se encola antes de arrancar los emisores, asi el orden de salida solo depende de la prioridad
+        futures = [outbox.send('send_message', priority, chat_id, text=text) for priority, chat_id, text in jobs]
+        outbox.start()
+        results = await asyncio.gather(*futures, return_exceptions=True)
+        await outbox.stop()
+        return results
+    return asyncio.run(go())
+
+def test_a_busy_chat_keeps_its_order_without_blocking_other_chats():
+    bot = FakeBot()
+    run(bot, [(sender.PRIORITY_TRACK, 1, 'a1'), (sender.PRIORITY_TRACK, 1, 'a2'), (sender.PRIORITY_TRACK, 1, 'a3'),
+              (sender.PRIORITY_TRACK, 2, 'b1')], workers=1, chat_rate=10)
+    texts = [text for _, text, _ in bot.sent]
+    assert [text for text in texts if text.startswith('a')] == ['a1', 'a2', 'a3']
+    # b1 sale mientras el chat 1 espera su siguiente hueco
+    assert texts.index('b1') < texts.index('a2')
+    envios = [sent for chat_id, _, sent in bot.sent if chat_id == 1]
+    assert all(b-a >= 0.09 for a, b in zip(envios, envios[1:]))
+
+def test_alerts_go_before_tracks():
+    bot = FakeBot()
+    run(bot, [(sender.PRIORITY_TRACK, 1, 'track'), (sender.PRIORITY_REPLY, 2, 'reply'), (sender.PRIORITY_ALERT, 3, 'alert')],
+        workers=1)
+    assert [text for _, text, _ in bot.sent] == ['alert', 'reply', 'track']
+
+def test_a_429_waits_retry_after():
+    bot = FakeBot([telegram_error(429, retry_after=0.3)])
+    assert run(bot, [(sender.PRIORITY_ALERT, 1, 'hola')], chat_rate=100) == ['hola']
+    assert len(bot.sent) == 2
+    assert bot.sent[1][2]-bot.sent[0][2] >= 0.3
+
+def test_retries_give_up_after_max_retries(monkeypatch):
+    monkeypatch.setattr(sender, 'BACKOFF', 0.01)
+    error = ConnectionError('network down')
+    bot = FakeBot([error]*10)
+    assert run(bot, [(sender.PRIORITY_TRACK, 1, 'hola')], max_retries=2, chat_rate=100) == [error]
+    assert len(bot.sent) == 3
+
+def test_permanent_errors_are_not_retried():
+    error = telegram_error(403)
+    bot = FakeBot([error])
+    assert run(bot, [(sender.PRIORITY_ALERT, 1, 'hola')]) == [error]
+    assert len(bot.sent) == 1
+    assert not sender.is_transient(error)
+    assert sender.is_transient(telegram_error(502)) and sender.is_transient(ConnectionError())
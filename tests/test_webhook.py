@@ -0,0 +1,29 @@
+import asyncio, json
+import pytest
+import webhook
+
+test_utils = pytest.importorskip('aiohttp.test_utils')
+
+UPDATE = json.dumps({'update_id': 1, 'message': {'message_id': 1, 'date': 0, 'chat': {'id': 1, 'type': 'private'},
+                                                 'from': {'id': 1, 'is_bot': False, 'first_name': 'A'}, 'text': '/start'}})
+
+def post(server, headers):
+    async def run():
+        request = test_utils.make_mocked_request('POST', server.path, headers=headers)
+        request.text = lambda: asyncio.sleep(0, UPDATE)
+        return (await server._receive(request)).status
+    return asyncio.run(run())
+
+def test_a_secret_is_required():
+    with pytest.raises(ValueError):
+        webhook.WebhookServer(None, secret=None)
+    with pytest.raises(ValueError):
+        webhook.WebhookServer(None, secret='')
+
+def test_updates_without_the_secret_are_refused():
+    server = webhook.WebhookServer(None, secret='s3cret')
+    assert post(server, {}) == 403
+    assert post(server, {'X-Telegram-Bot-Api-Secret-Token': 'wrong'}) == 403
+    assert server.qsize() == 0
+    assert post(server, {'X-Telegram-Bot-Api-Secret-Token': 's3cret'}) == 200
+    assert server.qsize() == 1
@@ -0,0 +1,107 @@
+import asyncio, hmac, logging, os
+from telebot.types import Update
+import metrics
+
+WEBHOOK_HOST = os.getenv('WEBHOOK_HOST', '0.0.0.0')
+WEBHOOK_PORT = int(os.getenv('WEBHOOK_PORT', 8443))
+WEBHOOK_PATH = os.getenv('WEBHOOK_PATH', '/telegram')
+WEBHOOK_URL = os.getenv('WEBHOOK_URL') # URL publica que se registra en Telegram, sin ella no se registra nada
+WEBHOOK_SECRET = os.getenv('WEBHOOK_SECRET') # obligatoria, Telegram la devuelve en la cabecera X-Telegram-Bot-Api-Secret-Token
+WEBHOOK_WORKERS = int(os.getenv('WEBHOOK_WORKERS', 8)) # actualizaciones atendidas a la vez
+WEBHOOK_QUEUE = int(os.getenv('WEBHOOK_QUEUE', 1000)) # actualizaciones en espera antes de rechazar
+WEBHOOK_REUSE_PORT = os.getenv('WEBHOOK_REUSE_PORT', '0') == '1' # varios procesos escuchan en el mismo puerto y el sistema reparte las conexiones
+
+class WebhookServer:
+    """Receives Telegram updates over HTTP and hands them to the bot handlers.
+
+    Every update is acknowledged as soon as it is queued, and a pool of workers
+    dispatches the queue concurrently. When the queue is full the update is
+    refused with a 503, so Telegram delivers it again later.
+    """
+
+    def __init__(self, bot, host=WEBHOOK_HOST, port=WEBHOOK_PORT, path=WEBHOOK_PATH, url=WEBHOOK_URL,
+                 secret=WEBHOOK_SECRET, workers=WEBHOOK_WORKERS, queue_size=WEBHOOK_QUEUE):
+        """Create the server, call serve() inside the event loop to run it.
+
+        Args:
+            bot: The AsyncTeleBot whose handlers process the updates.
+            host: Address to listen on.
+            port: TCP port to listen on.
+            path: URL path Telegram posts to.
+            url: Public URL registered with set_webhook, None to leave the registration as it is.
+            secret: Secret token Telegram must send back, requests without it are refused.
+            workers: Number of updates processed concurrently.
+            queue_size: Maximum number of updates waiting for a worker.
+
+        Raises:
+            ValueError: If there is no secret.
+        """
+        # sin secreto cualquiera que llegue al puerto podria hacerse pasar por el administrador
+        if not secret:
+            raise ValueError("The webhook needs a secret token, set WEBHOOK_SECRET")
+        self.bot = bot
+        self.host = host
+        self.port = port
+        self.path = path
+        self.url = url
+        self.secret = secret
+        self.workers = workers
+        self._queue = asyncio.Queue(queue_size)
+
+    def qsize(self):
+        """Number of updates waiting for a worker."""
+        return self._queue.qsize()
+
+    async def _receive(self, request):
+        from aiohttp import web
+        if not hmac.compare_digest(request.headers.get('X-Telegram-Bot-Api-Secret-Token', '').encode(), self.secret.encode()):
+            metrics.inc('webhook_updates_total', result='forbidden')
+            return web.Response(status=403)
+        try:
+            update = Update.de_json(await request.text())
+        except (ValueError, KeyError, TypeError) as e:
+            logging.error(f"Invalid update received by the webhook: {e}")
+            metrics.inc('webhook_updates_total', result='invalid')
+            return web.Response(status=400)
+        try:
+            self._queue.put_nowait(update)
+        except asyncio.QueueFull:
+            metrics.inc('webhook_updates_total', result='full')
+            return web.Response(status=503)
+        metrics.inc('webhook_updates_total', result='queued')
+        return web.Response()
+
+    async def _worker(self):
+        while True:
+            update = await self._queue.get()
+            try:
+                await self.bot.process_new_updates([update])
+            except Exception as e:
+                logging.error(f"Error processing update {update.update_id}: {e}")
+            finally:
+                self._queue.task_done()
+
+    async def join(self):
+        """Wait until every queued update has been processed."""
+        await self._queue.join()
+
+    async def serve(self):
+        """Listen for updates until cancelled."""
+        from aiohttp import web
+        app = web.Application()
+        app.router.add_post(self.path, self._receive)
+        runner = web.AppRunner(app, access_log=None)
+        await runner.setup()
+        await web.TCPSite(runner, self.host, self.port, reuse_port=WEBHOOK_REUSE_PORT or None).start()
+        tasks = [asyncio.ensure_future(self._worker()) for _ in range(self.workers)]
+        metrics.gauge('queue_depth', self.qsize, queue='updates')
+        logging.info(f"Listening for updates at http://{self.host}:{self.port}{self.path}")
+        try:
+            if self.url:
+                await self.bot.set_webhook(url=self.url, secret_token=self.secret)
+            await asyncio.Event().wait()
+        finally:
+            for task in tasks:
+                task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+            await runner.cleanup()